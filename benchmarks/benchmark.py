@@ -0,0 +1,521 @@
+"""
+Benchmark the hot paths on procedurally generated scenes, runnable on CPU.
+
+    # run and save the results
+    python benchmarks/benchmark.py --output benchmarks/results.json
+    # store a baseline
+    python benchmarks/benchmark.py --output benchmarks/baseline.json
+    # compare with the baseline, exit with code 1 if any case is slower than the tolerance
+    python benchmarks/benchmark.py --baseline benchmarks/baseline.json --tolerance 0.2
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import traceback
+from datetime import datetime
+from typing import Callable
+
+import torch
+
+from internal.utils.synthetic_scene import random_gaussians, sphere_cameras, write_colmap_dataset, write_blender_dataset
+
+GAUSSIAN_CASES = {}
+DATASET_CASES = {}
+
+
+def gaussian_case(name: str):
+    """
+    Register a case whose size is the number of Gaussians.
+    The case function receives `(n, args)`, and returns a function to be timed, or `(setup, function)`
+    where `setup` is called before every repeat and its return value is passed to `function`.
+    """
+
+    def wrapper(fn):
+        GAUSSIAN_CASES[name] = fn
+        return fn
+
+    return wrapper
+
+
+def dataset_case(name: str):
+    """
+    Register a case running on the generated datasets, the case function receives `(dataset_dirs, args)`
+    """
+
+    def wrapper(fn):
+        DATASET_CASES[name] = fn
+        return fn
+
+    return wrapper
+
+
+class SkipCase(Exception):
+    pass
+
+
+def new_gaussian_model(n: int, args):
+    try:
+        from internal.models.gaussian_model import GaussianModel
+    except ImportError as e:
+        raise SkipCase("GaussianModel is not available: {}".format(e))
+    from internal.configs.optimization import OptimizationParams
+
+    gaussian = random_gaussians(n, sh_degree=args.sh_degree, seed=args.seed)
+    model = GaussianModel(sh_degree=args.sh_degree)
+    model.initialize_by_gaussian_number(n)
+    with torch.no_grad():
+        model._xyz.copy_(gaussian.xyz)
+        model._features_dc.copy_(gaussian.features_dc)
+        model._features_rest.copy_(gaussian.features_rest)
+        model._scaling.copy_(gaussian.scales)
+        model._rotation.copy_(gaussian.rotations)
+        model._opacity.copy_(gaussian.opacities)
+    model = model.to(args.device)
+    model.training_setup(OptimizationParams(), scene_extent=1.)
+    model.active_sh_degree = args.sh_degree
+    return model
+
+
+@gaussian_case("densify_and_prune")
+def densify_and_prune_case(n: int, args):
+    def setup():
+        model = new_gaussian_model(n, args)
+        generator = torch.Generator().manual_seed(args.seed)
+        # about 10% of the Gaussians exceed the threshold
+        model.xyz_gradient_accum = (torch.rand((n, 1), generator=generator) * 0.0022).to(args.device)
+        model.denom = torch.ones((n, 1), device=args.device)
+        return model
+
+    def run(model):
+        model.densify_and_prune(0.0002, 0.005, extent=1., prune_extent=1., max_screen_size=None)
+
+    return setup, run
+
+
+@gaussian_case("prune_points")
+def prune_points_case(n: int, args):
+    def setup():
+        model = new_gaussian_model(n, args)
+        mask = torch.rand((n,), generator=torch.Generator().manual_seed(args.seed)) < 0.1
+        return model, mask.to(args.device)
+
+    def run(inputs):
+        model, mask = inputs
+        model.prune_points(mask)
+
+    return setup, run
+
+
+def project(xyz, scales, rotations, camera):
+    from internal.utils.gaussian_projection import project_gaussians
+
+    with torch.no_grad():
+        return project_gaussians(
+            means_3d=xyz,
+            scales=scales,
+            scale_modifier=1.,
+            quaternions=rotations,
+            world_to_camera=camera.world_to_camera,
+            fx=camera.fx,
+            fy=camera.fy,
+            cx=camera.cx,
+            cy=camera.cy,
+            img_height=camera.height,
+            img_width=camera.width,
+            block_width=16,
+        )
+
+
+def new_projection_inputs(n: int, args, radius: float = 1.):
+    gaussian = random_gaussians(n, sh_degree=0, radius=radius, seed=args.seed)
+    camera = sphere_cameras(1, width=args.image_width, height=args.image_height)[0].to_device(args.device)
+    xyz = gaussian.xyz.to(args.device)
+    scales = torch.exp(gaussian.scales).to(args.device)
+    rotations = gaussian.rotations.to(args.device)
+    return xyz, scales, rotations, camera
+
+
+@gaussian_case("projection")
+def projection_case(n: int, args):
+    xyz, scales, rotations, camera = new_projection_inputs(n, args)
+
+    def run():
+        project(xyz, scales, rotations, camera)
+
+    return run
+
+
+# a scene much larger than the view frustum, the camera only sees a part of the Gaussians
+
+@gaussian_case("projection_large_scene")
+def projection_large_scene_case(n: int, args):
+    xyz, scales, rotations, camera = new_projection_inputs(n, args, radius=16.)
+
+    def run():
+        project(xyz, scales, rotations, camera)
+
+    return run
+
+
+@gaussian_case("projection_large_scene_visible_subset")
+def projection_large_scene_visible_subset_case(n: int, args):
+    """
+    Only project the Gaussians visible to the camera, like the training step does with the visibility cache
+    """
+
+    xyz, scales, rotations, camera = new_projection_inputs(n, args, radius=16.)
+    radii = project(xyz, scales, rotations, camera)[2]
+    visible_indices = torch.nonzero(radii > 0).squeeze(-1)
+
+    def run():
+        project(xyz[visible_indices], scales[visible_indices], rotations[visible_indices], camera)
+
+    return run
+
+
+@gaussian_case("eval_sh")
+def eval_sh_case(n: int, args):
+    from internal.utils.sh_utils import eval_sh
+
+    gaussian = random_gaussians(n, sh_degree=args.sh_degree, seed=args.seed)
+    features = torch.cat([gaussian.features_dc, gaussian.features_rest], dim=1).transpose(1, 2).to(args.device)
+    camera_center = torch.tensor([4., 0., 0.], device=args.device)
+    xyz = gaussian.xyz.to(args.device)
+
+    def run():
+        with torch.no_grad():
+            directions = torch.nn.functional.normalize(xyz - camera_center, dim=-1)
+            eval_sh(args.sh_degree, features, directions)
+
+    return run
+
+
+@gaussian_case("ply_save")
+def ply_save_case(n: int, args):
+    gaussian = random_gaussians(n, sh_degree=args.sh_degree, seed=args.seed).to_ply_format()
+    path = os.path.join(args.workspace, "ply_save", "point_cloud.ply")
+
+    def run():
+        gaussian.save_to_ply(path)
+
+    return run
+
+
+@gaussian_case("ply_load")
+def ply_load_case(n: int, args):
+    from internal.utils.gaussian_utils import Gaussian
+
+    path = os.path.join(args.workspace, "ply_load", "point_cloud.ply")
+    random_gaussians(n, sh_degree=args.sh_degree, seed=args.seed).to_ply_format().save_to_ply(path)
+
+    def run():
+        Gaussian.load_from_ply(path, args.sh_degree).to_parameter_structure()
+
+    return run
+
+
+def gaussian_to_state_dict(gaussian) -> dict:
+    return {
+        "gaussian_model._xyz": gaussian.xyz,
+        "gaussian_model._features_dc": gaussian.features_dc,
+        "gaussian_model._features_rest": gaussian.features_rest,
+        "gaussian_model._scaling": gaussian.scales,
+        "gaussian_model._rotation": gaussian.rotations,
+        "gaussian_model._opacity": gaussian.opacities,
+        "gaussian_model._features_extra": gaussian.real_features_extra,
+    }
+
+
+@gaussian_case("checkpoint_save")
+def checkpoint_save_case(n: int, args):
+    state_dict = gaussian_to_state_dict(random_gaussians(n, sh_degree=args.sh_degree, seed=args.seed))
+    path = os.path.join(args.workspace, "checkpoint_save.ckpt")
+
+    def run():
+        torch.save({"state_dict": state_dict}, path)
+
+    return run
+
+
+@gaussian_case("checkpoint_load")
+def checkpoint_load_case(n: int, args):
+    from internal.utils.gaussian_utils import Gaussian
+
+    path = os.path.join(args.workspace, "checkpoint_load.ckpt")
+    torch.save({"state_dict": gaussian_to_state_dict(random_gaussians(n, sh_degree=args.sh_degree, seed=args.seed))}, path)
+
+    def run():
+        Gaussian.load_from_state_dict(args.sh_degree, torch.load(path, map_location="cpu")["state_dict"])
+
+    return run
+
+
+@gaussian_case("light_gaussian_prune_mask")
+def light_gaussian_prune_mask_case(n: int, args):
+    """
+    Only the volume-weighted importance score and the prune mask are timed,
+    the hit count part runs one rasterization per camera
+    """
+
+    try:
+        from internal.utils.light_gaussian import calculate_v_imp_score, get_prune_mask
+    except ImportError as e:
+        raise SkipCase("LightGaussian utils are not available: {}".format(e))
+
+    gaussian = random_gaussians(n, sh_degree=0, seed=args.seed)
+    scales = torch.exp(gaussian.scales).to(args.device)
+    score = torch.rand((n,), generator=torch.Generator().manual_seed(args.seed)).to(args.device)
+
+    def run():
+        v_list = calculate_v_imp_score(scales, score, 0.1)
+        get_prune_mask(0.66, v_list)
+
+    return run
+
+
+def hexplane_features_case(n: int, args, fused: bool):
+    from internal.model_components.gs4d_hexplane import HexPlaneField
+
+    # the default config of the 4DGaussians
+    field = HexPlaneField(1.6, {
+        "grid_dimensions": 2,
+        "input_coordinate_dim": 4,
+        "output_coordinate_dim": 32,
+        "resolution": [64, 64, 64, 25],
+    }, [1, 2], fused=fused).to(args.device)
+    generator = torch.Generator().manual_seed(args.seed)
+    xyz = (torch.rand((n, 3), generator=generator) * 3.2 - 1.6).to(args.device)
+    timestamps = torch.full((n, 1), 0.5, device=args.device)
+
+    def run():
+        field(xyz, timestamps)
+
+    return run
+
+
+@gaussian_case("hexplane_features")
+def hexplane_features_looped_case(n: int, args):
+    return hexplane_features_case(n, args, fused=False)
+
+
+@gaussian_case("hexplane_features_fused")
+def hexplane_features_fused_case(n: int, args):
+    return hexplane_features_case(n, args, fused=True)
+
+
+@dataset_case("colmap_parse")
+def colmap_parse_case(dataset_dirs: dict, args):
+    from internal.configs.dataset import ColmapParams
+    from internal.dataparsers.colmap_dataparser import ColmapDataParser
+
+    def run():
+        ColmapDataParser(dataset_dirs["colmap"], os.path.join(args.workspace, "colmap_output"), 0, ColmapParams()).get_outputs()
+
+    return run
+
+
+@dataset_case("blender_parse")
+def blender_parse_case(dataset_dirs: dict, args):
+    from internal.configs.dataset import BlenderParams
+    from internal.dataparsers.blender_dataparser import BlenderDataParser
+
+    def run():
+        BlenderDataParser(dataset_dirs["blender"], os.path.join(args.workspace, "blender_output"), 0, BlenderParams()).get_outputs()
+
+    return run
+
+
+@dataset_case("image_loading")
+def image_loading_case(dataset_dirs: dict, args):
+    from internal.configs.dataset import ColmapParams
+    from internal.dataparsers.colmap_dataparser import ColmapDataParser
+    from internal.dataset import Dataset
+
+    train_set = ColmapDataParser(dataset_dirs["colmap"], os.path.join(args.workspace, "colmap_output"), 0, ColmapParams()).get_outputs().train_set
+    dataset = Dataset(train_set)
+
+    def run():
+        for i in range(len(dataset)):
+            dataset.get_image(i)
+
+    return run
+
+
+def time_case(case: Callable, args) -> dict:
+    """
+    :return: the timing statistics in seconds
+    """
+
+    prepared = case()
+    setup = None
+    if isinstance(prepared, tuple):
+        setup, fn = prepared
+    else:
+        fn = prepared
+
+    def synchronize():
+        if torch.device(args.device).type == "cuda":
+            torch.cuda.synchronize()
+
+    times = []
+    for i in range(args.warmup + args.repeat):
+        inputs = setup() if setup is not None else None
+        gc.collect()
+        synchronize()
+        started_at = time.perf_counter()
+        if setup is not None:
+            fn(inputs)
+        else:
+            fn()
+        synchronize()
+        if i >= args.warmup:
+            times.append(time.perf_counter() - started_at)
+        del inputs
+
+    times = sorted(times)
+    return {
+        "median": times[len(times) // 2],
+        "min": times[0],
+        "max": times[-1],
+        "mean": sum(times) / len(times),
+        "repeat": len(times),
+    }
+
+
+def run_benchmarks(args) -> dict:
+    results = {}
+
+    def run(name: str, case: Callable):
+        if args.cases is not None and name.split("[")[0] not in args.cases:
+            return
+        print("running {}".format(name), flush=True)
+        try:
+            results[name] = time_case(case, args)
+            print("  median={:.6f}s".format(results[name]["median"]))
+        except SkipCase as e:
+            results[name] = {"skipped": str(e)}
+            print("  skipped: {}".format(e))
+        except Exception as e:
+            traceback.print_exc()
+            results[name] = {"error": repr(e)}
+
+    for case_name, case_fn in GAUSSIAN_CASES.items():
+        for n in args.sizes:
+            run("{}[n={}]".format(case_name, n), lambda: case_fn(n, args))
+
+    if args.no_dataset is False:
+        dataset_dirs = {
+            "colmap": os.path.join(args.workspace, "colmap"),
+            "blender": os.path.join(args.workspace, "blender"),
+        }
+        print("generating datasets", flush=True)
+        write_colmap_dataset(dataset_dirs["colmap"], args.n_images, args.n_points, width=args.image_width, height=args.image_height, seed=args.seed)
+        write_blender_dataset(dataset_dirs["blender"], args.n_images, seed=args.seed)
+        for case_name, case_fn in DATASET_CASES.items():
+            run("{}[images={},points={}]".format(case_name, args.n_images, args.n_points), lambda: case_fn(dataset_dirs, args))
+
+    return results
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: the names of the regressed cases
+    """
+
+    regressions = []
+    print("{:<56} {:>12} {:>12} {:>8}".format("case", "baseline(s)", "current(s)", "ratio"))
+    for name, current in results.items():
+        base = baseline.get(name, None)
+        if base is None or "median" not in base or "median" not in current:
+            continue
+        ratio = current["median"] / max(base["median"], 1e-12)
+        flag = ""
+        if ratio > 1. + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<56} {:>12.6f} {:>12.6f} {:>8.3f}{}".format(name, base["median"], current["median"], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="the numbers of Gaussians, e.g. 10000 100000 1000000 10000000")
+    parser.add_argument("--cases", type=str, nargs="+", default=None,
+                        help="only run these cases, default: all")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--n_images", type=int, default=32)
+    parser.add_argument("--n_points", type=int, default=100_000,
+                        help="the number of the COLMAP sparse points")
+    parser.add_argument("--image_width", type=int, default=800)
+    parser.add_argument("--image_height", type=int, default=600)
+    parser.add_argument("--no_dataset", action="store_true", default=False,
+                        help="skip the dataset parsing and image loading cases")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workspace", type=str, default=None,
+                        help="where the generated files stored, default: a temporary directory")
+    parser.add_argument("--output", "-o", type=str, default=None,
+                        help="the path of the result json file")
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="the allowed slowdown ratio of the median time compared to the baseline")
+    args = parser.parse_args()
+
+    is_temporary_workspace = args.workspace is None
+    if is_temporary_workspace is True:
+        args.workspace = tempfile.mkdtemp(prefix="gs_benchmark_")
+    os.makedirs(args.workspace, exist_ok=True)
+
+    torch.manual_seed(args.seed)
+    torch.set_grad_enabled(False)
+
+    try:
+        results = run_benchmarks(args)
+    finally:
+        if is_temporary_workspace is True:
+            shutil.rmtree(args.workspace, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "time": datetime.now().isoformat(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": args.device,
+            "num_threads": torch.get_num_threads(),
+            "args": {i: getattr(args, i) for i in vars(args) if i not in ["workspace", "output", "baseline"]},
+        },
+        "results": results,
+    }
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=4)
+        print("results saved to {}".format(args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline["results"], args.tolerance)
+        if len(regressions) > 0:
+            print("{} regression(s) found".format(len(regressions)))
+            sys.exit(1)
+        print("no regression")
+
+
+if __name__ == "__main__":
+    main()
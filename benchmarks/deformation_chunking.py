@@ -0,0 +1,151 @@
+"""
+Compare the training throughput and the peak memory of the deformation network queried at once, in chunks,
+and in chunks with gradient checkpointing, versus the number of Gaussians, runnable on CPU.
+
+Every case runs in a new process, the peak memory is the increase of the peak RSS on CPU (Linux only), or of the allocated CUDA memory.
+
+    python benchmarks/deformation_chunking.py --n 10000,50000,100000 --chunk 16384
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+import argparse
+import resource
+import multiprocessing
+
+import torch
+
+from internal.models.deform_model import DeformModel
+from internal.utils.network_factory import NetworkFactory
+
+MODES = {
+    "full": dict(chunk=False, gradient_checkpointing=False),
+    "chunked": dict(chunk=True, gradient_checkpointing=False),
+    "checkpointing": dict(chunk=True, gradient_checkpointing=True),
+}
+
+
+def get_rss() -> int:
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def reset_peak_rss():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def get_peak_rss() -> int:
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                # kilobytes
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("VmHWM not found")
+
+
+def run(mode: str, n: int, args, queue):
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+    deform_model = DeformModel(
+        NetworkFactory(tcnn=False),
+        D=args.n_layers,
+        W=args.n_neurons,
+        chunk=args.chunk if MODES[mode]["chunk"] is True else -1,
+        memory_budget=args.memory_budget,
+        gradient_checkpointing=MODES[mode]["gradient_checkpointing"],
+    ).to(device)
+    optimizer = torch.optim.Adam(deform_model.parameters(), lr=1e-4)
+    xyz = torch.randn((n, 3), device=device)
+
+    def step(t: float):
+        d_xyz, d_rotation, d_scaling = deform_model(xyz, torch.full((n, 1), t, device=device))
+        loss = d_xyz.abs().mean() + d_rotation.abs().mean() + d_scaling.abs().mean()
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+    # the freed memory may be kept by the allocators, so the peak is measured from the first step
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        memory_before = torch.cuda.memory_allocated(device)
+    else:
+        memory_before = get_rss()
+        reset_peak_rss()
+
+    # warm up, allocate the optimizer states
+    step(0.)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+    started_at = time.perf_counter()
+    for i in range(args.steps):
+        step(i / args.steps)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elapsed = time.perf_counter() - started_at
+
+    if device.type == "cuda":
+        peak_memory = torch.cuda.max_memory_allocated(device) - memory_before
+    else:
+        peak_memory = get_peak_rss() - memory_before
+
+    queue.put({
+        "steps_per_second": args.steps / elapsed,
+        "peak_memory_mb": max(peak_memory, 0) / 1024 / 1024,
+        "chunk_size": min(deform_model.get_chunk_size(n, device), n),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=str, default="10000,50000,100000",
+                        help="the numbers of Gaussians, separated by commas")
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--chunk", type=int, default=16384,
+                        help="0: sized by `--memory_budget`")
+    parser.add_argument("--memory_budget", type=float, default=-1,
+                        help="in MB, used when `--chunk 0`")
+    parser.add_argument("--n_layers", type=int, default=8)
+    parser.add_argument("--n_neurons", type=int, default=256)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", "-o", type=str, default=None,
+                        help="the path of the result json file")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    print("{:>10} {:<14} {:>10} {:>12} {:>16}".format("n", "mode", "chunk", "steps/s", "peak memory(MB)"))
+    for n in [int(i) for i in args.n.split(",")]:
+        results[n] = {}
+        for mode in MODES:
+            queue = context.Queue()
+            process = context.Process(target=run, args=(mode, n, args, queue))
+            process.start()
+            process.join()
+            assert process.exitcode == 0, "case '{}' with {} Gaussians failed".format(mode, n)
+            result = queue.get()
+            results[n][mode] = result
+            print("{:>10} {:<14} {:>10} {:>12.2f} {:>16.1f}".format(
+                n,
+                mode,
+                result["chunk_size"],
+                result["steps_per_second"],
+                result["peak_memory_mb"],
+            ), flush=True)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=4)
+        print("results saved to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Compare the memory and the quality of storing `features_rest` and `features_extra` in float32, bfloat16 and float16, runnable on CPU.
+
+The view dependent colors of random Gaussians are fitted by optimizing `features_rest`, with `features_dc` fixed,
+then evaluated on unseen view directions.
+The resident memory is measured in bytes per Gaussian, including the gradients and the Adam moments.
+The peak memory of the optimizer step is the increase over the resident one during the last step,
+of the peak RSS on CPU (Linux with glibc only), or of the allocated CUDA memory. Every dtype runs in a new process.
+
+    python benchmarks/mixed_precision.py --n 100000 --steps 3000
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import argparse
+import ctypes
+import resource
+import multiprocessing
+
+import torch
+
+from internal.utils.sh_utils import eval_sh
+from internal.utils.sparse_adam import MixedPrecisionAdam
+from internal.utils.synthetic_scene import random_gaussians
+from internal.configs.optimization import OptimizationParams
+
+
+def random_directions(n: int, generator: torch.Generator, device) -> torch.Tensor:
+    return torch.nn.functional.normalize(torch.randn((n, 3), generator=generator), dim=-1).to(device)
+
+
+def get_colors(sh_degree: int, features_dc: torch.Tensor, features_rest: torch.Tensor, directions: torch.Tensor) -> torch.Tensor:
+    features = torch.cat([features_dc, features_rest.to(features_dc.dtype)], dim=1).transpose(1, 2)
+    return torch.clamp_min(eval_sh(sh_degree, features, directions) + 0.5, 0.)
+
+
+def get_state_bytes(param: torch.Tensor, optimizer: torch.optim.Optimizer) -> int:
+    """
+    The parameter, its gradient and the Adam moments
+    """
+
+    n_bytes = 2 * param.numel() * param.element_size()
+    for key in ["exp_avg", "exp_avg_sq"]:
+        state = optimizer.state[param][key]
+        n_bytes += state.numel() * state.element_size()
+    return n_bytes
+
+
+def get_rss() -> int:
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def reset_peak_rss():
+    # return the freed memory to the system, otherwise the allocations of the step may reuse it without increasing the RSS
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def get_peak_rss() -> int:
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                # kilobytes
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("VmHWM not found")
+
+
+def run(dtype_name: str, args, queue):
+    device = torch.device(args.device)
+    dtype = getattr(torch, dtype_name)
+    optimization = OptimizationParams()
+
+    target = random_gaussians(args.n, sh_degree=args.sh_degree, extra_feature_dims=args.extra_feature_dims, seed=args.seed)
+    features_dc = target.features_dc.to(device)
+    target_features_rest = target.features_rest.to(device)
+    target_features_extra = target.real_features_extra.to(device)
+
+    features_rest = torch.nn.Parameter(torch.zeros_like(target_features_rest, dtype=dtype))
+    features_extra = torch.nn.Parameter(torch.zeros_like(target_features_extra, dtype=dtype))
+    # the same as `GaussianModel.training_setup()` without `sparse_adam`
+    param_groups = [
+        {"params": [features_rest], "lr": optimization.feature_rest_lr_init if args.lr <= 0 else args.lr, "name": "f_rest"},
+        {"params": [features_extra], "lr": optimization.feature_extra_lr_init, "name": "f_extra"},
+    ]
+    if dtype == torch.float:
+        optimizer = torch.optim.Adam(param_groups, lr=0., eps=1e-15)
+    else:
+        optimizer = MixedPrecisionAdam(param_groups, lr=0., eps=1e-15, chunk_size=args.chunk_size)
+
+    generator = torch.Generator().manual_seed(args.seed)
+    peak_step_memory = 0
+    for step in range(args.steps):
+        directions = random_directions(args.n, generator, device)
+        with torch.no_grad():
+            target_colors = get_colors(args.sh_degree, features_dc, target_features_rest, directions)
+        loss = torch.nn.functional.l1_loss(get_colors(args.sh_degree, features_dc, features_rest, directions), target_colors)
+        loss = loss + torch.nn.functional.l1_loss(features_extra.to(torch.float), target_features_extra)
+        loss.backward()
+        del loss, directions, target_colors
+
+        is_last_step = step == args.steps - 1
+        if is_last_step is True:
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+                torch.cuda.reset_peak_memory_stats(device)
+                memory_before = torch.cuda.memory_allocated(device)
+            else:
+                reset_peak_rss()
+                memory_before = get_rss()
+        optimizer.step()
+        if is_last_step is True:
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+                peak_step_memory = torch.cuda.max_memory_allocated(device) - memory_before
+            else:
+                peak_step_memory = get_peak_rss() - memory_before
+        optimizer.zero_grad(set_to_none=False)
+
+    with torch.no_grad():
+        psnr_list = []
+        for _ in range(8):
+            directions = random_directions(args.n, generator, device)
+            mse = torch.nn.functional.mse_loss(
+                get_colors(args.sh_degree, features_dc, features_rest, directions),
+                get_colors(args.sh_degree, features_dc, target_features_rest, directions),
+            )
+            psnr_list.append((-10. * torch.log10(mse)).item())
+        features_extra_error = (features_extra.to(torch.float) - target_features_extra).abs().mean().item() if args.extra_feature_dims > 0 else 0.
+
+    n_bytes = get_state_bytes(features_rest, optimizer) + get_state_bytes(features_extra, optimizer)
+    queue.put({
+        "bytes_per_gaussian": n_bytes / args.n,
+        "peak_step_memory_mb": max(peak_step_memory, 0) / 1024 / 1024,
+        "color_psnr": sum(psnr_list) / len(psnr_list),
+        "features_extra_l1": features_extra_error,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100_000,
+                        help="the number of Gaussians")
+    parser.add_argument("--steps", type=int, default=3000)
+    parser.add_argument("--lr", type=float, default=-1,
+                        help="the learning rate of the features_rest, default: the one used in training")
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--extra_feature_dims", type=int, default=0)
+    parser.add_argument("--chunk_size", type=int, default=1 << 18,
+                        help="the max number of elements updated at once of the low precision parameters")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", "-o", type=str, default=None,
+                        help="the path of the result json file")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for dtype_name in ["float32", "bfloat16", "float16"]:
+        print("running {}".format(dtype_name), flush=True)
+        queue = context.Queue()
+        process = context.Process(target=run, args=(dtype_name, args, queue))
+        process.start()
+        process.join()
+        assert process.exitcode == 0, "case '{}' failed".format(dtype_name)
+        results[dtype_name] = queue.get()
+
+    # the parameters always stored in float32: xyz, features_dc, scaling, rotation and opacity
+    other_bytes = 4 * 4 * (3 + 3 + 3 + 4 + 1)
+    baseline = results["float32"]["bytes_per_gaussian"]
+    print("{:<10} {:>16} {:>16} {:>12} {:>20} {:>18}".format("dtype", "features(B/G)", "total(B/G)", "saving", "step peak(MB)", "color PSNR(dB)"))
+    for dtype_name, result in results.items():
+        total = result["bytes_per_gaussian"] + other_bytes
+        result["saving"] = 1. - total / (baseline + other_bytes)
+        print("{:<10} {:>16.1f} {:>16.1f} {:>11.1f}% {:>20.1f} {:>18.2f}".format(
+            dtype_name,
+            result["bytes_per_gaussian"],
+            total,
+            100 * result["saving"],
+            result["peak_step_memory_mb"],
+            result["color_psnr"],
+        ))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=4)
+        print("results saved to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from typing import Optional, Union
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 
 import torch
 from torch import Tensor
@@ -41,6 +41,46 @@ class Camera:
 
         return self
 
+    def _replace_intrinsics(self, fx, fy, cx, cy, width: int, height: int):
+        fov_x = 2 * torch.atan((width / 2) / fx)
+        fov_y = 2 * torch.atan((height / 2) / fy)
+
+        # the principal point may not be at the center of the image, it is encoded into the projection matrix
+        projection = self.projection.clone()
+        projection[0, 0] = 1. / torch.tan(fov_x / 2)
+        projection[1, 1] = 1. / torch.tan(fov_y / 2)
+        projection[2, 0] = 2. * cx / width - 1.  # transposed
+        projection[2, 1] = 2. * cy / height - 1.
+
+        return replace(
+            self,
+            fx=fx,
+            fy=fy,
+            fov_x=fov_x,
+            fov_y=fov_y,
+            cx=cx,
+            cy=cy,
+            width=torch.tensor(width, dtype=self.width.dtype, device=self.width.device),
+            height=torch.tensor(height, dtype=self.height.dtype, device=self.height.device),
+            projection=projection,
+            full_projection=self.world_to_camera @ projection,
+        )
+
+    def crop(self, x: int, y: int, width: int, height: int):
+        """
+        :return: a new camera that renders the region [y:y+height, x:x+width] of this one
+        """
+
+        return self._replace_intrinsics(self.fx, self.fy, self.cx - x, self.cy - y, width, height)
+
+    def resize(self, width: int, height: int):
+        """
+        :return: a new camera that renders the same view in another resolution
+        """
+
+        scale_x = width / int(self.width)
+        scale_y = height / int(self.height)
+        return self._replace_intrinsics(self.fx * scale_x, self.fy * scale_y, self.cx * scale_x, self.cy * scale_y, width, height)
 
 @dataclass
 class Cameras:
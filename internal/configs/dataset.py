@@ -1,5 +1,5 @@
 from typing import Optional, Literal
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -99,6 +99,30 @@ class PhotoTourismParams(ColmapParams):
     pass
 
 
+@dataclass
+class ImportanceSamplingParams:
+    """
+        Args:
+            temperature: the sampling probabilities are proportional to `loss ^ (1 / temperature)`
+
+            uniform_ratio: mix with the uniform distribution, so the well-fitted images are still visited
+
+            smoothing: the weight of the previous loss in the running average of each image
+
+            refresh_every_n_epochs: how often the sampling probabilities are recomputed from the loss table, at least 1
+    """
+
+    enabled: bool = False
+
+    temperature: float = 1.
+
+    uniform_ratio: float = 0.1
+
+    smoothing: float = 0.5
+
+    refresh_every_n_epochs: int = 1
+
+
 @dataclass
 class DatasetParams:
     """
@@ -135,3 +159,5 @@ class DatasetParams:
     background_sphere_distance: float = 2.2
 
     background_sphere_points: int = 204_800
+
+    importance_sampling: ImportanceSamplingParams = field(default_factory=ImportanceSamplingParams)
@@ -9,3 +9,5 @@ class LightGaussian:
     prune_percent: float = 0.66
     prune_type: Literal["v_important_score"] = "v_important_score"
     v_pow: float = 0.1
+    camera_chunk_size: int = 64  # the number of the cameras moved to the device at once when scoring
+    camera_subsample_ratio: float = 1.  # score with a random subset of the training cameras
@@ -8,3 +8,4 @@ class ModelParams:
     optimization: OptimizationParams
     sh_degree: int = 3
     extra_feature_dims: int = 0
+    lazy_sh_bands: bool = False  # allocate the SH coefficients of a band when it is activated, instead of all of them at the beginning
@@ -28,4 +28,13 @@ class OptimizationParams:
 
     spatial_lr_scale: float = -1  # auto calculate from camera poses if > 0
 
+    # the hard limits of the densification, the candidates with larger accumulated gradients are preferred, no limit if <= 0
+    max_gaussians: int = -1
+    max_gaussian_memory: float = -1  # in GiB, the parameters, their gradients and Adam states
+
+    sparse_adam: bool = False  # only update the Gaussians inside the visibility filter
+
+    # the storage dtype of the `features_rest` and `features_extra`, and their Adam moments, the others are always float32
+    features_rest_dtype: Literal["float32", "bfloat16", "float16"] = "float32"
+
     rgb_diff_loss: Literal["l1", "l2"] = "l1"
@@ -0,0 +1,11 @@
+from typing import Tuple, Literal
+from dataclasses import dataclass
+
+
+@dataclass
+class PatchTraining:
+    enabled: bool = False
+    patch_size: Tuple[int, int] = (1024, 1024)  # width, height, clamped to the image size
+    # random: uniform patch position
+    # grid: a random cell of the patches tiling the image, the border regions are sampled as often as the others
+    sampling: Literal["random", "grid"] = "random"
@@ -0,0 +1,10 @@
+from typing import List
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ResolutionSchedule:
+    enabled: bool = False
+    # train at 1/factors[i] resolution until reaching the step milestones[i], then at the full resolution
+    factors: List[int] = field(default_factory=lambda: [8, 4, 2])
+    milestones: List[int] = field(default_factory=lambda: [1000, 2000, 4000])
@@ -0,0 +1,10 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class StepProfiler:
+    enabled: bool = False
+    log_every_n_steps: int = 100
+    cuda_event: bool = True  # time the regions with CUDA events, fallback to CPU timer if disabled or not available
+    memory: bool = True  # record the peak allocated memory of each region, CUDA only
+    trace: bool = True  # append the aggregated results to `OUTPUT_PATH/step_profile.jsonl`
@@ -0,0 +1,9 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class VisibilityCache:
+    enabled: bool = False
+    # render all the Gaussians for a camera again when its cached visible set is older than this number of steps
+    refresh_interval: int = 500
+    offload: bool = False  # store the visible sets in the host memory
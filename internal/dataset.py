@@ -24,6 +24,7 @@ from internal.dataparsers.nerfies_dataparser import NerfiesDataparser
 from internal.dataparsers.matrix_city_dataparser import MatrixCityDataParser
 from internal.dataparsers.phototourism_dataparser import PhotoTourismDataParser
 from internal.utils.graphics_utils import store_ply, BasicPointCloud
+from internal.utils.resolution_schedule import build_image_pyramid
 
 from tqdm import tqdm
 
@@ -33,16 +34,22 @@ class Dataset(torch.utils.data.Dataset):
             self,
             image_set: ImageSet,
             undistort_image: bool = True,
+            pyramid_factors: list[int] = None,
     ) -> None:
+        """
+        :param pyramid_factors: if provided, the downsampled images and masks are appended to the image info
+        """
+
         super().__init__()
         self.image_set = image_set
         self.undistort_image = undistort_image
+        self.pyramid_factors = pyramid_factors
         self.image_cameras: list[Camera] = [i for i in image_set.cameras]  # store undistorted camera
 
     def __len__(self):
         return len(self.image_set)
 
-    def get_image(self, index) -> Tuple[str, torch.Tensor, Optional[torch.Tensor]]:
+    def get_image(self, index) -> Tuple:
         # TODO: resize
 
         pil_image = Image.open(self.image_set.image_paths[index])
@@ -107,17 +114,96 @@ class Dataset(torch.utils.data.Dataset):
             # the shape of the mask must match to the image
             assert mask.shape[:2] == image.shape[:2], \
                 "the shape of mask {} doesn't match to the image {}".format(mask.shape[:2], image.shape[:2])
-            mask = (mask == 0).unsqueeze(-1).expand(*image.shape)  # True is the masked pixels
-            mask = mask.permute(2, 0, 1)  # [channel, height, width]
+            # single channel, broadcastable to the image, used as the per-pixel loss weights
+            mask = (mask != 0).unsqueeze(0)  # [1, height, width], False is the masked pixels
 
         image = image.permute(2, 0, 1)  # [channel, height, width]
 
+        if self.pyramid_factors is not None:
+            # built once here, so they are cached together with the full resolution one
+            return self.image_set.image_names[index], image, mask, build_image_pyramid(image, mask, self.pyramid_factors)
+
         return self.image_set.image_names[index], image, mask
 
     def __getitem__(self, index) -> Tuple[Camera, Tuple]:
         return self.image_cameras[index], self.get_image(index)
 
 
+class ImportanceSampler:
+    """
+    Sample the images proportionally to their running losses, instead of the uniform shuffle.
+
+    The losses are reported by the training step, and kept on their device to avoid synchronization.
+    The probabilities are recomputed from the loss table every `refresh_every_n_epochs` epochs,
+    the images not reported yet are treated as having the highest loss.
+    """
+
+    def __init__(
+            self,
+            image_names: list[str],
+            temperature: float = 1.,
+            uniform_ratio: float = 0.1,
+            smoothing: float = 0.5,
+            refresh_every_n_epochs: int = 1,
+    ):
+        assert refresh_every_n_epochs >= 1, "`refresh_every_n_epochs` must be at least 1, got {}".format(refresh_every_n_epochs)
+
+        self.image_name_to_position = {name: idx for idx, name in enumerate(image_names)}
+        self.temperature = temperature
+        self.uniform_ratio = uniform_ratio
+        self.smoothing = smoothing
+        self.refresh_every_n_epochs = refresh_every_n_epochs
+
+        self.losses = None  # created on the device of the first reported loss
+        self.reported = None
+        self.probabilities = torch.ones((len(image_names),), dtype=torch.float64) / max(len(image_names), 1)
+        self.n_epochs = 0
+
+    def update(self, image_name: str, loss: torch.Tensor):
+        position = self.image_name_to_position.get(image_name, None)
+        if position is None:
+            return
+
+        loss = loss.detach().to(torch.float64)
+        if self.losses is None:
+            self.losses = torch.zeros((len(self.image_name_to_position),), dtype=torch.float64, device=loss.device)
+            self.reported = torch.zeros((len(self.image_name_to_position),), dtype=torch.bool, device=loss.device)
+        previous = self.losses[position]
+        self.losses[position] = torch.where(
+            self.reported[position],
+            self.smoothing * previous + (1. - self.smoothing) * loss,
+            loss,
+        )
+        self.reported[position] = True
+
+    def refresh(self):
+        n = self.probabilities.shape[0]
+        if self.losses is None or n == 0:
+            return
+
+        losses = self.losses.cpu()
+        reported = self.reported.cpu()
+        if not torch.any(reported):
+            return
+        losses = torch.where(reported, losses, losses[reported].max()).clamp_min(1e-12)
+
+        weights = losses.log() / self.temperature
+        probabilities = torch.softmax(weights - weights.max(), dim=0)
+        self.probabilities = (1. - self.uniform_ratio) * probabilities + self.uniform_ratio / n
+
+    def sample(self, generator: torch.Generator) -> list[int]:
+        """
+        :return: the positions of the images to be used in an epoch, sampled with replacement
+        """
+
+        if self.n_epochs % self.refresh_every_n_epochs == 0:
+            self.refresh()
+        self.n_epochs += 1
+
+        n = self.probabilities.shape[0]
+        return torch.multinomial(self.probabilities, n, replacement=True, generator=generator).tolist()
+
+
 class CacheDataLoader(torch.utils.data.DataLoader):
     def __init__(
             self,
@@ -128,6 +214,7 @@ class CacheDataLoader(torch.utils.data.DataLoader):
             distributed: bool = False,
             world_size: int = -1,
             global_rank: int = -1,
+            importance_sampling=None,
             **kwargs,
     ):
         assert kwargs.get("batch_size", 1) == 1, "only batch_size=1 is supported"
@@ -171,6 +258,27 @@ class CacheDataLoader(torch.utils.data.DataLoader):
             self.generator.manual_seed(seed)
             print("#{} dataloader seed to {}".format(os.getpid(), seed))
 
+        # only the images of this rank are sampled
+        self.importance_sampler = None
+        if importance_sampling is not None and importance_sampling.enabled is True:
+            assert self.shuffle is True, "importance sampling requires shuffle=True"
+            self.importance_sampler = ImportanceSampler(
+                [self.dataset.image_set.image_names[i] for i in self.indices],
+                temperature=importance_sampling.temperature,
+                uniform_ratio=importance_sampling.uniform_ratio,
+                smoothing=importance_sampling.smoothing,
+                refresh_every_n_epochs=importance_sampling.refresh_every_n_epochs,
+            )
+
+    def _shuffle(self) -> list[int]:
+        """
+        :return: the positions in `self.indices`
+        """
+
+        if self.importance_sampler is not None:
+            return self.importance_sampler.sample(self.generator)
+        return torch.randperm(len(self.indices), generator=self.generator).tolist()  # shuffle for each epoch
+
     def _cache_data(self, indices: list):
         # TODO: speedup image loading
         cached = []
@@ -198,7 +306,7 @@ class CacheDataLoader(torch.utils.data.DataLoader):
         # TODO: support batching
         if self.max_cache_num < 0:
             if self.shuffle is True:
-                indices = torch.randperm(len(self.cached), generator=self.generator).tolist()  # shuffle for each epoch
+                indices = self._shuffle()
                 # print("#{} 1st index: {}".format(os.getpid(), indices[0]))
             else:
                 indices = list(range(len(self.cached)))
@@ -207,7 +315,8 @@ class CacheDataLoader(torch.utils.data.DataLoader):
                 yield self.cached[i]
         else:
             if self.shuffle is True:
-                indices = torch.randperm(len(self.indices), generator=self.generator).tolist()  # shuffle for each epoch
+                # map the positions to the dataset indices, they are different when distributed
+                indices = [self.indices[i] for i in self._shuffle()]
                 # print("#{} 1st index: {}".format(os.getpid(), indices[0]))
             else:
                 indices = self.indices.copy()
@@ -391,8 +500,18 @@ class DataModule(LightningDataModule):
                 ))
 
     def train_dataloader(self) -> TRAIN_DATALOADERS:
-        return CacheDataLoader(
-            Dataset(self.dataparser_outputs.train_set, undistort_image=self.hparams["undistort_image"]),
+        # prepare the ground truth images of the coarse-to-fine training
+        pyramid_factors = None
+        resolution_schedule = self.trainer.lightning_module.hparams.get("resolution_schedule", None)
+        if resolution_schedule is not None and resolution_schedule.enabled is True:
+            pyramid_factors = resolution_schedule.factors
+
+        train_dataloader = CacheDataLoader(
+            Dataset(
+                self.dataparser_outputs.train_set,
+                undistort_image=self.hparams["undistort_image"],
+                pyramid_factors=pyramid_factors,
+            ),
             max_cache_num=self.hparams["params"].train_max_num_images_to_cache,
             shuffle=True,
             seed=torch.initial_seed() + self.global_rank,  # seed with global rank
@@ -400,7 +519,12 @@ class DataModule(LightningDataModule):
             distributed=self.hparams["distributed"],
             world_size=self.trainer.world_size,
             global_rank=self.trainer.global_rank,
+            importance_sampling=self.hparams["params"].importance_sampling,
         )
+        # the training step reports the losses to it
+        self.importance_sampler = train_dataloader.importance_sampler
+
+        return train_dataloader
 
     def test_dataloader(self) -> EVAL_DATALOADERS:
         if self.hparams["val_on_train"] is True:
@@ -19,11 +19,21 @@ from internal.viewer.training_viewer import TrainingViewer
 from internal.configs.model import ModelParams
 # from internal.configs.appearance import AppearanceModelParams
 from internal.configs.light_gaussian import LightGaussian
+from internal.configs.step_profiler import StepProfiler as StepProfilerParams
+from internal.configs.patch_training import PatchTraining
+from internal.configs.resolution_schedule import ResolutionSchedule
+from internal.configs.visibility_cache import VisibilityCache as VisibilityCacheParams
 
 from internal.models.gaussian_model import GaussianModel
+from internal.models.gaussian_model_subset import GaussianModelSubset
 # from internal.models.appearance_model import AppearanceModel
 from internal.renderers import Renderer, VanillaRenderer
-from internal.utils.ssim import ssim
+from internal.utils.ssim import fused_ssim, weighted_mean
+from internal.utils.step_profiler import StepProfiler
+from internal.utils.patch_sampler import PatchSampler
+from internal.utils.resolution_schedule import ResolutionScheduler
+from internal.utils.visibility_cache import VisibilityCache
+from internal.utils.sparse_adam import SparseAdam
 from jsonargparse import lazy_instance
 
 from internal.utils.sh_utils import eval_sh
@@ -49,13 +59,22 @@ class GaussianSplatting(LightningModule):
             absgrad: bool = False,
             save_ply: bool = False,
             web_viewer: bool = False,
+            web_viewer_snapshot_interval: int = 0,
+            step_profiler: StepProfilerParams = None,
+            patch_training: PatchTraining = None,
+            resolution_schedule: ResolutionSchedule = None,
+            visibility_cache: VisibilityCacheParams = None,
     ) -> None:
         super().__init__()
         self.automatic_optimization = False
         self.save_hyperparameters()
 
         # setup models
-        self.gaussian_model = GaussianModel(sh_degree=gaussian.sh_degree, extra_feature_dims=gaussian.extra_feature_dims)
+        self.gaussian_model = GaussianModel(
+            sh_degree=gaussian.sh_degree,
+            extra_feature_dims=gaussian.extra_feature_dims,
+            lazy_sh_bands=gaussian.lazy_sh_bands,
+        )
         # self.appearance_model = None if enable_appearance_model is False else AppearanceModel(
         #     n_input_dims=1,
         #     n_grayscale_factors=appearance.n_grayscale_factors,
@@ -86,6 +105,25 @@ class GaussianSplatting(LightningModule):
 
         self.web_viewer: TrainingViewer = None
 
+        self.step_profiler_params = step_profiler
+        if self.step_profiler_params is None:
+            self.step_profiler_params = StepProfilerParams()
+        self.step_profiler = StepProfiler()  # disabled until setup
+
+        self.patch_sampler = None
+        if patch_training is not None and patch_training.enabled is True:
+            self.patch_sampler = PatchSampler(patch_training.patch_size, patch_training.sampling)
+
+        self.resolution_scheduler = None
+        if resolution_schedule is not None and resolution_schedule.enabled is True:
+            self.resolution_scheduler = ResolutionScheduler(resolution_schedule.factors, resolution_schedule.milestones)
+
+        self.visibility_cache = None
+        if visibility_cache is not None and visibility_cache.enabled is True:
+            if self.renderer.supports_gaussian_subset is False:
+                raise ValueError("visibility cache is not supported by the renderer `{}`".format(self.renderer.__class__.__name__))
+            self.visibility_cache = VisibilityCache(visibility_cache.refresh_interval, visibility_cache.offload)
+
         self.batch_size = 1
         self.restored_epoch = 0
         self.restored_global_step = 0
@@ -94,10 +132,14 @@ class GaussianSplatting(LightningModule):
         self.image_queue = queue.Queue(maxsize=self.max_image_saving_threads)
         self.image_saving_threads = []
 
-    def _l1_loss(self, predict: torch.Tensor, gt: torch.Tensor):
+    def _l1_loss(self, predict: torch.Tensor, gt: torch.Tensor, weights: torch.Tensor = None):
+        if weights is not None:
+            return weighted_mean(torch.abs(predict - gt), weights)
         return torch.abs(predict - gt).mean()
 
-    def _l2_loss(self, predict: torch.Tensor, gt: torch.Tensor):
+    def _l2_loss(self, predict: torch.Tensor, gt: torch.Tensor, weights: torch.Tensor = None):
+        if weights is not None:
+            return weighted_mean((predict - gt) ** 2, weights)
         return torch.mean((predict - gt) ** 2)
 
     def _fixed_background_color(self):
@@ -122,6 +164,19 @@ class GaussianSplatting(LightningModule):
         elif isinstance(self.logger, lightning.pytorch.loggers.WandbLogger):
             self.log_image = self.wandb_log_image
 
+        if stage == "fit" and self.step_profiler_params.enabled is True:
+            trace_path = None
+            if self.step_profiler_params.trace is True and self.hparams["output_path"] is not None and self.trainer.global_rank == 0:
+                trace_path = os.path.join(self.hparams["output_path"], "step_profile.jsonl")
+            self.step_profiler = StepProfiler(
+                enabled=True,
+                log_every_n_steps=self.step_profiler_params.log_every_n_steps,
+                cuda_event=self.step_profiler_params.cuda_event,
+                memory=self.step_profiler_params.memory,
+                trace_path=trace_path,
+                gaussian_count_fn=lambda: self.gaussian_model.get_xyz.shape[0],
+            )
+
         # set loss function
         self.rgb_diff_loss_fn = self._l1_loss
         if self.hparams["gaussian"].optimization.rgb_diff_loss == "l2":
@@ -149,6 +204,22 @@ class GaussianSplatting(LightningModule):
             new_param_groups["params"] = [len(checkpoint["optimizer_states"][0]["param_groups"])]
             checkpoint["optimizer_states"][0]["param_groups"].append(new_param_groups)
 
+        if self.gaussian_model.lazy_sh_bands is True:
+            # the checkpoints always contain all the SH bands, drop the inactive ones, they are zeros
+            self._resize_sh_coefficients_in_checkpoint(
+                checkpoint,
+                self.gaussian_model.get_n_sh_coefficients(self.gaussian_model.active_sh_degree),
+            )
+            self.gaussian_model._features_rest = torch.nn.Parameter(
+                torch.zeros_like(checkpoint["state_dict"]["gaussian_model._features_rest"], dtype=torch.float),
+            )
+
+        if self.hparams["gaussian"].optimization.sparse_adam is False and "optimizer_states" in checkpoint:
+            # the per-Gaussian step counters of SparseAdam can not be restored by `torch.optim.Adam`
+            for state in checkpoint["optimizer_states"][0]["state"].values():
+                if "step" in state and state["step"].dim() > 0:
+                    state["step"] = state["step"].max()
+
         # get epoch and global_step, which used in the output path of the validation and test images
         self.restored_epoch = checkpoint["epoch"]
         self.restored_global_step = checkpoint["global_step"]
@@ -167,8 +238,38 @@ class GaussianSplatting(LightningModule):
             "spatial_lr_scale": self.gaussian_model.spatial_lr_scale,
             "active_sh_degree": self.gaussian_model.active_sh_degree,
         }
+        if self.gaussian_model.lazy_sh_bands is True:
+            # keep the checkpoints compatible with the ones without lazy SH bands
+            self._resize_sh_coefficients_in_checkpoint(
+                checkpoint,
+                self.gaussian_model.get_n_sh_coefficients(self.gaussian_model.max_sh_degree),
+            )
         super().on_save_checkpoint(checkpoint)
 
+    def _resize_sh_coefficients_in_checkpoint(self, checkpoint, n: int):
+        """
+        Truncate or zero pad `_features_rest` and its optimizer states in the checkpoint to `n` coefficients
+        """
+
+        key = "gaussian_model._features_rest"
+        checkpoint["state_dict"][key] = self.gaussian_model.resize_sh_coefficients(checkpoint["state_dict"][key], n)
+
+        if "optimizer_states" not in checkpoint or len(checkpoint["optimizer_states"]) == 0:
+            return
+        optimizer_state = checkpoint["optimizer_states"][0]
+        for param_group in optimizer_state["param_groups"]:
+            if param_group.get("name", None) != "f_rest":
+                continue
+            for param_id in param_group["params"]:
+                state = optimizer_state["state"].get(param_id, None)
+                if state is None:
+                    continue
+                # the state dicts may be the ones of the live optimizer, do not modify them in place
+                state = optimizer_state["state"][param_id] = state.copy()
+                for state_key in ["exp_avg", "exp_avg_sq"]:
+                    if state_key in state:
+                        state[state_key] = self.gaussian_model.resize_sh_coefficients(state[state_key], n)
+
     def tensorboard_log_image(self, tag: str, image_tensor):
         self.logger.experiment.add_image(
             tag,
@@ -185,13 +286,13 @@ class GaussianSplatting(LightningModule):
             step=self.trainer.global_step,
         )
 
-    def forward(self, camera):
+    def forward(self, camera, gaussian_model=None):
         if self.training is True:
             return self.renderer.training_forward(
                 self.trainer.global_step,
                 self,
                 camera,
-                self.gaussian_model,
+                self.gaussian_model if gaussian_model is None else gaussian_model,
                 bg_color=self.get_background_color().to(camera.R.device),
             )
         return self.renderer(
@@ -200,22 +301,33 @@ class GaussianSplatting(LightningModule):
             bg_color=self._fixed_background_color().to(camera.R.device),
         )
 
-    def forward_with_loss_calculation(self, camera, image_info):
-        image_name, gt_image, masked_pixels = image_info
+    @staticmethod
+    def _composite_gt_image(gt_image: torch.Tensor, mask: torch.Tensor, image: torch.Tensor) -> torch.Tensor:
+        """
+        :return: a new G.T. image whose masked pixels are copied from the prediction
+        """
+
+        return torch.where(mask, gt_image, image.detach())
+
+    def forward_with_loss_calculation(self, camera, image_info, gaussian_model=None):
+        image_name, gt_image, mask = image_info
 
         # forward
-        outputs = self(camera)
+        with self.step_profiler.region("forward"):
+            outputs = self(camera, gaussian_model)
 
         image = outputs["render"]
 
         # calculate loss
-        if masked_pixels is not None:
-            gt_image[masked_pixels] = image.detach()[masked_pixels]  # copy masked pixels from prediction to G.T.
-        # print(f"==>> gt_image.shape: {gt_image.shape}")
-        # print(f'''==>> outputs["render"].shape: {outputs["render"].shape}''')
-        rgb_diff_loss = self.rgb_diff_loss_fn(outputs["render"], gt_image)
-        ssim_metric = ssim(outputs["render"], gt_image)
-        loss = (1.0 - self.lambda_dssim) * rgb_diff_loss + self.lambda_dssim * (1. - ssim_metric)
+        with self.step_profiler.region("loss"):
+            # the masked pixels are excluded by zero weights, and replaced by the prediction inside the SSIM,
+            # the G.T. image is not modified, it may be cached
+            weights = None
+            if mask is not None:
+                weights = mask.to(dtype=image.dtype)
+            rgb_diff_loss = self.rgb_diff_loss_fn(image, gt_image, weights)
+            ssim_metric = fused_ssim(image, gt_image, weights=weights)
+            loss = (1.0 - self.lambda_dssim) * rgb_diff_loss + self.lambda_dssim * (1. - ssim_metric)
 
         return outputs, loss, rgb_diff_loss, ssim_metric
 
@@ -276,6 +388,10 @@ class GaussianSplatting(LightningModule):
                 up_direction=up.cpu().numpy(),
                 camera_center=self.trainer.datamodule.dataparser_outputs.train_set.cameras.camera_center.mean(dim=0).cpu().numpy(),
                 available_appearance_options=self.trainer.datamodule.dataparser_outputs.appearance_group_ids,
+                snapshot_interval=self.hparams["web_viewer_snapshot_interval"],
+                renderer=self.renderer,
+                background_color=self._fixed_background_color(),
+                device=self.device,
             )
             self.web_viewer.start()
 
@@ -287,11 +403,20 @@ class GaussianSplatting(LightningModule):
                 self._fixed_background_color(),
                 self.trainer.global_step,
             )
+            if self.web_viewer.viewer_overhead is not None:
+                self.log("train/viewer_overhead_ms", self.web_viewer.viewer_overhead * 1000., on_step=True, on_epoch=False, prog_bar=False, batch_size=self.batch_size)
         return super().on_train_batch_start(batch, batch_idx)
 
     def training_step(self, batch, batch_idx):
+        with self.step_profiler.step():
+            self._training_step(batch, batch_idx)
+
+        if self.step_profiler.should_log() is True:
+            self.step_profiler.log(self.trainer.global_step, self.logger if self.trainer.global_rank == 0 else None)
+
+    def _training_step(self, batch, batch_idx):
         camera, image_info = batch
-        # image_name, gt_image, masked_pixels = image_info
+        # image_name, gt_image, mask = image_info
 
         global_step = self.trainer.global_step + 1  # must start from 1 to prevent densify at the beginning
 
@@ -315,13 +440,52 @@ class GaussianSplatting(LightningModule):
         if global_step % 1000 == 0:
             self.gaussian_model.oneupSHdegree()
 
+        # coarse-to-fine training
+        downsample_factor = 1
+        if self.resolution_scheduler is not None:
+            camera, image_info, downsample_factor = self.resolution_scheduler(global_step, camera, image_info)
+
+        # only render a patch of the image
+        patch = None
+        if self.patch_sampler is not None:
+            image_width, image_height = int(camera.width), int(camera.height)
+            camera, image_info, patch = self.patch_sampler(camera, image_info)
+
+        # only render the Gaussians visible to this camera last time, the patches are not cached since their visible sets vary
+        gaussian_model_subset = None
+        use_visibility_cache = self.visibility_cache is not None and patch is None
+        if use_visibility_cache is True:
+            visible_indices = self.visibility_cache.get(
+                image_info[0],
+                global_step,
+                self.gaussian_model.get_xyz.shape[0],
+                device=self.gaussian_model.get_xyz.device,
+            )
+            if visible_indices is not None:
+                gaussian_model_subset = GaussianModelSubset(self.gaussian_model, visible_indices)
+
         # forward
-        outputs, loss, rgb_diff_loss, ssim_metric = self.forward_with_loss_calculation(camera, image_info)
+        outputs, loss, rgb_diff_loss, ssim_metric = self.forward_with_loss_calculation(camera, image_info, gaussian_model_subset)
         image, viewspace_point_tensor, visibility_filter, radii = outputs["render"], outputs["viewspace_points"], \
             outputs["visibility_filter"], outputs["radii"]
 
+        if use_visibility_cache is True and gaussian_model_subset is None:
+            self.visibility_cache.update(image_info[0], global_step, visibility_filter)
+
         # retrieve viewspace_points_grad_scale if provided
         viewspace_points_grad_scale = outputs.get("viewspace_points_grad_scale", None)
+        if patch is not None:
+            viewspace_points_grad_scale = PatchSampler.get_viewspace_points_grad_scale(
+                viewspace_points_grad_scale,
+                image_width,
+                image_height,
+                patch,
+            )
+
+        # report the loss to the importance sampler of the training images
+        importance_sampler = getattr(self.trainer.datamodule, "importance_sampler", None)
+        if importance_sampler is not None:
+            importance_sampler.update(image_info[0], loss)
 
         self.log("train/rgb_diff", rgb_diff_loss, on_step=True, on_epoch=False, prog_bar=False, batch_size=self.batch_size)
         self.log("train/ssim", ssim_metric, on_step=True, on_epoch=False, prog_bar=False, batch_size=self.batch_size)
@@ -332,6 +496,8 @@ class GaussianSplatting(LightningModule):
             metrics_to_log = {
                 "train/gaussians_count": self.gaussian_model.get_xyz.shape[0],
             }
+            if self.visibility_cache is not None:
+                metrics_to_log["train/visibility_cache_hit_rate"] = self.visibility_cache.get_hit_rate()
             for opt_idx, opt in enumerate(optimizers):
                 if opt is None:
                     continue
@@ -344,7 +510,16 @@ class GaussianSplatting(LightningModule):
             )
 
         # backward
-        self.manual_backward(loss)
+        with self.step_profiler.region("backward"):
+            self.manual_backward(loss)
+
+        # scatter the outputs of the subset back to the full model, the gradients of the parameters are already scattered by autograd
+        if gaussian_model_subset is not None:
+            viewspace_point_tensor, visibility_filter, radii = gaussian_model_subset.scatter_outputs(
+                viewspace_point_tensor,
+                visibility_filter,
+                radii,
+            )
 
         # before gradient descend
         with torch.no_grad():
@@ -363,23 +538,41 @@ class GaussianSplatting(LightningModule):
                 #     radii[visibility_filter] = original_radii
 
                 gaussians = self.gaussian_model
-                gaussians.max_radii2D[visibility_filter] = torch.max(
-                    gaussians.max_radii2D[visibility_filter],
-                    radii[visibility_filter]
-                )
-                if self.hparams["absgrad"] is True:
-                    viewspace_point_tensor.grad = viewspace_point_tensor.absgrad
-                gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter, scale=viewspace_points_grad_scale)
+                with self.step_profiler.region("densification_stats"):
+                    # the gradients of the 2D means are in the NDC space, independent of the resolution,
+                    # but the radii are in pixels, convert them to the full resolution ones
+                    gaussians.max_radii2D[visibility_filter] = torch.max(
+                        gaussians.max_radii2D[visibility_filter],
+                        radii[visibility_filter] * downsample_factor
+                    )
+                    if self.hparams["absgrad"] is True:
+                        viewspace_point_tensor.grad = viewspace_point_tensor.absgrad
+                    gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter, scale=viewspace_points_grad_scale)
 
                 if global_step > self.optimization_hparams.densify_from_iter and global_step % self.optimization_hparams.densification_interval == 0:
                     size_threshold = 20 if global_step > self.optimization_hparams.opacity_reset_interval else None
-                    gaussians.densify_and_prune(
-                        self.hparams["gaussian"].optimization.densify_grad_threshold,
-                        0.005,
-                        extent=self.cameras_extent,
-                        prune_extent=self.prune_extent,
-                        max_screen_size=size_threshold,
+                    with self.step_profiler.region("densify_and_prune"):
+                        densification_stats = gaussians.densify_and_prune(
+                            self.hparams["gaussian"].optimization.densify_grad_threshold,
+                            0.005,
+                            extent=self.cameras_extent,
+                            prune_extent=self.prune_extent,
+                            max_screen_size=size_threshold,
+                        )
+                    if self.visibility_cache is not None:
+                        self.visibility_cache.invalidate()
+                    self.logger.log_metrics(
+                        {"densification/{}".format(k): v for k, v in densification_stats.items()},
+                        step=self.trainer.global_step,
                     )
+                    if densification_stats["rejected"] > 0:
+                        print("[step {}] the Gaussian budget {} is reached, densification candidates={}, accepted={}, rejected={}".format(
+                            global_step,
+                            gaussians.max_gaussians,
+                            densification_stats["candidates"],
+                            densification_stats["accepted"],
+                            densification_stats["rejected"],
+                        ))
 
                 if global_step % self.hparams["gaussian"].optimization.opacity_reset_interval == 0 or \
                         (
@@ -389,13 +582,19 @@ class GaussianSplatting(LightningModule):
                     gaussians.reset_opacity()
 
         # optimize
-        for optimizer in optimizers:
-            optimizer.step()
+        with self.step_profiler.region("optimizer_step"):
+            if isinstance(self.gaussian_model.optimizer, SparseAdam):
+                # the first one is always the optimizer of the Gaussians
+                optimizers[0].step(visibility=visibility_filter)
+                optimizers = optimizers[1:]
+            for optimizer in optimizers:
+                optimizer.step()
 
         # schedule lr
-        self.gaussian_model.update_learning_rate(global_step)
-        for scheduler in schedulers:
-            scheduler.step()
+        with self.step_profiler.region("lr_update"):
+            self.gaussian_model.update_learning_rate(global_step)
+            for scheduler in schedulers:
+                scheduler.step()
 
     def light_gaussian_prune(self, global_step):
         """
@@ -419,6 +618,9 @@ class GaussianSplatting(LightningModule):
                 self.gaussian_model,
                 self.trainer.datamodule.dataparser_outputs.train_set.cameras,
                 anti_aliased,
+                camera_chunk_size=self.light_gaussian_hparams.camera_chunk_size,
+                subsample_ratio=self.light_gaussian_hparams.camera_subsample_ratio,
+                seed=global_step,
             )
             v_list = calculate_v_imp_score(
                 self.gaussian_model.get_scaling,
@@ -436,6 +638,8 @@ class GaussianSplatting(LightningModule):
                   f"prune_percent={prune_percent}, "
                   f"anti_aliased={anti_aliased}")
             self.gaussian_model.prune_points(prune_mask)
+            if self.visibility_cache is not None:
+                self.visibility_cache.invalidate()
             print(f"number_of_gaussian_after_pruning={self.gaussian_model.get_xyz.shape[0]}")
 
     def on_train_batch_end(self, outputs: STEP_OUTPUT, batch: Any, batch_idx: int) -> None:
@@ -443,7 +647,9 @@ class GaussianSplatting(LightningModule):
         # is the same as the local variable `global_step` in training_step
         global_step = self.trainer.global_step
 
-        self.light_gaussian_prune(global_step)
+        # outside the `step_profiler.step()`, recorded as a hook region
+        with self.step_profiler.hooks(), self.step_profiler.region("light_gaussian_prune"):
+            self.light_gaussian_prune(global_step)
 
         self.renderer.after_training_step(self.trainer.global_step, self)
         super().on_train_batch_end(outputs, batch, batch_idx)
@@ -465,6 +671,10 @@ class GaussianSplatting(LightningModule):
         # forward
         outputs, loss, rgb_diff_loss, ssim_metric = self.forward_with_loss_calculation(camera, image_info)
 
+        # the metrics and the saved G.T. image do not count the masked pixels against the model
+        if image_info[2] is not None:
+            gt_image = self._composite_gt_image(gt_image, image_info[2], outputs["render"])
+
         self.log(f"{name}/rgb_diff", rgb_diff_loss, on_epoch=True, prog_bar=False, batch_size=self.batch_size)
         self.log(f"{name}/ssim", ssim_metric, on_epoch=True, prog_bar=False, batch_size=self.batch_size)
         self.log(f"{name}/loss", loss, on_epoch=True, prog_bar=True, batch_size=self.batch_size)
@@ -113,14 +113,92 @@ def interpolate_ms_features(pts: torch.Tensor,
     return multi_scale_interp
 
 
+def group_planes_by_shape(grid: Sequence[torch.Tensor]) -> List[List[int]]:
+    """
+    :return: the indices of the planes, grouped by their shapes, in the order of their first occurrences
+    """
+
+    groups: Dict[tuple, List[int]] = {}
+    for ci, plane in enumerate(grid):
+        groups.setdefault(tuple(plane.shape), []).append(ci)
+    return list(groups.values())
+
+
+def interpolate_ms_features_fused(pts: torch.Tensor,
+                                  ms_grids: Collection[Iterable[nn.Module]],
+                                  grid_dimensions: int,
+                                  concat_features: bool,
+                                  num_levels: Optional[int],
+                                  ) -> torch.Tensor:
+    """
+    The same as `interpolate_ms_features`, but the planes of a scale are stacked by their shapes,
+    and every stack is sampled by a single `grid_sample` call,
+    e.g. 2 calls per scale for the HexPlane, one for the 3 spatial planes, the other for the 3 time planes.
+    The per-plane features are multiplied in the same order as `interpolate_ms_features`.
+    The planes of the same shape are copied into a stack on every call, so it only pays off when the kernel launches dominate,
+    it is slower than `interpolate_ms_features` on CPU.
+    """
+
+    coo_combs = torch.tensor(list(itertools.combinations(
+        range(pts.shape[-1]), grid_dimensions)
+    ), dtype=torch.long, device=pts.device)  # [n_planes, grid_dimensions]
+    if num_levels is None:
+        num_levels = len(ms_grids)
+    n = pts.shape[0]
+    multi_scale_interp = [] if concat_features else 0.
+    grid: nn.ParameterList
+    for scale_id, grid in enumerate(ms_grids[:num_levels]):
+        # interpolate in the stacked planes
+        interp_out_planes = [None] * len(grid)
+        for plane_indices in group_planes_by_shape(grid):
+            stacked_planes = torch.cat([grid[ci] for ci in plane_indices], dim=0)  # [n_stacked, out_dim, *reso]
+            n_stacked, feature_dim = stacked_planes.shape[:2]
+            coords = pts[:, coo_combs[plane_indices]].transpose(0, 1).reshape(
+                [n_stacked] + [1] * (grid_dimensions - 1) + [n, grid_dimensions]
+            )  # [n_stacked, 1, ..., n, grid_dimensions]
+            interp = F.grid_sample(
+                stacked_planes,
+                coords,
+                align_corners=True,
+                mode='bilinear', padding_mode='border',
+            ).view(n_stacked, feature_dim, n)
+            for idx, ci in enumerate(plane_indices):
+                interp_out_planes[ci] = interp[idx]
+
+        # compute product over planes, in the [feature_dim, n] layout, transposed only once
+        interp_space = interp_out_planes[0]
+        for interp_out_plane in interp_out_planes[1:]:
+            if interp_space is interp_out_planes[0] or interp_space.requires_grad is True:
+                interp_space = interp_space * interp_out_plane
+            else:
+                interp_space.mul_(interp_out_plane)
+        interp_space = interp_space.T  # [n, feature_dim]
+
+        # combine over scales
+        if concat_features:
+            multi_scale_interp.append(interp_space)
+        else:
+            multi_scale_interp = multi_scale_interp + interp_space
+
+    if concat_features:
+        multi_scale_interp = torch.cat(multi_scale_interp, dim=-1)
+    return multi_scale_interp
+
+
 class HexPlaneField(nn.Module):
     def __init__(
             self,
 
             bounds,
             planeconfig,
-            multires
+            multires,
+            fused: bool = False,
     ) -> None:
+        """
+        :param fused: sample the planes of the same shape by a single `grid_sample` call, see `interpolate_ms_features_fused`,
+            not enabled by default, its speedup on CUDA is not measured yet
+        """
+
         super().__init__()
         aabb = torch.tensor([[bounds, bounds, bounds],
                              [-bounds, -bounds, -bounds]])
@@ -128,6 +206,7 @@ class HexPlaneField(nn.Module):
         self.grid_config = [planeconfig]
         self.multiscale_res_multipliers = multires
         self.concat_features = True
+        self.fused = fused
 
         # 1. Init planes
         self.grids = nn.ModuleList()
@@ -173,7 +252,8 @@ class HexPlaneField(nn.Module):
         pts = torch.cat((pts, timestamps), dim=-1)  # [n_rays, n_samples, 4]
 
         pts = pts.reshape(-1, pts.shape[-1])
-        features = interpolate_ms_features(
+        interpolate_fn = interpolate_ms_features_fused if getattr(self, "fused", False) is True else interpolate_ms_features
+        features = interpolate_fn(
             pts, ms_grids=self.grids,  # noqa
             grid_dimensions=self.grid_config[0]["grid_dimensions"],
             concat_features=self.concat_features, num_levels=None)
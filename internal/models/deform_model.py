@@ -4,6 +4,7 @@ Copied from https://github.com/ingra14m/Deformable-3D-Gaussians/blob/main/utils/
 
 import torch
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
 from internal.encodings.positional_encoding import PositionalEncoding
 from internal.utils.rigid_utils import exp_se3
 
@@ -53,7 +54,15 @@ class DeformModel(nn.Module):
             t_output_ch=30,
             is_6dof=False,
             chunk: int = -1,
+            memory_budget: float = -1,
+            gradient_checkpointing: bool = True,
     ):
+        """
+        :param chunk: the number of the Gaussians queried at once, -1: all of them, 0: sized by `memory_budget`
+        :param memory_budget: in MB, for the activations of a chunk, default: half of the available CUDA memory
+        :param gradient_checkpointing: recompute the activations of the chunks in the backward pass instead of keeping them
+        """
+
         super().__init__()
         self.D = D
         self.W = W
@@ -61,6 +70,8 @@ class DeformModel(nn.Module):
         # self.output_ch = output_ch
         self.t_multires = t_multires
         self.chunk = chunk
+        self.memory_budget = memory_budget
+        self.gradient_checkpointing = gradient_checkpointing
 
         self.skips = [D // 2]
 
@@ -104,48 +115,74 @@ class DeformModel(nn.Module):
         self.gaussian_rotation = network_factory.get_linear(W, 4)
         self.gaussian_scaling = network_factory.get_linear(W, 3)
 
-    def forward(self, x, t):
-        t_emb = self.embed_time_fn(t)
-        x_emb = self.embed_fn(x)
+    def get_bytes_per_gaussian(self) -> int:
+        """
+        :return: the approximate size of the activations kept for the backward pass
+        """
+
+        # the inputs and outputs of every linear layer, including the heads, and the concatenated skip inputs
+        return 4 * (2 * self.W * (self.D + 3) + self.input_ch * (len(self.skips) + 1))
 
+    def get_chunk_size(self, n: int, device) -> int:
         if self.chunk > 0:
-            chunks = []
-            n_gaussians = x.shape[0]
-            for i in range(0, n_gaussians, self.chunk):
-                chunks.append((
-                    t_emb[i:i + self.chunk],
-                    x_emb[i:i + self.chunk],
-                ))
-        else:
-            chunks = [(t_emb, x_emb)]
+            return self.chunk
+        if self.chunk < 0:
+            return n
+
+        # automatically sized by the memory budget, the instances pickled by previous versions do not have it
+        memory_budget = getattr(self, "memory_budget", -1) * 1024 * 1024
+        if memory_budget <= 0:
+            if torch.device(device).type != "cuda":
+                return n
+            free, _ = torch.cuda.mem_get_info(device)
+            # the cached blocks can be reused too
+            memory_budget = 0.5 * (free + torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device))
+        return max(int(memory_budget // self.get_bytes_per_gaussian()), 1024)
+
+    def forward(self, x, t):
+        chunk_size = self.get_chunk_size(x.shape[0], x.device)
+        if chunk_size >= x.shape[0]:
+            return self._forward(x, t)
+
+        # only the activations of a single chunk are kept, they will be recomputed in the backward pass
+        gradient_checkpointing = getattr(self, "gradient_checkpointing", False) is True and torch.is_grad_enabled() is True
 
         d_xyz_chunks = []
         scaling_chunks = []
         rotation_chunks = []
-        # query deformable field
-        for i in chunks:
-            t_input, x_input = i
-            h = torch.cat([x_input, t_input], dim=-1)
-            for i, l in enumerate(self.skip_layers):
-                h = self.skip_layers[i](h)
-                h = torch.cat([x_input, t_input, h], -1)
-            h = self.output_linear(h)
-
-            if self.is_6dof:
-                w = self.branch_w(h)
-                v = self.branch_v(h)
-                theta = torch.norm(w, dim=-1, keepdim=True)
-                w = w / theta + 1e-5
-                v = v / theta + 1e-5
-                screw_axis = torch.cat([w, v], dim=-1)
-                d_xyz = exp_se3(screw_axis, theta)
+        for i in range(0, x.shape[0], chunk_size):
+            if gradient_checkpointing is True:
+                d_xyz, rotation, scaling = checkpoint(self._forward, x[i:i + chunk_size], t[i:i + chunk_size], use_reentrant=False)
             else:
-                d_xyz = self.gaussian_warp(h)
-            scaling = self.gaussian_scaling(h)
-            rotation = self.gaussian_rotation(h)
-
+                d_xyz, rotation, scaling = self._forward(x[i:i + chunk_size], t[i:i + chunk_size])
             d_xyz_chunks.append(d_xyz)
             scaling_chunks.append(scaling)
             rotation_chunks.append(rotation)
 
         return torch.concat(d_xyz_chunks, dim=0), torch.concat(rotation_chunks, dim=0), torch.concat(scaling_chunks, dim=0)
+
+    def _forward(self, x, t):
+        t_emb = self.embed_time_fn(t)
+        x_emb = self.embed_fn(x)
+
+        # query deformable field
+        h = torch.cat([x_emb, t_emb], dim=-1)
+        for i, l in enumerate(self.skip_layers):
+            h = self.skip_layers[i](h)
+            h = torch.cat([x_emb, t_emb, h], -1)
+        h = self.output_linear(h)
+
+        if self.is_6dof:
+            w = self.branch_w(h)
+            v = self.branch_v(h)
+            theta = torch.norm(w, dim=-1, keepdim=True)
+            w = w / theta + 1e-5
+            v = v / theta + 1e-5
+            screw_axis = torch.cat([w, v], dim=-1)
+            d_xyz = exp_se3(screw_axis, theta)
+        else:
+            d_xyz = self.gaussian_warp(h)
+        scaling = self.gaussian_scaling(h)
+        rotation = self.gaussian_rotation(h)
+
+        return d_xyz, rotation, scaling
@@ -12,6 +12,7 @@ from internal.utils.general_utils import inverse_sigmoid, get_expon_lr_func, bui
     build_scaling_rotation
 from internal.utils.graphics_utils import BasicPointCloud
 from internal.utils.gaussian_utils import Gaussian as GaussianParameterUtils
+from internal.utils.sparse_adam import SparseAdam, MixedPrecisionAdam
 
 
 class GaussianModel(nn.Module):
@@ -34,12 +35,14 @@ class GaussianModel(nn.Module):
 
         self.rotation_activation = torch.nn.functional.normalize
 
-    def __init__(self, sh_degree: int, extra_feature_dims: int = 0):
+    def __init__(self, sh_degree: int, extra_feature_dims: int = 0, lazy_sh_bands: bool = False):
         super().__init__()
 
         self.active_sh_degree = 0
         self.max_sh_degree = sh_degree
         self.extra_feature_dims = extra_feature_dims
+        # only the activated SH bands are allocated in `_features_rest`, the inactive ones are always zeros
+        self.lazy_sh_bands = lazy_sh_bands
 
         self._xyz = torch.empty(0)
         self._features_dc = torch.empty(0)
@@ -55,6 +58,7 @@ class GaussianModel(nn.Module):
         self.optimizer = None
         self.percent_dense = 0
         self.spatial_lr_scale = 0
+        self.max_gaussians = -1  # no limit if <= 0
 
         self.setup_functions()
 
@@ -90,16 +94,67 @@ class GaussianModel(nn.Module):
 
     @property
     def get_features_extra(self):
-        return self._features_extra
+        # may be stored in low precision
+        return self._features_extra.to(self._xyz.dtype)
 
     def oneupSHdegree(self):
         if self.active_sh_degree < self.max_sh_degree:
             self.active_sh_degree += 1
+            if self.lazy_sh_bands is True:
+                self.allocate_sh_coefficients(self.get_n_sh_coefficients(self.active_sh_degree))
+
+    @staticmethod
+    def get_n_sh_coefficients(sh_degree: int) -> int:
+        """
+        :return: the number of the SH coefficients in `features_rest`, i.e. excluding the DC one
+        """
+
+        return (sh_degree + 1) ** 2 - 1
+
+    @staticmethod
+    def resize_sh_coefficients(features_rest: torch.Tensor, n: int) -> torch.Tensor:
+        """
+        Truncate or zero pad the second dimension of `features_rest` or its optimizer states
+        """
+
+        if features_rest.shape[1] >= n:
+            return features_rest[:, :n]
+        return torch.cat([
+            features_rest,
+            torch.zeros((features_rest.shape[0], n - features_rest.shape[1]) + features_rest.shape[2:], dtype=features_rest.dtype, device=features_rest.device),
+        ], dim=1)
+
+    def allocate_sh_coefficients(self, n: int):
+        """
+        Extend `_features_rest` and its optimizer states to `n` coefficients, the allocated ones are preserved
+        """
+
+        if self._features_rest.shape[1] >= n:
+            return
+
+        features_rest = self.resize_sh_coefficients(self._features_rest.detach(), n)
+        if self.optimizer is None:
+            self._features_rest = nn.Parameter(features_rest.requires_grad_(True))
+            return
+
+        for group in self.optimizer.param_groups:
+            if group["name"] != "f_rest":
+                continue
+            stored_state = self.optimizer.state.get(group['params'][0], None)
+            if stored_state is not None:
+                stored_state["exp_avg"] = self.resize_sh_coefficients(stored_state["exp_avg"], n)
+                stored_state["exp_avg_sq"] = self.resize_sh_coefficients(stored_state["exp_avg_sq"], n)
+                del self.optimizer.state[group['params'][0]]
+            group["params"][0] = nn.Parameter(features_rest.requires_grad_(True))
+            if stored_state is not None:
+                self.optimizer.state[group['params'][0]] = stored_state
+            self._features_rest = group["params"][0]
 
     def create_from_pcd(self, pcd: BasicPointCloud, deivce):
         fused_point_cloud = torch.tensor(np.asarray(pcd.points)).float().to(deivce)
         fused_color = RGB2SH(torch.tensor(np.asarray(pcd.colors)).float().to(deivce))
-        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().to(deivce)
+        allocated_sh_degree = self.active_sh_degree if self.lazy_sh_bands is True else self.max_sh_degree
+        features = torch.zeros((fused_color.shape[0], 3, (allocated_sh_degree + 1) ** 2)).float().to(deivce)
         features[:, :3, 0] = fused_color
         features[:, 3:, 1:] = 0.0
 
@@ -161,6 +216,14 @@ class GaussianModel(nn.Module):
         # some tensor may still in CPU, move to the same device as the _xyz
         self.extra_params_to(self._xyz.device, self._xyz.dtype)
 
+        # store the high order SH coefficients in low precision
+        features_rest_dtype = getattr(torch, training_args.features_rest_dtype)
+        if self._features_rest.dtype != features_rest_dtype:
+            self._features_rest = nn.Parameter(self._features_rest.detach().to(features_rest_dtype).requires_grad_(True))
+            self._features_extra = nn.Parameter(self._features_extra.detach().to(features_rest_dtype).requires_grad_(True))
+
+        self.max_gaussians = self.get_gaussian_budget(training_args.max_gaussians, training_args.max_gaussian_memory)
+
         l = [
             {'params': [self._xyz], 'lr': training_args.position_lr_init * self.spatial_lr_scale, "name": "xyz"},
             {'params': [self._features_dc], 'lr': training_args.feature_lr, "name": "f_dc"},
@@ -174,7 +237,13 @@ class GaussianModel(nn.Module):
 
         print("spatial_lr_scale={}, learning_rates={}".format(self.spatial_lr_scale, {i["name"]: i["lr"] for i in l}))
 
-        self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
+        if training_args.sparse_adam is True:
+            self.optimizer = SparseAdam(l, lr=0.0, eps=1e-15)
+        elif features_rest_dtype != torch.float:
+            # `torch.optim.Adam` updates the low precision parameters in low precision
+            self.optimizer = MixedPrecisionAdam(l, lr=0.0, eps=1e-15)
+        else:
+            self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
         schedulers = []
 
         xyz_scheduler_args = get_expon_lr_func(lr_init=training_args.position_lr_init * self.spatial_lr_scale,
@@ -203,6 +272,36 @@ class GaussianModel(nn.Module):
 
         self.schedulers = schedulers
 
+    def get_bytes_per_gaussian(self) -> int:
+        """
+        The parameters, their gradients and two Adam moments, plus the densification statistics
+        """
+
+        n_bytes = 0
+        for i in [self._xyz, self._features_dc, self._scaling, self._rotation, self._opacity, self._features_extra]:
+            n_bytes += 4 * i[:1].numel() * i.element_size()
+        # including the SH bands not allocated yet
+        n_bytes += 4 * 3 * self.get_n_sh_coefficients(self.max_sh_degree) * self._features_rest.element_size()
+        return n_bytes + 3 * 4
+
+    def get_gaussian_budget(self, max_gaussians: int, max_gaussian_memory: float) -> int:
+        """
+        :param max_gaussian_memory: in GiB
+        :return: the maximum number of Gaussians, -1 if no limit
+        """
+
+        budgets = []
+        if max_gaussians > 0:
+            budgets.append(max_gaussians)
+        if max_gaussian_memory > 0:
+            budgets.append(int(max_gaussian_memory * (1 << 30) / self.get_bytes_per_gaussian()))
+        if len(budgets) == 0:
+            return -1
+
+        budget = min(budgets)
+        print("max_gaussians={}".format(budget))
+        return budget
+
     def get_lr_updater(self, name: str, scheduler):
         for idx, param_group in enumerate(self.optimizer.param_groups):
             if param_group["name"] == name:
@@ -266,10 +365,10 @@ class GaussianModel(nn.Module):
             xyz=self._xyz.detach(),
             opacities=self._opacity.detach(),
             features_dc=self._features_dc.detach(),
-            features_rest=self._features_rest.detach(),
+            features_rest=self.resize_sh_coefficients(self._features_rest.detach().float(), self.get_n_sh_coefficients(self.max_sh_degree)),
             scales=self._scaling.detach(),
             rotations=self._rotation.detach(),
-            real_features_extra=self._features_extra.detach(),
+            real_features_extra=self._features_extra.detach().float(),
         ).to_ply_format().save_to_ply(path)
 
     def reset_opacity(self):
@@ -356,6 +455,9 @@ class GaussianModel(nn.Module):
             if stored_state is not None:
                 stored_state["exp_avg"] = stored_state["exp_avg"][mask]
                 stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
+                if stored_state["step"].dim() > 0:
+                    # the per-Gaussian step counters of SparseAdam
+                    stored_state["step"] = stored_state["step"][mask]
 
                 del self.optimizer.state[group['params'][0]]
                 group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
@@ -392,10 +494,16 @@ class GaussianModel(nn.Module):
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
 
-                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)),
+                # the moments may be stored in a different dtype
+                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor, dtype=stored_state["exp_avg"].dtype)),
                                                     dim=0)
-                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)),
+                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor, dtype=stored_state["exp_avg_sq"].dtype)),
                                                        dim=0)
+                if stored_state["step"].dim() > 0:
+                    stored_state["step"] = torch.cat((
+                        stored_state["step"],
+                        torch.zeros((extension_tensor.shape[0],), dtype=stored_state["step"].dtype, device=stored_state["step"].device),
+                    ), dim=0)
 
                 del self.optimizer.state[group['params'][0]]
                 group["params"][0] = nn.Parameter(
@@ -433,7 +541,7 @@ class GaussianModel(nn.Module):
         self.denom = torch.zeros((self.get_xyz.shape[0], 1), device=self._xyz.device)
         self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device=self._xyz.device)
 
-    def densify_and_split(self, grads, grad_threshold, scene_extent, N=2):
+    def get_split_mask(self, grads, grad_threshold, scene_extent):
         n_init_points = self.get_xyz.shape[0]
         # Extract points that satisfy the gradient condition
         padded_grad = torch.zeros((n_init_points), device=self._xyz.device)
@@ -442,6 +550,18 @@ class GaussianModel(nn.Module):
         selected_pts_mask = torch.logical_and(selected_pts_mask,
                                               torch.max(self.get_scaling,
                                                         dim=1).values > self.percent_dense * scene_extent)
+        return selected_pts_mask
+
+    def densify_and_split(self, grads, grad_threshold, scene_extent, N=2, selected_pts_mask=None):
+        n_init_points = self.get_xyz.shape[0]
+        if selected_pts_mask is None:
+            selected_pts_mask = self.get_split_mask(grads, grad_threshold, scene_extent)
+        else:
+            # the Gaussians added after selecting are not split
+            selected_pts_mask = torch.cat([
+                selected_pts_mask,
+                torch.zeros((n_init_points - selected_pts_mask.shape[0],), dtype=torch.bool, device=selected_pts_mask.device),
+            ])
 
         stds = self.get_scaling[selected_pts_mask].repeat(N, 1)
         means = torch.zeros((stds.size(0), 3), device=self._xyz.device)
@@ -461,12 +581,17 @@ class GaussianModel(nn.Module):
             (selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device=self._xyz.device, dtype=bool)))
         self.prune_points(prune_filter)
 
-    def densify_and_clone(self, grads, grad_threshold, scene_extent):
+    def get_clone_mask(self, grads, grad_threshold, scene_extent):
         # Extract points that satisfy the gradient condition
         selected_pts_mask = torch.where(torch.norm(grads, dim=-1) >= grad_threshold, True, False)
         selected_pts_mask = torch.logical_and(selected_pts_mask,
                                               torch.max(self.get_scaling,
                                                         dim=1).values <= self.percent_dense * scene_extent)
+        return selected_pts_mask
+
+    def densify_and_clone(self, grads, grad_threshold, scene_extent, selected_pts_mask=None):
+        if selected_pts_mask is None:
+            selected_pts_mask = self.get_clone_mask(grads, grad_threshold, scene_extent)
 
         new_xyz = self._xyz[selected_pts_mask]
         new_features_dc = self._features_dc[selected_pts_mask]
@@ -479,12 +604,41 @@ class GaussianModel(nn.Module):
         self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling,
                                    new_rotation, new_features_extra)
 
-    def densify_and_prune(self, max_grad, min_opacity, extent, prune_extent, max_screen_size):
+    @staticmethod
+    def select_by_priority(priority: torch.Tensor, candidate_mask: torch.Tensor, k: int) -> torch.Tensor:
+        """
+        :return: the mask of the `k` candidates with the highest priorities
+        """
+
+        priority = torch.where(candidate_mask, priority, -torch.inf)
+        selected_mask = torch.zeros_like(candidate_mask)
+        selected_mask[torch.topk(priority, k, sorted=False).indices] = True
+        return selected_mask
+
+    def densify_and_prune(self, max_grad, min_opacity, extent, prune_extent, max_screen_size) -> dict:
+        """
+        :return: the numbers of the densification candidates, the accepted and rejected ones, and the pruned Gaussians
+        """
+
         grads = self.xyz_gradient_accum / self.denom
         grads[grads.isnan()] = 0.0
 
-        self.densify_and_clone(grads, max_grad, extent)
-        self.densify_and_split(grads, max_grad, extent)
+        # select before densifying, the cloned Gaussians are not split
+        clone_mask = self.get_clone_mask(grads, max_grad, extent)
+        split_mask = self.get_split_mask(grads, max_grad, extent)
+        # both cloning and splitting (into 2) increase the number by 1
+        n_candidates = int(clone_mask.sum().item() + split_mask.sum().item())
+        n_accepted = n_candidates
+        if self.max_gaussians > 0:
+            n_accepted = min(n_candidates, max(self.max_gaussians - self.get_xyz.shape[0], 0))
+            if n_accepted < n_candidates:
+                # only the ones with the largest accumulated gradients are accepted
+                selected_mask = self.select_by_priority(grads.squeeze(-1), clone_mask | split_mask, n_accepted)
+                clone_mask = clone_mask & selected_mask
+                split_mask = split_mask & selected_mask
+
+        self.densify_and_clone(grads, max_grad, extent, selected_pts_mask=clone_mask)
+        self.densify_and_split(grads, max_grad, extent, selected_pts_mask=split_mask)
 
         prune_mask = (self.get_opacity < min_opacity).squeeze()
         if max_screen_size:
@@ -495,11 +649,22 @@ class GaussianModel(nn.Module):
 
         torch.cuda.empty_cache()
 
-    def add_densification_stats(self, viewspace_point_tensor, update_filter, scale: Union[float, int, None]):
-        grad_norm = torch.norm(viewspace_point_tensor.grad[update_filter, :2], dim=-1, keepdim=True)
-
-        if scale is not None:
-            grad_norm = grad_norm * scale
+        return {
+            "candidates": n_candidates,
+            "accepted": n_accepted,
+            "rejected": n_candidates - n_accepted,
+            "pruned": int(prune_mask.sum().item()),
+        }
+
+    def add_densification_stats(self, viewspace_point_tensor, update_filter, scale: Union[float, int, torch.Tensor, None]):
+        if isinstance(scale, torch.Tensor):
+            # per-axis scale, must be applied before the norm
+            grad_norm = torch.norm(viewspace_point_tensor.grad[update_filter, :2] * scale.to(viewspace_point_tensor.grad), dim=-1, keepdim=True)
+        else:
+            grad_norm = torch.norm(viewspace_point_tensor.grad[update_filter, :2], dim=-1, keepdim=True)
+
+            if scale is not None:
+                grad_norm = grad_norm * scale
 
         self.xyz_gradient_accum[update_filter] += grad_norm
         self.denom[update_filter] += 1
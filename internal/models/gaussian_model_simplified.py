@@ -1,7 +1,9 @@
+from typing import Optional
 import torch
 from torch import nn
 import internal.utils.gaussian_utils as gaussian_utils
 from internal.utils.general_utils import inverse_sigmoid
+from internal.utils.sh_distillation import get_sh_degree_groups
 
 
 class GaussianModelSimplified(nn.Module):
@@ -16,9 +18,25 @@ class GaussianModelSimplified(nn.Module):
             features_extra: torch.Tensor,
             sh_degree: int,
             device,
+            adaptive_sh_degrees: Optional[torch.Tensor] = None,
     ) -> None:
+        """
+        :param adaptive_sh_degrees: [n], the SH degree of every Gaussian, the Gaussians will be reordered by them
+        """
+
         super().__init__()
 
+        self._adaptive_sh_degrees = None
+        # [(sh_degree, begin, end), ...], the renderers can evaluate the SH of every group with its own degree
+        self.sh_degree_groups = None
+        if adaptive_sh_degrees is not None:
+            adaptive_sh_degrees, order = torch.sort(adaptive_sh_degrees.to(torch.int), stable=True)
+            xyz, features_dc, features_rest, scaling, rotation, opacity, features_extra = [
+                i[order] for i in [xyz, features_dc, features_rest, scaling, rotation, opacity, features_extra]
+            ]
+            self._adaptive_sh_degrees = adaptive_sh_degrees.to(device)
+            self.sh_degree_groups = get_sh_degree_groups(adaptive_sh_degrees)
+
         self._xyz = xyz.to(device)
         # self._features_dc = features_dc
         # self._features_rest = features_rest
@@ -43,6 +61,8 @@ class GaussianModelSimplified(nn.Module):
         self._opacity = self._opacity.to(device)
         self._features = self._features.to(device)
         self._features_extra = self._features_extra.to(device)
+        if self._adaptive_sh_degrees is not None:
+            self._adaptive_sh_degrees = self._adaptive_sh_degrees.to(device)
         return self
 
     @classmethod
@@ -70,6 +90,7 @@ class GaussianModelSimplified(nn.Module):
             features_extra=gaussian.real_features_extra,
             sh_degree=active_sh_degree,
             device=device,
+            adaptive_sh_degrees=gaussian.adaptive_sh_degrees,
         )
 
     @classmethod
@@ -85,6 +106,7 @@ class GaussianModelSimplified(nn.Module):
             scaling=gaussians.scales,
             rotation=gaussians.rotations,
             features_extra=gaussians.real_features_extra,
+            adaptive_sh_degrees=gaussians.adaptive_sh_degrees,
         )
 
     @property
@@ -133,6 +155,10 @@ class GaussianModelSimplified(nn.Module):
         self._features = self._features[gaussians_to_be_preserved]
         self._features_extra = self._features_extra[gaussians_to_be_preserved]
 
+        if getattr(self, "_adaptive_sh_degrees", None) is not None:
+            self._adaptive_sh_degrees = self._adaptive_sh_degrees[gaussians_to_be_preserved]
+            self.sh_degree_groups = get_sh_degree_groups(self._adaptive_sh_degrees)
+
     def to_parameter_structure(self) -> gaussian_utils.Gaussian:
         xyz = self._xyz.cpu()
         features_dc = self._features[:, :1, :].cpu()
@@ -141,6 +167,9 @@ class GaussianModelSimplified(nn.Module):
         rotation = self._rotation.cpu()
         opacity = inverse_sigmoid(self._opacity).cpu()
         features_extra = self._features_extra.cpu()
+        adaptive_sh_degrees = getattr(self, "_adaptive_sh_degrees", None)
+        if adaptive_sh_degrees is not None:
+            adaptive_sh_degrees = adaptive_sh_degrees.cpu()
 
         return gaussian_utils.Gaussian(
             sh_degrees=self.max_sh_degree,
@@ -151,6 +180,7 @@ class GaussianModelSimplified(nn.Module):
             scales=scaling,
             rotations=rotation,
             real_features_extra=features_extra,
+            adaptive_sh_degrees=adaptive_sh_degrees,
         )
 
     def to_ply_structure(self) -> gaussian_utils.Gaussian:
@@ -161,6 +191,9 @@ class GaussianModelSimplified(nn.Module):
         rotation = self._rotation.cpu().numpy()
         opacity = inverse_sigmoid(self._opacity).cpu().numpy()
         features_extra = self._features_extra.cpu().numpy()
+        adaptive_sh_degrees = getattr(self, "_adaptive_sh_degrees", None)
+        if adaptive_sh_degrees is not None:
+            adaptive_sh_degrees = adaptive_sh_degrees.cpu().numpy()
 
         return gaussian_utils.Gaussian(
             sh_degrees=self.max_sh_degree,
@@ -171,4 +204,5 @@ class GaussianModelSimplified(nn.Module):
             scales=scaling,
             rotations=rotation,
             real_features_extra=features_extra,
+            adaptive_sh_degrees=adaptive_sh_degrees,
         )
@@ -0,0 +1,86 @@
+from typing import Tuple
+
+import torch
+
+
+class GaussianModelSubset:
+    """
+    A subset of the Gaussians of a `GaussianModel`, the gradients flow back to the parameters of the full model
+    """
+
+    def __init__(self, gaussian_model, indices: torch.Tensor):
+        self.gaussian_model = gaussian_model
+        self.indices = indices
+
+        self.max_sh_degree = gaussian_model.max_sh_degree
+        self.active_sh_degree = gaussian_model.active_sh_degree
+        self.scaling_activation = gaussian_model.scaling_activation
+        self.rotation_activation = gaussian_model.rotation_activation
+        self.opacity_activation = gaussian_model.opacity_activation
+        self.covariance_activation = gaussian_model.covariance_activation
+
+        self._xyz = gaussian_model._xyz[indices]
+        self._features_dc = gaussian_model._features_dc[indices]
+        self._features_rest = gaussian_model._features_rest[indices]
+        self._scaling = gaussian_model._scaling[indices]
+        self._rotation = gaussian_model._rotation[indices]
+        self._opacity = gaussian_model._opacity[indices]
+        self._features_extra = gaussian_model._features_extra[indices]
+
+    @property
+    def get_scaling(self):
+        return self.scaling_activation(self._scaling)
+
+    @property
+    def get_rotation(self):
+        return self.rotation_activation(self._rotation)
+
+    @property
+    def get_xyz(self):
+        return self._xyz
+
+    @property
+    def get_features(self):
+        return torch.cat((self._features_dc, self._features_rest), dim=1)
+
+    @property
+    def get_opacity(self):
+        return self.opacity_activation(self._opacity)
+
+    def get_covariance(self, scaling_modifier=1):
+        return self.covariance_activation(self.get_scaling, scaling_modifier, self._rotation)
+
+    @property
+    def get_features_extra(self):
+        return self._features_extra.to(self._xyz.dtype)
+
+    def scatter_outputs(
+            self,
+            viewspace_points: torch.Tensor,
+            visibility_filter: torch.Tensor,
+            radii: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Convert the renderer outputs to the ones of the full model, call after backward
+
+        :return: the 2D means with the full size gradients, the visibility filter and the radii
+        """
+
+        n = self.gaussian_model._xyz.shape[0]
+
+        full_viewspace_points = torch.zeros((n,) + viewspace_points.shape[1:], dtype=viewspace_points.dtype, device=viewspace_points.device)
+        for name in ["grad", "absgrad"]:
+            subset_grad = getattr(viewspace_points, name, None)
+            if subset_grad is None:
+                continue
+            full_grad = torch.zeros_like(full_viewspace_points)
+            full_grad[self.indices] = subset_grad
+            setattr(full_viewspace_points, name, full_grad)
+
+        full_visibility_filter = torch.zeros((n,), dtype=visibility_filter.dtype, device=visibility_filter.device)
+        full_visibility_filter[self.indices] = visibility_filter
+
+        full_radii = torch.zeros((n,), dtype=radii.dtype, device=radii.device)
+        full_radii[self.indices] = radii
+
+        return full_viewspace_points, full_visibility_filter, full_radii
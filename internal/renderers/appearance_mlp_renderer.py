@@ -39,7 +39,8 @@ class AppearanceMLPRenderer(VanillaRenderer):
             grayscale_factors, gamma = self.appearance_model.get_appearance(viewpoint_camera.normalized_appearance_id)
 
         if self.apply_on_gaussian is True:
-            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree + 1) ** 2)
+            features = pc.get_features
+            shs_view = features.transpose(1, 2).view(-1, 3, features.shape[1])  # the SH bands may be partially allocated
             with torch.no_grad():
                 dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
                 dir_pp_normalized = dir_pp / dir_pp.norm(dim=1, keepdim=True)
@@ -0,0 +1,45 @@
+import torch
+from .renderer import Renderer
+from ..cameras import Camera
+from ..models.gaussian_model import GaussianModel
+from ..utils.deformation_baking import BakedDeformation
+
+
+class BakedDeformationRenderer(Renderer):
+    """
+    Play back the deformations baked by `utils/bake_deformations.py`, interpolated between the keyframes, without querying the network.
+    The rendering is done by the renderer the deformations are baked from.
+    """
+
+    # the baked deformations are per Gaussian
+    supports_gaussian_subset: bool = False
+
+    def __init__(self, renderer: Renderer, baked_deformation: BakedDeformation) -> None:
+        super().__init__()
+
+        assert hasattr(renderer, "get_deformation") is True, "{} is not a deformable renderer".format(renderer.__class__.__name__)
+        self.renderer = renderer
+        self.baked_deformation = baked_deformation
+
+    def forward(
+            self,
+            viewpoint_camera: Camera,
+            pc: GaussianModel,
+            bg_color: torch.Tensor,
+            scaling_modifier=1.0,
+            **kwargs,
+    ):
+        assert pc.get_xyz.shape[0] == self.baked_deformation.n_gaussians, \
+            "the deformations are baked for {} Gaussians, but got {}".format(self.baked_deformation.n_gaussians, pc.get_xyz.shape[0])
+
+        # not moved by `Module.to()`, e.g. the renderer is sent to the render workers
+        if self.baked_deformation.means[0].device != pc.get_xyz.device:
+            self.baked_deformation.to(pc.get_xyz.device)
+
+        return self.renderer._render(
+            *self.baked_deformation(viewpoint_camera.time),
+            viewpoint_camera=viewpoint_camera,
+            pc=pc,
+            bg_color=bg_color,
+            scaling_modifier=scaling_modifier,
+        )
@@ -13,6 +13,7 @@ from ..utils.general_utils import get_linear_noise_func
 from ..utils.rigid_utils import from_homogenous, to_homogenous
 from ..utils.rotation import qvec2rot
 from ..utils.gaussian_utils import GaussianTransformUtils
+from ..utils.deformation_cache import DeformationCache
 
 
 @dataclass
@@ -27,7 +28,9 @@ class DeformNetworkConfig:
     n_neurons: int = 256
     is_6dof: bool = False
     rotate_xyz: bool = False
-    chunk: int = -1  # avoid CUDA oom
+    chunk: int = 0  # avoid CUDA oom, -1: disable, 0: sized by the available memory
+    memory_budget: float = -1  # in MB, for the activations of a chunk, default: half of the available CUDA memory
+    gradient_checkpointing: bool = True  # recompute the activations of the chunks in the backward pass
 
 
 @dataclass
@@ -60,13 +63,27 @@ class DeformableRenderer(Renderer):
             xyz_encoding: XYZEncodingConfig,
             time_encoding: TimeEncodingConfig,
             optimization: DeformableRendererOptimizationConfig,
+            deformation_cache_size: int = 16,
+            deformation_cache_memory: float = 1024.,
     ) -> None:
+        """
+        :param deformation_cache_size: the number of the time values whose deformation outputs are cached for rendering, 0 to disable
+        :param deformation_cache_memory: in MB, the memory limit of the cache
+        """
+
         super().__init__()
 
         self.deform_network_config = deform_network
         self.xyz_encoding_config = xyz_encoding
         self.time_encoding_config = time_encoding
         self.optimization_config = optimization
+        self.deformation_cache = DeformationCache(deformation_cache_size, deformation_cache_memory)
+
+    def _get_deformation_cache(self) -> DeformationCache:
+        # the instances pickled by previous versions do not have it
+        if getattr(self, "deformation_cache", None) is None:
+            self.deformation_cache = DeformationCache()
+        return self.deformation_cache
 
     def forward(
             self,
@@ -76,10 +93,13 @@ class DeformableRenderer(Renderer):
             scaling_modifier=1.0,
             **kwargs,
     ):
-        # without ast noise
-        N = pc.get_xyz.shape[0]
-        time_input = viewpoint_camera.time.unsqueeze(0).expand(N, -1)
-        d_xyz, d_rotation, d_scaling = self.deform_model(pc.get_xyz.detach(), time_input)
+        # only depend on the time and the positions, reused until either of them changes
+        d_xyz, d_rotation, d_scaling = self._get_deformation_cache()(
+            viewpoint_camera.time,
+            [pc.get_xyz],
+            self.deform_model,
+            lambda: self.get_deformation(pc, viewpoint_camera.time),
+        )
 
         return self._render(
             d_xyz,
@@ -91,6 +111,15 @@ class DeformableRenderer(Renderer):
             scaling_modifier=scaling_modifier,
         )
 
+    def get_deformation(self, pc: GaussianModel, time: torch.Tensor):
+        """
+        :return: the outputs of the deformation network at `time`, without ast noise
+        """
+
+        N = pc.get_xyz.shape[0]
+        time_input = time.unsqueeze(0).expand(N, -1)
+        return self.deform_model(pc.get_xyz.detach(), time_input)
+
     def training_forward(
             self,
             step: int,
@@ -101,6 +130,9 @@ class DeformableRenderer(Renderer):
             scaling_modifier=1.0,
             **kwargs,
     ):
+        # the cached outputs of the validation are out of date, release their memory
+        self._get_deformation_cache().invalidate()
+
         d_xyz, d_rotation, d_scaling = 0.0, 0.0, 0.0
         if step >= self.optimization_config.warm_up:
             N = pc.get_xyz.shape[0]
@@ -110,7 +142,6 @@ class DeformableRenderer(Renderer):
                 time_interval = 1 / ((step % self.train_set_length) + 1)
                 ast_noise = torch.randn(1, 1, device=pc.get_xyz.device).expand(N, -1) * time_interval * self.smooth_term(step)
             d_xyz, d_rotation, d_scaling = self.deform_model(pc.get_xyz.detach(), time_input + ast_noise)
-            torch.cuda.empty_cache()  # avoid CUDA OOM
 
         return self._render(
             d_xyz,
@@ -189,6 +220,8 @@ class DeformableRenderer(Renderer):
             t_output_ch=self.time_encoding_config.n_output_dim,
             is_6dof=self.deform_network_config.is_6dof,
             chunk=self.deform_network_config.chunk,
+            memory_budget=self.deform_network_config.memory_budget,
+            gradient_checkpointing=self.deform_network_config.gradient_checkpointing,
         )
         self.smooth_term = get_linear_noise_func(lr_init=0.1, lr_final=1e-15, lr_delay_mult=0.01, max_steps=20000)
 
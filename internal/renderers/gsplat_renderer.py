@@ -40,7 +40,16 @@ class GSPlatRenderer(Renderer):
 
         viewdirs = pc.get_xyz.detach() - viewpoint_camera.camera_center  # (N, 3)
         # viewdirs = viewdirs / viewdirs.norm(dim=-1, keepdim=True)
-        rgbs = spherical_harmonics(pc.active_sh_degree, viewdirs, pc.get_features)
+        sh_degree_groups = getattr(pc, "sh_degree_groups", None)
+        if sh_degree_groups is None:
+            rgbs = spherical_harmonics(pc.active_sh_degree, viewdirs, pc.get_features)
+        else:
+            # the Gaussians with distilled SH, evaluate every group with its own degree
+            features = pc.get_features
+            rgbs = torch.concat([
+                spherical_harmonics(min(sh_degree, pc.active_sh_degree), viewdirs[begin:end], features[begin:end])
+                for sh_degree, begin, end in sh_degree_groups
+            ], dim=0)
         rgbs = torch.clamp(rgbs + 0.5, min=0.0)  # type: ignore
 
         opacities = pc.get_opacity
@@ -15,6 +15,8 @@ class MipSplattingGSplatRenderer(Renderer):
 
     filter_3d: torch.nn.Parameter  # [n, 1]
 
+    supports_gaussian_subset: bool = False  # `filter_3d` is indexed by the full model
+
     def __init__(
             self,
             filter_2d_kernel_size: float = 0.1,
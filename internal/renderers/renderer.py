@@ -6,6 +6,9 @@ from internal.models.gaussian_model import GaussianModel
 
 
 class Renderer(torch.nn.Module):
+    # whether the Gaussian model passed to `forward` can be a subset of the Gaussians, i.e. no per-Gaussian states are kept by the renderer
+    supports_gaussian_subset: bool = True
+
     def forward(
             self,
             viewpoint_camera: Camera,
@@ -7,6 +7,7 @@ from ..models.gaussian_model import GaussianModel
 from ..models.vanilla_deform_model import VanillaDeformNetwork
 from ..utils.rigid_utils import from_homogenous, to_homogenous
 from ..utils.common import parse_cfg_args
+from ..utils.deformation_cache import DeformationCache
 
 
 class VanillaDeformableRenderer(Renderer):
@@ -15,7 +16,14 @@ class VanillaDeformableRenderer(Renderer):
             model_path: str,
             load_iteration: int,
             device,
+            deformation_cache_size: int = 16,
+            deformation_cache_memory: float = 1024.,
     ) -> None:
+        """
+        :param deformation_cache_size: the number of the time values whose deformation outputs are cached for rendering, 0 to disable
+        :param deformation_cache_memory: in MB, the memory limit of the cache
+        """
+
         super().__init__()
 
         cfg_args = self._parse_cfg_args(model_path)
@@ -32,6 +40,14 @@ class VanillaDeformableRenderer(Renderer):
 
         self.is_6dof = cfg_args.is_6dof
 
+        self.deformation_cache = DeformationCache(deformation_cache_size, deformation_cache_memory)
+
+    def _get_deformation_cache(self) -> DeformationCache:
+        # the instances pickled by previous versions do not have it
+        if getattr(self, "deformation_cache", None) is None:
+            self.deformation_cache = DeformationCache()
+        return self.deformation_cache
+
     @classmethod
     def _parse_cfg_args(cls, model_path):
         return parse_cfg_args(os.path.join(model_path, "cfg_args"))
@@ -44,10 +60,12 @@ class VanillaDeformableRenderer(Renderer):
             scaling_modifier=1.0,
             **kwargs,
     ):
-        # without ast noise
-        N = pc.get_xyz.shape[0]
-        time_input = viewpoint_camera.time.unsqueeze(0).expand(N, -1)
-        d_xyz, d_rotation, d_scaling = self.deform_model(pc.get_xyz.detach(), time_input)
+        d_xyz, d_rotation, d_scaling = self._get_deformation_cache()(
+            viewpoint_camera.time,
+            [pc.get_xyz],
+            self.deform_model,
+            lambda: self.get_deformation(pc, viewpoint_camera.time),
+        )
 
         return self._render(
             d_xyz,
@@ -59,6 +77,15 @@ class VanillaDeformableRenderer(Renderer):
             scaling_modifier=scaling_modifier,
         )
 
+    def get_deformation(self, pc: GaussianModel, time: torch.Tensor):
+        """
+        :return: the outputs of the deformation network at `time`
+        """
+
+        N = pc.get_xyz.shape[0]
+        time_input = time.unsqueeze(0).expand(N, -1)
+        return self.deform_model(pc.get_xyz.detach(), time_input)
+
     def _render(
             self,
             d_xyz,
@@ -5,6 +5,7 @@ from ..cameras import Camera
 from ..model_components.gs4d_deformation import deform_network
 from ..models.gaussian_model import GaussianModel
 from ..utils.common import parse_cfg_args
+from ..utils.deformation_cache import DeformationCache
 from .renderer import Renderer
 from .vanilla_renderer import VanillaRenderer
 
@@ -15,7 +16,14 @@ class VanillaGS4DRenderer(Renderer):
             model_path: str,
             load_iteration: int,
             device,
+            deformation_cache_size: int = 16,
+            deformation_cache_memory: float = 1024.,
     ):
+        """
+        :param deformation_cache_size: the number of the time values whose deformation outputs are cached for rendering, 0 to disable
+        :param deformation_cache_memory: in MB, the memory limit of the cache
+        """
+
         super().__init__()
 
         self.model_path = model_path
@@ -39,6 +47,14 @@ class VanillaGS4DRenderer(Renderer):
         ), map_location=device))
         self.deformation_table = torch.load(os.path.join(checkpoint_dir, "deformation_table.pth"), map_location=device)
 
+        self.deformation_cache = DeformationCache(deformation_cache_size, deformation_cache_memory)
+
+    def _get_deformation_cache(self) -> DeformationCache:
+        # the instances pickled by previous versions do not have it
+        if getattr(self, "deformation_cache", None) is None:
+            self.deformation_cache = DeformationCache()
+        return self.deformation_cache
+
     def forward(
             self,
             viewpoint_camera: Camera,
@@ -47,15 +63,44 @@ class VanillaGS4DRenderer(Renderer):
             scaling_modifier=1.0,
             **kwargs,
     ):
+        # `GaussianModel.get_features` is a new concatenation on every call, whose pointer and version can not identify the content
+        if hasattr(pc, "_features_dc") is True:
+            features = [pc._features_dc, pc._features_rest]
+        else:
+            features = [pc.get_features]
+        means3D_final, scales_final, rotations_final, opacity_final, shs_final = self._get_deformation_cache()(
+            viewpoint_camera.time,
+            [pc.get_xyz, pc._scaling, pc._rotation, pc._opacity] + features,
+            self.deformation,
+            lambda: self.get_deformation(pc, viewpoint_camera.time),
+        )
+
+        return self._render(
+            means3D_final,
+            scales_final,
+            rotations_final,
+            opacity_final,
+            shs_final,
+            viewpoint_camera=viewpoint_camera,
+            pc=pc,
+            bg_color=bg_color,
+            scaling_modifier=scaling_modifier,
+        )
+
+    def get_deformation(self, pc: GaussianModel, time: torch.Tensor):
+        """
+        :return: the outputs of the deformation network at `time`
+        """
+
         means3D = pc.get_xyz
         scales = pc._scaling
         rotations = pc._rotation
         opacity = pc._opacity
         shs = pc.get_features
-        time = viewpoint_camera.time.repeat(means3D.shape[0], 1)
+        time = time.repeat(means3D.shape[0], 1)
 
         # deformation_point = self.deformation_table
-        means3D_final, scales_final, rotations_final, opacity_final, shs_final = self.deformation(
+        return self.deformation(
             means3D,
             scales,
             rotations,
@@ -64,6 +109,18 @@ class VanillaGS4DRenderer(Renderer):
             time,
         )
 
+    def _render(
+            self,
+            means3D_final,
+            scales_final,
+            rotations_final,
+            opacity_final,
+            shs_final,
+            viewpoint_camera: Camera,
+            pc: GaussianModel,
+            bg_color: torch.Tensor,
+            scaling_modifier=1.0,
+    ):
         # means3D_final = torch.zeros_like(means3D)
         # rotations_final = torch.zeros_like(rotations)
         # scales_final = torch.zeros_like(scales)
@@ -79,7 +136,7 @@ class VanillaGS4DRenderer(Renderer):
 
         scales_final = pc.scaling_activation(scales_final)
         rotations_final = pc.rotation_activation(rotations_final)
-        opacity_final = pc.opacity_activation(opacity)
+        opacity_final = pc.opacity_activation(pc._opacity)
 
         return VanillaRenderer.render(
             means3D=means3D_final,
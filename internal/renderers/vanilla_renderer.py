@@ -86,7 +86,8 @@ class VanillaRenderer(Renderer):
         colors_precomp = None
         if override_color is None:
             if self.convert_SHs_python is True:
-                shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree + 1) ** 2)
+                features = pc.get_features
+                shs_view = features.transpose(1, 2).view(-1, 3, features.shape[1])  # the SH bands may be partially allocated
                 dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
                 dir_pp_normalized = dir_pp / dir_pp.norm(dim=1, keepdim=True)
                 sh2rgb = eval_sh(pc.active_sh_degree, shs_view, dir_pp_normalized)
@@ -0,0 +1,192 @@
+"""
+Bake the outputs of a deformation network at evenly spaced keyframes, so that the dynamic scenes can be played back by interpolating them,
+without querying the network.
+
+Every output is stored as its mean over time in float32, plus the residuals of the keyframes, either
+    float16: the residuals in float16;
+    low_rank: a temporal basis shared by all the Gaussians, [n_keyframes, rank], and the coefficients of every Gaussian in float16, [rank, n, ...].
+The outputs which do not change over time only store their means.
+"""
+
+from typing import Callable, List, Literal, Optional, Tuple
+
+import torch
+
+BakingMode = Literal["float16", "low_rank"]
+
+
+class BakedDeformation:
+    def __init__(
+            self,
+            t_min: float,
+            t_max: float,
+            n_keyframes: int,
+            mode: BakingMode,
+            means: List[torch.Tensor],
+            residuals: List[Optional[torch.Tensor]],
+            temporal_bases: List[Optional[torch.Tensor]],
+    ):
+        """
+        :param means: [n, ...] for every output
+        :param residuals: float16 mode: [n_keyframes, n, ...] for every output, None if static
+        :param temporal_bases: low_rank mode: [n_keyframes, rank] for every output, None if static
+        """
+
+        self.t_min = t_min
+        self.t_max = t_max
+        self.n_keyframes = n_keyframes
+        self.mode = mode
+        self.means = means
+        self.residuals = residuals
+        self.temporal_bases = temporal_bases
+
+    @classmethod
+    @torch.no_grad()
+    def bake(
+            cls,
+            deform_fn: Callable[[float], Tuple[torch.Tensor, ...]],
+            n_keyframes: int,
+            t_min: float = 0.,
+            t_max: float = 1.,
+            mode: BakingMode = "float16",
+            rank: int = 16,
+    ):
+        """
+        :param deform_fn: returns the outputs of the deformation network at a time value, the first dimensions are the Gaussians
+        """
+
+        assert n_keyframes >= 2
+        times = torch.linspace(t_min, t_max, n_keyframes).tolist()
+
+        # keep the keyframes in the host memory, the device one may be insufficient for the large scenes,
+        # every output is written into its preallocated stack directly, no other copy of the keyframes is kept
+        stacks = None
+        for keyframe_idx, t in enumerate(times):
+            outputs = deform_fn(t)
+            if stacks is None:
+                stacks = [torch.empty((n_keyframes,) + tuple(i.shape), dtype=torch.float) for i in outputs]
+            for stacked, output in zip(stacks, outputs):
+                stacked[keyframe_idx].copy_(output)
+            del outputs
+
+        means = []
+        residuals = []
+        temporal_bases = []
+        for output_idx in range(len(stacks)):
+            # free the float32 stack once its output is compressed
+            stacked = stacks[output_idx]  # [n_keyframes, n, ...]
+            stacks[output_idx] = None
+            if torch.all(stacked == stacked[0]):
+                means.append(stacked[0])
+                residuals.append(None)
+                temporal_bases.append(None)
+                continue
+
+            mean = torch.mean(stacked, dim=0)
+            stacked -= mean
+            means.append(mean)
+
+            if mode == "float16":
+                residuals.append(stacked.to(torch.float16))
+                temporal_bases.append(None)
+            elif mode == "low_rank":
+                # the top eigenvectors of the Gram matrix are the left singular vectors of the residuals
+                flatten = stacked.reshape((n_keyframes, -1))
+                _, eigenvectors = torch.linalg.eigh(flatten @ flatten.T)
+                temporal_basis = eigenvectors[:, -min(rank, n_keyframes):].contiguous()  # [n_keyframes, rank]
+                coefficients = temporal_basis.T @ flatten  # [rank, n * ...]
+                residuals.append(coefficients.reshape((-1,) + stacked.shape[1:]).to(torch.float16))
+                temporal_bases.append(temporal_basis)
+            else:
+                raise ValueError("unknown baking mode '{}'".format(mode))
+
+        return cls(t_min, t_max, n_keyframes, mode, means, residuals, temporal_bases)
+
+    @property
+    def n_gaussians(self) -> int:
+        return self.means[0].shape[0]
+
+    def get_interpolation(self, time: float) -> Tuple[int, int, float]:
+        """
+        :return: the indices of the two neighboring keyframes, and the weight of the latter one
+        """
+
+        position = (time - self.t_min) / max(self.t_max - self.t_min, 1e-8)
+        position = min(max(position, 0.), 1.) * (self.n_keyframes - 1)
+        left = min(int(position), self.n_keyframes - 2)
+        return left, left + 1, position - left
+
+    def __call__(self, time) -> Tuple[torch.Tensor, ...]:
+        """
+        :param time: a float or a tensor containing a single value, e.g. `Camera.time`
+        :return: the linearly interpolated outputs
+        """
+
+        if torch.is_tensor(time):
+            time = time.reshape(-1)[0].item()
+        left, right, weight = self.get_interpolation(time)
+
+        # the low precision residuals are accumulated into the float32 outputs in place, without casting them to float32 first
+        outputs = []
+        for mean, residual, temporal_basis in zip(self.means, self.residuals, self.temporal_bases):
+            if residual is None:
+                outputs.append(mean)
+            elif temporal_basis is None:
+                outputs.append(mean.add(residual[left], alpha=1. - weight).add_(residual[right], alpha=weight))
+            else:
+                weights = torch.lerp(temporal_basis[left], temporal_basis[right], weight)  # [rank]
+                output = mean.clone()
+                for basis_weight, coefficients in zip(weights.tolist(), residual):
+                    output.add_(coefficients, alpha=basis_weight)
+                outputs.append(output)
+        return tuple(outputs)
+
+    def get_n_bytes(self) -> int:
+        return sum(i.numel() * i.element_size() for i in self.means + self.residuals + self.temporal_bases if i is not None)
+
+    def to(self, device):
+        for name in ["means", "residuals", "temporal_bases"]:
+            setattr(self, name, [None if i is None else i.to(device) for i in getattr(self, name)])
+        return self
+
+    def save(self, path: str):
+        torch.save({
+            "t_min": self.t_min,
+            "t_max": self.t_max,
+            "n_keyframes": self.n_keyframes,
+            "mode": self.mode,
+            "means": self.means,
+            "residuals": self.residuals,
+            "temporal_bases": self.temporal_bases,
+        }, path)
+
+    @classmethod
+    def load(cls, path: str, device=None):
+        return cls(**torch.load(path, map_location="cpu")).to(device)
+
+
+@torch.no_grad()
+def get_baking_errors(
+        baked: BakedDeformation,
+        deform_fn: Callable[[float], Tuple[torch.Tensor, ...]],
+        times: List[float],
+) -> List[Tuple[float, float]]:
+    """
+    :return: the (RMS, max) absolute errors of every output against the live evaluation, over `times`
+    """
+
+    squared_error_sums = None
+    max_errors = None
+    n_elements = None
+    for time in times:
+        errors = [(i.float() - j.to(i.device)).abs() for i, j in zip(deform_fn(time), baked(time))]
+        if squared_error_sums is None:
+            squared_error_sums = [0.] * len(errors)
+            max_errors = [0.] * len(errors)
+            n_elements = [0] * len(errors)
+        for idx, error in enumerate(errors):
+            squared_error_sums[idx] += torch.sum(error * error).item()
+            max_errors[idx] = max(max_errors[idx], error.max().item())
+            n_elements[idx] += error.numel()
+
+    return [((squared_error_sums[i] / max(n_elements[i], 1)) ** 0.5, max_errors[i]) for i in range(len(squared_error_sums))]
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+import torch
+
+
+class DeformationCache:
+    """
+    The deformation outputs of the recently rendered time values,
+    so that only the first frame of a time value queries the deformation network,
+    e.g. moving the camera in the viewer without moving the time slider.
+
+    The entries are evicted in the least recently used order once there are more than `max_entries` of them,
+    or their total size exceeds `max_memory`.
+    An entry is valid only when the input tensors and the network parameters are not replaced or modified in-place,
+    which are detected by their storage pointers, shapes and version counters.
+    """
+
+    def __init__(self, max_entries: int = 16, max_memory: float = 1024.):
+        """
+        :param max_entries: 0 to disable the cache
+        :param max_memory: in MB
+        """
+
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.cache: OrderedDict[tuple, Tuple[int, Tuple[torch.Tensor, ...]]] = OrderedDict()  # key -> (n_bytes, outputs)
+        self.n_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(time: torch.Tensor, inputs: Iterable[torch.Tensor], module: torch.nn.Module) -> tuple:
+        return (
+            float(time.reshape(-1)[0].item()),
+            tuple((i.data_ptr(), tuple(i.shape), i._version) for i in inputs),
+            id(module),
+            tuple(i._version for i in module.parameters()),
+        )
+
+    def get(self, key: tuple) -> Optional[Tuple[torch.Tensor, ...]]:
+        cached = self.cache.get(key, None)
+        if cached is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return cached[1]
+
+    def put(self, key: tuple, outputs: Tuple[torch.Tensor, ...]):
+        n_bytes = sum(i.numel() * i.element_size() for i in outputs if torch.is_tensor(i))
+        if self.max_entries <= 0 or n_bytes > self.max_memory * 1024 * 1024:
+            return
+
+        previous = self.cache.pop(key, None)
+        if previous is not None:
+            self.n_bytes -= previous[0]
+        self.cache[key] = (n_bytes, outputs)
+        self.n_bytes += n_bytes
+
+        while len(self.cache) > self.max_entries or self.n_bytes > self.max_memory * 1024 * 1024:
+            _, (evicted_n_bytes, _) = self.cache.popitem(last=False)
+            self.n_bytes -= evicted_n_bytes
+
+    def __call__(
+            self,
+            time: torch.Tensor,
+            inputs: Iterable[torch.Tensor],
+            module: torch.nn.Module,
+            fn: Callable[[], Tuple[torch.Tensor, ...]],
+    ) -> Tuple[torch.Tensor, ...]:
+        """
+        :return: the cached outputs, or the ones returned by `fn`, which are cached when no gradients are required
+        """
+
+        inputs = list(inputs)
+        # the version counters of the inference tensors are not available
+        if self.max_entries <= 0 or torch.is_grad_enabled() is True or any(i.is_inference() for i in inputs):
+            return fn()
+
+        key = self.get_key(time, inputs, module)
+        outputs = self.get(key)
+        if outputs is None:
+            outputs = tuple(fn())
+            self.put(key, outputs)
+        return outputs
+
+    def invalidate(self):
+        self.cache.clear()
+        self.n_bytes = 0
+
+    def get_hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.
+
+    def __getstate__(self):
+        # the renderers are pickled into the checkpoints, do not store the outputs
+        state = self.__dict__.copy()
+        state["cache"] = OrderedDict()
+        state["n_bytes"] = 0
+        return state
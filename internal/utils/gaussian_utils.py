@@ -2,7 +2,7 @@ import os
 import numpy as np
 import torch
 from internal.utils.colmap import rotmat2qvec, qvec2rotmat
-from typing import Union
+from typing import Union, Optional
 from dataclasses import dataclass
 from plyfile import PlyData, PlyElement
 
@@ -23,6 +23,8 @@ class Gaussian:
     scales: Union[np.ndarray, torch.Tensor]  # [n, 3]
     rotations: Union[np.ndarray, torch.Tensor]  # [n, 4]
     real_features_extra: Union[np.ndarray, torch.Tensor]
+    # [n], the SH degree of every Gaussian, the coefficients higher than it are zeros, the `sh_degrees` of all if not provided
+    adaptive_sh_degrees: Optional[Union[np.ndarray, torch.Tensor]] = None
 
     @staticmethod
     def load_array_from_plyelement(plyelement, name_prefix: str):
@@ -93,6 +95,10 @@ class Gaussian:
 
         features_extra = cls.load_real_feature_extra_from_plyelement(plydata.elements[0])
 
+        adaptive_sh_degrees = None
+        if "sh_degree" in [p.name for p in plydata.elements[0].properties]:
+            adaptive_sh_degrees = np.asarray(plydata.elements[0]["sh_degree"]).astype(np.int32)
+
         return cls(
             sh_degrees=sh_degrees,
             xyz=xyz,
@@ -102,6 +108,7 @@ class Gaussian:
             scales=scales,
             rotations=rots,
             real_features_extra=features_extra,
+            adaptive_sh_degrees=adaptive_sh_degrees,
         )
 
     @classmethod
@@ -117,11 +124,12 @@ class Gaussian:
             ("rotation", "rotations"),
             ("opacity", "opacities"),
         ]:
-            init_args[name_in_dataclass] = state_dict["{}{}".format(key_prefix, name_in_dict)]
+            # `features_rest` may be stored in low precision
+            init_args[name_in_dataclass] = state_dict["{}{}".format(key_prefix, name_in_dict)].float()
 
         # compat with previous versions
         if f"{key_prefix}features_extra" in state_dict:
-            init_args["real_features_extra"] = state_dict[f"{key_prefix}features_extra"]
+            init_args["real_features_extra"] = state_dict[f"{key_prefix}features_extra"].float()
         else:
             print("'features_extra' not found in state_dict, create an empty one")
             init_args["real_features_extra"] = torch.empty((init_args["xyz"].shape[0], 0), device=init_args["xyz"].device)
@@ -139,6 +147,7 @@ class Gaussian:
             scales=torch.tensor(self.scales, dtype=torch.float),
             rotations=torch.tensor(self.rotations, dtype=torch.float),
             real_features_extra=torch.tensor(self.real_features_extra, dtype=torch.float),
+            adaptive_sh_degrees=None if self.adaptive_sh_degrees is None else torch.tensor(self.adaptive_sh_degrees, dtype=torch.int),
         )
 
     def to_ply_format(self):
@@ -152,6 +161,7 @@ class Gaussian:
             scales=self.scales.cpu().numpy(),
             rotations=self.rotations.cpu().numpy(),
             real_features_extra=self.real_features_extra.cpu().numpy(),
+            adaptive_sh_degrees=None if self.adaptive_sh_degrees is None else self.adaptive_sh_degrees.cpu().numpy().astype(np.int32),
         )
 
     def save_to_ply(self, path: str, with_colors: bool = False):
@@ -193,6 +203,9 @@ class Gaussian:
 
         dtype_full = [(attribute, 'f4') for attribute in construct_list_of_attributes()]
         attribute_list = [xyz, normals, f_dc, f_rest, opacities, scale, rotation]
+        if gaussian.adaptive_sh_degrees is not None:
+            dtype_full.append(('sh_degree', 'i4'))
+            attribute_list.append(gaussian.adaptive_sh_degrees.reshape((-1, 1)))
         if with_colors is True:
             from internal.utils.sh_utils import eval_sh
             rgbs = np.clip((eval_sh(0, self.features_dc, None) + 0.5), 0., 1.)
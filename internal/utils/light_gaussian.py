@@ -1,13 +1,58 @@
-from typing import List, Tuple
+from typing import List, Tuple, Callable, Union, Iterator
 import torch
-from internal.renderers.gsplat_hit_pixel_count_renderer import GSplatHitPixelCountRenderer
+from internal.cameras.cameras import Camera, Cameras
+
+
+def iterate_cameras(
+        cameras: Union[Cameras, List[Camera]],
+        indices: torch.Tensor,
+        chunk_size: int,
+        device,
+) -> Iterator[Camera]:
+    """
+    Move the cameras to `device` chunk by chunk, instead of one by one
+    """
+
+    for start in range(0, indices.shape[0], chunk_size):
+        chunk_indices = indices[start:start + chunk_size]
+        if not isinstance(cameras, Cameras):
+            for i in chunk_indices.tolist():
+                yield cameras[i].to_device(device)
+            continue
+
+        values = {}
+        for name in Camera.__dataclass_fields__:
+            value = getattr(cameras, name)
+            if isinstance(value, torch.Tensor):
+                value = value[chunk_indices].to(device)
+            elif isinstance(value, list):
+                value = [value[i].to(device) for i in chunk_indices.tolist()]
+            values[name] = value
+        for i in range(chunk_indices.shape[0]):
+            yield Camera(**{name: None if value is None else value[i] for name, value in values.items()})
 
 
 def get_count_and_score(
         gaussian_model,
-        cameras: List,
+        cameras: Union[Cameras, List[Camera]],
         anti_aliased: bool,
+        camera_chunk_size: int = 64,
+        subsample_ratio: float = 1.,
+        seed: int = 42,
+        hit_pixel_count_fn: Callable = None,
 ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    :param camera_chunk_size: the number of the cameras moved to the device at once
+    :param subsample_ratio: only a random subset of the cameras is used if less than 1,
+        the scores are the sums over the selected cameras
+    :param hit_pixel_count_fn: `GSplatHitPixelCountRenderer.hit_pixel_count` by default,
+        or `hit_pixel_count_torch` to run without gsplat, e.g. on CPU
+    """
+
+    if hit_pixel_count_fn is None:
+        from internal.renderers.gsplat_hit_pixel_count_renderer import GSplatHitPixelCountRenderer
+        hit_pixel_count_fn = GSplatHitPixelCountRenderer.hit_pixel_count
+
     device = gaussian_model.get_xyz.device
     num_gaussians = gaussian_model.get_xyz.shape[0]
 
@@ -33,15 +78,25 @@ def get_count_and_score(
         device=device,
     )
 
-    # count for each training camera
-    for i in range(len(cameras)):
-        camera = cameras[i]
-        count, opacity_score, alpha_score, visibility_score = GSplatHitPixelCountRenderer.hit_pixel_count(
-            means3D=gaussian_model.get_xyz,
-            opacities=gaussian_model.get_opacity,
-            scales=gaussian_model.get_scaling,
-            rotations=gaussian_model.get_rotation,
-            viewpoint_camera=camera.to_device(device),
+    # the activated values are the same for all the cameras
+    means3D = gaussian_model.get_xyz
+    opacities = gaussian_model.get_opacity
+    scales = gaussian_model.get_scaling
+    rotations = gaussian_model.get_rotation
+
+    camera_indices = torch.arange(len(cameras))
+    if subsample_ratio < 1.:
+        n_selected = max(int(round(len(cameras) * subsample_ratio)), 1)
+        camera_indices = torch.randperm(len(cameras), generator=torch.Generator().manual_seed(seed))[:n_selected].sort().values
+
+    # count for each selected camera
+    for camera in iterate_cameras(cameras, camera_indices, camera_chunk_size, device):
+        count, opacity_score, alpha_score, visibility_score = hit_pixel_count_fn(
+            means3D=means3D,
+            opacities=opacities,
+            scales=scales,
+            rotations=rotations,
+            viewpoint_camera=camera,
             anti_aliased=anti_aliased,
         )
         # add to total
@@ -53,6 +108,120 @@ def get_count_and_score(
     return count_total, opacity_score_total, alpha_score_total, visibility_score_total
 
 
+def hit_pixel_count_torch(
+        means3D: torch.Tensor,  # xyz
+        opacities: torch.Tensor,
+        scales: torch.Tensor,
+        rotations: torch.Tensor,  # remember to normalize them yourself
+        viewpoint_camera,
+        scaling_modifier=1.0,
+        anti_aliased: bool = True,
+        block_size: int = 16,
+        max_tile_pairs: int = 1 << 22,
+):
+    """
+    A pure PyTorch implementation of `GSplatHitPixelCountRenderer.hit_pixel_count`, runnable on CPU.
+    It is much slower than the CUDA one, intended for testing and offline pruning.
+
+    :param max_tile_pairs: the maximum number of (pixel, Gaussian) pairs evaluated at once
+    :return: for every Gaussian, the number of the pixels it contributes to,
+        and the sums of its opacity, alpha and alpha * transmittance over these pixels
+    """
+
+    from internal.utils.gaussian_projection import project_gaussians
+
+    xys, depths, radii, conics, comp, num_tiles_hit, _, mask, rect_min, rect_max = project_gaussians(
+        means_3d=means3D,
+        scales=scales,
+        scale_modifier=scaling_modifier,
+        quaternions=rotations,
+        world_to_camera=viewpoint_camera.world_to_camera,
+        fx=viewpoint_camera.fx,
+        fy=viewpoint_camera.fy,
+        cx=viewpoint_camera.cx,
+        cy=viewpoint_camera.cy,
+        img_height=viewpoint_camera.height,
+        img_width=viewpoint_camera.width,
+        block_width=block_size,
+    )
+
+    opacities = opacities.squeeze(-1)
+    if anti_aliased is True:
+        opacities = opacities * comp
+
+    n = means3D.shape[0]
+    device = means3D.device
+    count = torch.zeros((n,), dtype=torch.int, device=device)
+    opacity_score = torch.zeros((n,), dtype=torch.float, device=device)
+    alpha_score = torch.zeros((n,), dtype=torch.float, device=device)
+    visibility_score = torch.zeros((n,), dtype=torch.float, device=device)
+
+    width = int(viewpoint_camera.width.item())
+    height = int(viewpoint_camera.height.item())
+    n_tile_columns = (width + block_size - 1) // block_size
+
+    # duplicate every visible Gaussian for each tile it touches
+    gaussian_ids = torch.nonzero(mask).squeeze(-1)
+    n_tiles = num_tiles_hit[gaussian_ids].long()
+    pair_gaussian_ids = torch.repeat_interleave(gaussian_ids, n_tiles)
+    pair_offsets = torch.repeat_interleave(torch.cumsum(n_tiles, dim=0) - n_tiles, n_tiles)
+    local_tile_ids = torch.arange(pair_gaussian_ids.shape[0], device=device) - pair_offsets
+    rect_width = (rect_max[:, 0] - rect_min[:, 0]).long()[pair_gaussian_ids]
+    tile_x = rect_min[pair_gaussian_ids, 0].long() + local_tile_ids % rect_width
+    tile_y = rect_min[pair_gaussian_ids, 1].long() + local_tile_ids // rect_width
+    pair_tile_ids = tile_y * n_tile_columns + tile_x
+
+    # sort by the tile, then by the depth
+    order = torch.argsort(depths[pair_gaussian_ids], stable=True)
+    order = order[torch.argsort(pair_tile_ids[order], stable=True)]
+    pair_gaussian_ids = pair_gaussian_ids[order]
+    tile_ids, tile_pair_counts = torch.unique_consecutive(pair_tile_ids[order], return_counts=True)
+
+    # the pixel centers inside a tile, the 0.5 offset is omitted by the projection
+    pixel_y, pixel_x = torch.meshgrid(torch.arange(block_size, device=device), torch.arange(block_size, device=device), indexing="ij")
+    pixel_offsets = torch.stack([pixel_x.flatten(), pixel_y.flatten()], dim=-1)
+
+    start = 0
+    for tile_id, n_pairs in zip(tile_ids.tolist(), tile_pair_counts.tolist()):
+        ids = pair_gaussian_ids[start:start + n_pairs]
+        start += n_pairs
+
+        tile_origin = torch.tensor([tile_id % n_tile_columns, tile_id // n_tile_columns], device=device) * block_size
+        pixels = tile_origin + pixel_offsets
+        pixels = pixels[torch.logical_and(pixels[:, 0] < width, pixels[:, 1] < height)].to(xys.dtype) + 0.5
+
+        # pixels are independent, so they can be split into chunks, while the Gaussians of a pixel can not
+        pixel_chunk_size = max(max_tile_pairs // n_pairs, 1)
+        for pixel_start in range(0, pixels.shape[0], pixel_chunk_size):
+            delta = xys[ids].unsqueeze(0) - pixels[pixel_start:pixel_start + pixel_chunk_size].unsqueeze(1)  # [n_pixels, n_pairs, 2]
+            conic = conics[ids]
+            sigma = 0.5 * (conic[:, 0] * delta[..., 0] * delta[..., 0] + conic[:, 2] * delta[..., 1] * delta[..., 1]) + \
+                    conic[:, 1] * delta[..., 0] * delta[..., 1]
+            alpha = torch.clamp_max(opacities[ids] * torch.exp(-sigma), 0.99)
+            # skipped without affecting the transmittance
+            alpha = torch.where(torch.logical_or(sigma < 0., alpha < 1. / 255.), 0., alpha)
+
+            transmittance_after = torch.cumprod(1. - alpha, dim=1)
+            transmittance = transmittance_after / (1. - alpha)
+            # the compositing of a pixel terminates before the Gaussian making the transmittance too small
+            contributed = torch.logical_and(alpha > 0., transmittance_after >= 1e-4)
+
+            count.index_add_(0, ids, contributed.sum(dim=0).int())
+            opacity_score.index_add_(0, ids, contributed.sum(dim=0) * opacities[ids])
+            alpha_score.index_add_(0, ids, torch.where(contributed, alpha, 0.).sum(dim=0))
+            visibility_score.index_add_(0, ids, torch.where(contributed, alpha * transmittance, 0.).sum(dim=0))
+
+    return count, opacity_score, alpha_score, visibility_score
+
+
+def get_kth_percent_value(values: torch.Tensor, percent: float) -> torch.Tensor:
+    """
+    :return: the value at `int(percent * (n - 1))` of the ascending sorted `values`, found by `torch.kthvalue` without a full sort
+    """
+
+    return torch.kthvalue(values, int(percent * (values.shape[0] - 1)) + 1, dim=0).values
+
+
 def calculate_v_imp_score(scales, importance_scores, v_pow):
     """
     Copied from LightGaussian: https://github.com/VITA-Group/LightGaussian
@@ -64,10 +233,8 @@ def calculate_v_imp_score(scales, importance_scores, v_pow):
     """
     # Calculate the volume of each Gaussian component
     volume = torch.prod(scales, dim=1)
-    # Determine the kth_percent_largest value
-    index = int(len(volume) * 0.9)
-    sorted_volume, _ = torch.sort(volume, descending=True)
-    kth_percent_largest = sorted_volume[index]
+    # Determine the kth_percent_largest value, i.e. the `int(0.9 * n)`-th of the descending sorted ones
+    kth_percent_largest = torch.kthvalue(volume, len(volume) - int(len(volume) * 0.9)).values
     # Calculate v_list
     v_list = torch.pow(volume / kth_percent_largest, v_pow)
     v_list = v_list * importance_scores
@@ -75,8 +242,6 @@ def calculate_v_imp_score(scales, importance_scores, v_pow):
 
 
 def get_prune_mask(percent, importance_score):
-    sorted_tensor, _ = torch.sort(importance_score, dim=0)
-    index_nth_percentile = int(percent * (sorted_tensor.shape[0] - 1))
-    value_nth_percentile = sorted_tensor[index_nth_percentile]
+    value_nth_percentile = get_kth_percent_value(importance_score, percent)
     prune_mask = (importance_score <= value_nth_percentile).squeeze()
     return prune_mask
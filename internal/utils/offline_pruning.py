@@ -0,0 +1,297 @@
+"""
+Shrink trained models without retraining: prune the less important Gaussians and reduce the SH degree.
+
+The importance is scored on the training cameras stored in the `cameras.json` of the training output,
+with the LightGaussian hit counting, on CPU the pure PyTorch reference one is used.
+The SH are reduced by `sh_distillation`.
+"""
+
+import copy
+import json
+from typing import Literal, Optional
+
+import numpy as np
+import torch
+
+from internal.cameras.cameras import Cameras
+from internal.models.gaussian_model_simplified import GaussianModelSimplified
+from internal.utils.gaussian_utils import Gaussian
+from internal.utils.light_gaussian import get_count_and_score, calculate_v_imp_score, hit_pixel_count_torch
+from internal.utils.sh_distillation import fibonacci_sphere, distill_sh, distill_sh_adaptive
+
+ScoreType = Literal["opacity", "volume", "visibility"]
+
+
+def load_cameras_json(path: str) -> Cameras:
+    """
+    The principal points are not stored in `cameras.json`, they are assumed to be the image centers
+    """
+
+    with open(path, "r") as f:
+        cameras = json.load(f)
+
+    c2w = torch.eye(4, dtype=torch.float64).repeat(len(cameras), 1, 1)
+    c2w[:, :3, :3] = torch.tensor([i["rotation"] for i in cameras], dtype=torch.float64)
+    c2w[:, :3, 3] = torch.tensor([i["position"] for i in cameras], dtype=torch.float64)
+    w2c = torch.linalg.inv(c2w).to(torch.float)
+
+    n = len(cameras)
+    width = torch.tensor([i["width"] for i in cameras], dtype=torch.int)
+    height = torch.tensor([i["height"] for i in cameras], dtype=torch.int)
+    return Cameras(
+        R=w2c[:, :3, :3],
+        T=w2c[:, :3, 3],
+        fx=torch.tensor([i["fx"] for i in cameras], dtype=torch.float),
+        fy=torch.tensor([i["fy"] for i in cameras], dtype=torch.float),
+        cx=width / 2.,
+        cy=height / 2.,
+        width=width,
+        height=height,
+        appearance_id=torch.zeros((n,), dtype=torch.int),
+        normalized_appearance_id=torch.zeros((n,), dtype=torch.float),
+        distortion_params=None,
+        camera_type=torch.zeros((n,), dtype=torch.int),
+    )
+
+
+def to_gaussian_model(gaussian: Gaussian, device) -> GaussianModelSimplified:
+    """
+    :param gaussian: in parameter structure
+    """
+
+    return GaussianModelSimplified(
+        xyz=gaussian.xyz,
+        features_dc=gaussian.features_dc,
+        features_rest=gaussian.features_rest,
+        scaling=gaussian.scales,
+        rotation=gaussian.rotations,
+        opacity=gaussian.opacities,
+        features_extra=gaussian.real_features_extra,
+        sh_degree=gaussian.sh_degrees,
+        device=device,
+    )
+
+
+@torch.no_grad()
+def get_importance_score(
+        gaussian_model,
+        cameras: Optional[Cameras],
+        score_type: ScoreType,
+        anti_aliased: bool = False,
+        v_pow: float = 0.1,
+        camera_chunk_size: int = 64,
+        subsample_ratio: float = 1.,
+) -> torch.Tensor:
+    """
+    :param score_type:
+        opacity: the opacities, no cameras required;
+        volume: the LightGaussian volume-weighted importance score;
+        visibility: the sums of the alpha * transmittance over the pixels of the training cameras
+    :return: [n], the larger the more important
+    """
+
+    if score_type == "opacity":
+        return gaussian_model.get_opacity.squeeze(-1)
+
+    assert cameras is not None, "cameras are required by the '{}' score".format(score_type)
+    hit_pixel_count_fn = None
+    if gaussian_model.get_xyz.device.type == "cpu":
+        hit_pixel_count_fn = hit_pixel_count_torch
+    _, opacity_score, _, visibility_score = get_count_and_score(
+        gaussian_model,
+        cameras,
+        anti_aliased,
+        camera_chunk_size=camera_chunk_size,
+        subsample_ratio=subsample_ratio,
+        hit_pixel_count_fn=hit_pixel_count_fn,
+    )
+
+    if score_type == "volume":
+        return calculate_v_imp_score(gaussian_model.get_scaling, opacity_score, v_pow)
+    if score_type == "visibility":
+        return visibility_score
+    raise ValueError("unknown score type '{}'".format(score_type))
+
+
+def get_n_keep(n: int, target_count: int = -1, prune_percent: float = -1.) -> int:
+    """
+    :return: the number of the Gaussians to keep, either `target_count`, or the ones remaining after pruning `prune_percent` of them
+    """
+
+    assert target_count < 0 or prune_percent < 0, "only one of `target_count` and `prune_percent` can be provided"
+    if target_count < 0 and prune_percent < 0:
+        return n
+    if target_count >= 0:
+        return min(target_count, n)
+    assert prune_percent <= 1., "`prune_percent` should be in [0, 1]"
+    return n - int(round(n * prune_percent))
+
+
+def get_keep_mask(score: torch.Tensor, n_keep: int) -> torch.Tensor:
+    """
+    :return: [n], the ones with the `n_keep` largest scores
+    """
+
+    mask = torch.zeros_like(score, dtype=torch.bool)
+    mask[torch.topk(score, n_keep, sorted=False).indices] = True
+    return mask
+
+
+def select_gaussians(gaussian: Gaussian, mask: torch.Tensor) -> Gaussian:
+    """
+    :param gaussian: in parameter structure
+    """
+
+    mask = mask.to(gaussian.xyz.device)
+    return Gaussian(
+        sh_degrees=gaussian.sh_degrees,
+        xyz=gaussian.xyz[mask],
+        opacities=gaussian.opacities[mask],
+        features_dc=gaussian.features_dc[mask],
+        features_rest=gaussian.features_rest[mask],
+        scales=gaussian.scales[mask],
+        rotations=gaussian.rotations[mask],
+        real_features_extra=gaussian.real_features_extra[mask],
+        adaptive_sh_degrees=None if gaussian.adaptive_sh_degrees is None else gaussian.adaptive_sh_degrees[mask],
+    )
+
+
+def reduce_sh_degree(
+        gaussian: Gaussian,
+        sh_degree: int,
+        directions: Optional[torch.Tensor] = None,
+        max_error: float = -1.,
+) -> Gaussian:
+    """
+    :param gaussian: in parameter structure
+    :param sh_degree: the target SH degree, or the minimum one in the adaptive mode
+    :param directions: [m, 3] or [n, m, 3], where the colors are fitted, default: 256 directions uniformly distributed on the sphere
+    :param max_error: enable the adaptive mode if not negative,
+        every Gaussian keeps the lowest degree whose RMS color error is not larger than it
+    """
+
+    assert gaussian.adaptive_sh_degrees is None, "the SH have been distilled"
+    assert 0 <= sh_degree <= gaussian.sh_degrees, "can not increase the SH degree from {} to {}".format(gaussian.sh_degrees, sh_degree)
+    if directions is None:
+        directions = fibonacci_sphere(256, device=gaussian.xyz.device)
+
+    features = torch.concat([gaussian.features_dc, gaussian.features_rest], dim=1)
+    adaptive_sh_degrees = None
+    if max_error >= 0:
+        features, adaptive_sh_degrees = distill_sh_adaptive(features, gaussian.sh_degrees, max_error, directions, min_sh_degree=sh_degree)
+        sh_degree = gaussian.sh_degrees
+    else:
+        features, _ = distill_sh(features, gaussian.sh_degrees, sh_degree, directions)
+
+    return Gaussian(
+        sh_degrees=sh_degree,
+        xyz=gaussian.xyz,
+        opacities=gaussian.opacities,
+        features_dc=features[:, :1],
+        features_rest=features[:, 1:],
+        scales=gaussian.scales,
+        rotations=gaussian.rotations,
+        real_features_extra=gaussian.real_features_extra,
+        adaptive_sh_degrees=adaptive_sh_degrees,
+    )
+
+
+def get_n_bytes(gaussian: Gaussian) -> int:
+    """
+    :return: the size of the parameters in float32
+    """
+
+    return 4 * sum(np.prod(getattr(gaussian, i).shape).item() for i in [
+        "xyz", "opacities", "features_dc", "features_rest", "scales", "rotations", "real_features_extra",
+    ])
+
+
+def update_checkpoint(checkpoint: dict, gaussian: Gaussian, mask: torch.Tensor) -> dict:
+    """
+    Replace the Gaussians of a checkpoint with the pruned ones.
+    The optimizer states of the Gaussians are pruned in the same way as `GaussianModel._prune_optimizer()`,
+    and the ones of the SH coefficients are truncated to the reduced degree, so the training can be resumed from it.
+    The adaptive SH degrees are not stored, the higher coefficients are zeros, so the colors are the same.
+
+    :param gaussian: the pruned one, in parameter structure
+    :param mask: the kept ones of the Gaussians in the `checkpoint`
+    """
+
+    checkpoint = copy.copy(checkpoint)
+    checkpoint["state_dict"] = copy.copy(checkpoint["state_dict"])
+    for key, value in [
+        ("_xyz", gaussian.xyz),
+        ("_features_dc", gaussian.features_dc),
+        ("_features_rest", gaussian.features_rest),
+        ("_scaling", gaussian.scales),
+        ("_rotation", gaussian.rotations),
+        ("_opacity", gaussian.opacities),
+        ("_features_extra", gaussian.real_features_extra),
+    ]:
+        checkpoint["state_dict"]["gaussian_model.{}".format(key)] = value.cpu()
+
+    if "gaussian_model_extra_state_dict" in checkpoint:
+        extra_state_dict = dict(checkpoint["gaussian_model_extra_state_dict"])
+        for key, value in extra_state_dict.items():
+            if isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == mask.shape[0]:
+                extra_state_dict[key] = value[mask.to(value.device)]
+        if "active_sh_degree" in extra_state_dict:
+            extra_state_dict["active_sh_degree"] = min(extra_state_dict["active_sh_degree"], gaussian.sh_degrees)
+        checkpoint["gaussian_model_extra_state_dict"] = extra_state_dict
+
+    if "hyper_parameters" in checkpoint:
+        checkpoint["hyper_parameters"] = copy.copy(checkpoint["hyper_parameters"])
+        checkpoint["hyper_parameters"]["gaussian"] = copy.deepcopy(checkpoint["hyper_parameters"]["gaussian"])
+        checkpoint["hyper_parameters"]["gaussian"].sh_degree = gaussian.sh_degrees
+
+    if "optimizer_states" in checkpoint:
+        checkpoint["optimizer_states"] = [prune_optimizer_state(i, gaussian, mask) for i in checkpoint["optimizer_states"]]
+
+    return checkpoint
+
+
+# the names of the Gaussian param groups in `GaussianModel.training_setup()`
+PARAM_GROUP_ATTRIBUTES = {
+    "xyz": "xyz",
+    "f_dc": "features_dc",
+    "f_rest": "features_rest",
+    "opacity": "opacities",
+    "scaling": "scales",
+    "rotation": "rotations",
+    "f_extra": "real_features_extra",
+}
+
+
+def prune_optimizer_state(optimizer_state: dict, gaussian: Gaussian, mask: torch.Tensor) -> dict:
+    """
+    :return: a new optimizer state dict, the per-Gaussian states of the Gaussian param groups are pruned by `mask`,
+        and resized to the shapes of the pruned parameters, the others are kept
+    """
+
+    if "state" not in optimizer_state or "param_groups" not in optimizer_state:
+        return optimizer_state
+
+    optimizer_state = copy.copy(optimizer_state)
+    optimizer_state["state"] = copy.copy(optimizer_state["state"])
+    for param_group in optimizer_state["param_groups"]:
+        attribute = PARAM_GROUP_ATTRIBUTES.get(param_group.get("name", None), None)
+        if attribute is None:
+            continue
+        param_shape = getattr(gaussian, attribute).shape
+        for param_id in param_group["params"]:
+            state = optimizer_state["state"].get(param_id, None)
+            if state is None:
+                continue
+            # the state dicts may be the ones of the live optimizer, do not modify them in place
+            state = optimizer_state["state"][param_id] = state.copy()
+            for key, value in state.items():
+                # `exp_avg`, `exp_avg_sq`, and the per-Gaussian `step` of SparseAdam
+                if isinstance(value, torch.Tensor) is False or value.dim() == 0 or value.shape[0] != mask.shape[0]:
+                    continue
+                value = value[mask.to(value.device)]
+                if value.dim() > 1 and value.shape[1:] != param_shape[1:]:
+                    # the SH coefficients of the reduced degree
+                    value = value[(slice(None),) + tuple(slice(0, i) for i in param_shape[1:])]
+                state[key] = value
+
+    return optimizer_state
@@ -0,0 +1,300 @@
+"""
+Split a large scene into spatial partitions that can be trained independently, then merge them.
+
+The scene is split by a grid on the two horizontal axes.
+Every partition has a core region, the cells of the grid, the outermost ones extend to infinity,
+so every location in the scene belongs to exactly one core region.
+The points and cameras are assigned to a partition by its core region expanded by a margin,
+the cameras seeing enough of the core region are assigned too.
+After training, only the Gaussians inside the core region of each partition are kept.
+"""
+
+import os
+import json
+from dataclasses import dataclass
+from typing import Tuple, List, Optional
+
+import numpy as np
+import torch
+
+import internal.utils.colmap as colmap_utils
+from internal.cameras.cameras import Cameras
+from internal.utils.gaussian_utils import Gaussian
+
+
+@dataclass
+class Partition:
+    id: Tuple[int, int]  # (row, column)
+    core_bounds: torch.Tensor  # [2, 2], [[min_a, min_b], [max_a, max_b]] on the partition axes, may be infinite
+    bounds: torch.Tensor  # [2, 2], the core bounds expanded by the margin
+    image_indices: torch.Tensor  # [n_images]
+    point_indices: torch.Tensor  # [n_points]
+
+    @property
+    def name(self) -> str:
+        return "partition_{}_{}".format(*self.id)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": list(self.id),
+            "name": self.name,
+            "core_bounds": self.core_bounds.tolist(),
+            "bounds": self.bounds.tolist(),
+            "image_indices": self.image_indices.tolist(),
+            "n_points": int(self.point_indices.shape[0]),
+        }
+
+
+def get_partition_axes(camera_centers: torch.Tensor) -> Tuple[int, int]:
+    """
+    The two axes the camera centers spread most along, the remaining one is assumed to be the up axis
+    """
+
+    spread = camera_centers.max(dim=0).values - camera_centers.min(dim=0).values
+    axes = torch.argsort(spread, descending=True)[:2].sort().values
+    return int(axes[0]), int(axes[1])
+
+
+def is_in_bounds(xyz: torch.Tensor, axes: Tuple[int, int], bounds: torch.Tensor) -> torch.Tensor:
+    """
+    The lower bounds are inclusive and the upper ones are exclusive, so the core regions do not overlap
+    """
+
+    xy = xyz[:, list(axes)]
+    return torch.all(torch.logical_and(xy >= bounds[0], xy < bounds[1]), dim=-1)
+
+
+def get_visible_ratio(cameras: Cameras, points: torch.Tensor) -> torch.Tensor:
+    """
+    Occlusions are not considered.
+
+    :return: [n_cameras], the ratio of the points inside the view frustum of each camera
+    """
+
+    if points.shape[0] == 0:
+        return torch.zeros((len(cameras),))
+
+    points = torch.concat([points, torch.ones_like(points[:, :1])], dim=-1)
+    # [n_cameras, n_points, 4], the world_to_camera matrices are transposed
+    points_in_camera = points.unsqueeze(0) @ cameras.world_to_camera
+    z = points_in_camera[..., 2]
+    safe_z = z.clamp_min(1e-6)
+    u = points_in_camera[..., 0] / safe_z * cameras.fx[:, None] + cameras.cx[:, None]
+    v = points_in_camera[..., 1] / safe_z * cameras.fy[:, None] + cameras.cy[:, None]
+    visible = (z > 1e-6) & (u >= 0) & (u < cameras.width[:, None]) & (v >= 0) & (v < cameras.height[:, None])
+    return visible.to(torch.float).mean(dim=-1)
+
+
+def get_grid_boundaries(values: torch.Tensor, n: int) -> torch.Tensor:
+    """
+    :return: [n + 1], split at the quantiles, so the cells have roughly the same number of cameras
+    """
+
+    quantiles = torch.quantile(values.to(torch.float64), torch.linspace(0, 1, n + 1, dtype=torch.float64)[1:-1]).to(torch.float)
+    return torch.concat([torch.tensor([-torch.inf]), quantiles, torch.tensor([torch.inf])])
+
+
+def plan_partitions(
+        cameras: Cameras,
+        points: torch.Tensor,
+        grid: Tuple[int, int],
+        margin: float = 0.2,
+        visibility_threshold: float = 0.25,
+        max_visibility_points: int = 4096,
+        axes: Optional[Tuple[int, int]] = None,
+        seed: int = 42,
+) -> Tuple[Tuple[int, int], List[Partition]]:
+    """
+    :param cameras: all the cameras of the scene
+    :param points: [n, 3], the sparse point cloud
+    :param grid: (n_rows, n_columns), the rows are split along the first axis
+    :param margin: the core region is expanded by `margin * cell size` on every side
+    :param visibility_threshold: the cameras seeing at least this ratio of the core points are assigned to the partition
+    :param max_visibility_points: the number of the core points sampled for the visibility test
+    :return: the partition axes, and the partitions
+    """
+
+    camera_centers = cameras.camera_center
+    if axes is None:
+        axes = get_partition_axes(camera_centers)
+    camera_xy = camera_centers[:, list(axes)]
+
+    # the size of the outermost cells are measured by the extent of the cameras
+    boundaries = [get_grid_boundaries(camera_xy[:, i], grid[i]) for i in range(2)]
+    finite_boundaries = []
+    for i in range(2):
+        b = boundaries[i].clone()
+        b[0] = camera_xy[:, i].min()
+        b[-1] = camera_xy[:, i].max()
+        finite_boundaries.append(b)
+
+    generator = torch.Generator().manual_seed(seed)
+    partitions = []
+    for row in range(grid[0]):
+        for column in range(grid[1]):
+            core_bounds = torch.tensor([
+                [boundaries[0][row], boundaries[1][column]],
+                [boundaries[0][row + 1], boundaries[1][column + 1]],
+            ])
+            cell_size = torch.tensor([
+                finite_boundaries[0][row + 1] - finite_boundaries[0][row],
+                finite_boundaries[1][column + 1] - finite_boundaries[1][column],
+            ])
+            bounds = torch.stack([core_bounds[0] - margin * cell_size, core_bounds[1] + margin * cell_size])
+
+            point_indices = torch.nonzero(is_in_bounds(points, axes, bounds)).squeeze(-1)
+
+            # the cameras inside the expanded region, and the ones seeing the core region
+            is_image_selected = is_in_bounds(camera_centers, axes, bounds)
+            core_points = points[is_in_bounds(points, axes, core_bounds)]
+            if core_points.shape[0] > max_visibility_points:
+                core_points = core_points[torch.randperm(core_points.shape[0], generator=generator)[:max_visibility_points]]
+            is_image_selected |= get_visible_ratio(cameras, core_points) >= visibility_threshold
+
+            partitions.append(Partition(
+                id=(row, column),
+                core_bounds=core_bounds,
+                bounds=bounds,
+                image_indices=torch.nonzero(is_image_selected).squeeze(-1),
+                point_indices=point_indices,
+            ))
+
+    return axes, partitions
+
+
+def save_partitions(path: str, axes: Tuple[int, int], partitions: List[Partition], image_names: List[str] = None):
+    with open(path, "w") as f:
+        json.dump({
+            "axes": list(axes),
+            "partitions": [i.to_dict() for i in partitions],
+            "image_names": image_names,
+        }, f, indent=4)
+
+
+def load_partitions(path: str) -> Tuple[Tuple[int, int], List[dict]]:
+    """
+    :return: the partition axes, and the partitions, with their core bounds converted to tensors
+    """
+
+    with open(path, "r") as f:
+        planned = json.load(f)
+    partitions = planned["partitions"]
+    for i in partitions:
+        i["core_bounds"] = torch.tensor(i["core_bounds"])
+        i["bounds"] = torch.tensor(i["bounds"])
+    return tuple(planned["axes"]), partitions
+
+
+def trim_gaussian(gaussian: Gaussian, axes: Tuple[int, int], core_bounds: torch.Tensor) -> Gaussian:
+    """
+    Only keep the Gaussians inside the core region, works with both the parameter and ply structures
+    """
+
+    xyz = torch.as_tensor(gaussian.xyz)
+    mask = is_in_bounds(xyz, axes, core_bounds.to(xyz.dtype))
+    if not isinstance(gaussian.xyz, torch.Tensor):
+        mask = mask.numpy()
+
+    return Gaussian(
+        sh_degrees=gaussian.sh_degrees,
+        xyz=gaussian.xyz[mask],
+        opacities=gaussian.opacities[mask],
+        features_dc=gaussian.features_dc[mask],
+        features_rest=gaussian.features_rest[mask],
+        scales=gaussian.scales[mask],
+        rotations=gaussian.rotations[mask],
+        real_features_extra=gaussian.real_features_extra[mask],
+    )
+
+
+def merge_gaussians(gaussians: List[Gaussian]) -> Gaussian:
+    assert len(gaussians) > 0
+    assert all(i.sh_degrees == gaussians[0].sh_degrees for i in gaussians), "SH degrees of the partitions must be the same"
+
+    def concat(name: str):
+        values = [getattr(i, name) for i in gaussians]
+        if isinstance(values[0], torch.Tensor):
+            return torch.concat(values, dim=0)
+        return np.concatenate(values, axis=0)
+
+    return Gaussian(
+        sh_degrees=gaussians[0].sh_degrees,
+        xyz=concat("xyz"),
+        opacities=concat("opacities"),
+        features_dc=concat("features_dc"),
+        features_rest=concat("features_rest"),
+        scales=concat("scales"),
+        rotations=concat("rotations"),
+        real_features_extra=concat("real_features_extra"),
+    )
+
+
+def merge_partitions(gaussians: List[Gaussian], axes: Tuple[int, int], core_bounds: List[torch.Tensor]) -> Gaussian:
+    """
+    :param gaussians: the trained Gaussians of every partition
+    :param core_bounds: the core bounds of every partition, the same order as `gaussians`
+    """
+
+    return merge_gaussians([trim_gaussian(g, axes, b) for g, b in zip(gaussians, core_bounds)])
+
+
+def cameras_from_colmap(colmap_cameras: dict, colmap_images: dict) -> Cameras:
+    """
+    Only the pinhole part of the camera models is used, enough for the visibility test
+
+    :param colmap_images: should be sorted by the image ids
+    """
+
+    R_list, T_list, fx_list, fy_list, cx_list, cy_list, width_list, height_list = [], [], [], [], [], [], [], []
+    for image in colmap_images.values():
+        camera = colmap_cameras[image.camera_id]
+        if camera.model in ["SIMPLE_PINHOLE", "SIMPLE_RADIAL", "RADIAL", "SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE"]:
+            fx, cx, cy = camera.params[:3]
+            fy = fx
+        else:
+            fx, fy, cx, cy = camera.params[:4]
+        R_list.append(image.qvec2rotmat())
+        T_list.append(image.tvec)
+        fx_list.append(fx)
+        fy_list.append(fy)
+        cx_list.append(cx)
+        cy_list.append(cy)
+        width_list.append(camera.width)
+        height_list.append(camera.height)
+
+    n = len(R_list)
+    return Cameras(
+        R=torch.tensor(np.stack(R_list), dtype=torch.float),
+        T=torch.tensor(np.stack(T_list), dtype=torch.float),
+        fx=torch.tensor(fx_list, dtype=torch.float),
+        fy=torch.tensor(fy_list, dtype=torch.float),
+        cx=torch.tensor(cx_list, dtype=torch.float),
+        cy=torch.tensor(cy_list, dtype=torch.float),
+        width=torch.tensor(width_list, dtype=torch.int),
+        height=torch.tensor(height_list, dtype=torch.int),
+        appearance_id=torch.zeros((n,), dtype=torch.int),
+        normalized_appearance_id=torch.zeros((n,), dtype=torch.float),
+        distortion_params=None,
+        camera_type=torch.zeros((n,), dtype=torch.int),
+    )
+
+
+def write_colmap_partition(path: str, partition: Partition, colmap_cameras: dict, colmap_images: dict, colmap_points: dict):
+    """
+    Write the sparse model of a partition to `path/sparse/`, only contains the images and points assigned to it
+
+    :param colmap_images: in the same order as the one used for planning
+    :param colmap_points: in the same order as the one used for planning
+    """
+
+    image_list = list(colmap_images.values())
+    point_list = list(colmap_points.values())
+    images = {image_list[i].id: image_list[i] for i in partition.image_indices.tolist()}
+    points = {point_list[i].id: point_list[i] for i in partition.point_indices.tolist()}
+    cameras = {i: colmap_cameras[i] for i in set(image.camera_id for image in images.values())}
+
+    sparse_dir = os.path.join(path, "sparse")
+    os.makedirs(sparse_dir, exist_ok=True)
+    colmap_utils.write_cameras_binary(cameras, os.path.join(sparse_dir, "cameras.bin"))
+    colmap_utils.write_images_binary(images, os.path.join(sparse_dir, "images.bin"))
+    colmap_utils.write_points3D_binary(points, os.path.join(sparse_dir, "points3D.bin"))
@@ -0,0 +1,86 @@
+from typing import Tuple, Optional, Union
+
+import torch
+
+from internal.cameras.cameras import Camera
+
+
+class PatchSampler:
+    """
+    Sample a patch of the training image, then only the patch is rendered and supervised
+    """
+
+    def __init__(self, patch_size: Tuple[int, int], sampling: str = "random", generator: torch.Generator = None):
+        assert sampling in ["random", "grid"], "unsupported sampling strategy '{}'".format(sampling)
+        self.patch_size = patch_size
+        self.sampling = sampling
+        self.generator = generator
+
+    def _randint(self, high: int) -> int:
+        return int(torch.randint(high, (1,), generator=self.generator).item())
+
+    def sample(self, image_width: int, image_height: int) -> Optional[Tuple[int, int, int, int]]:
+        """
+        :return: (x, y, width, height), or None if the image is not larger than the patch
+        """
+
+        width = min(self.patch_size[0], image_width)
+        height = min(self.patch_size[1], image_height)
+        if width == image_width and height == image_height:
+            return None
+
+        if self.sampling == "grid":
+            n_columns = -(-image_width // width)
+            n_rows = -(-image_height // height)
+            cell = self._randint(n_columns * n_rows)
+            # the last row and column are aligned to the image border
+            x = min((cell % n_columns) * width, image_width - width)
+            y = min((cell // n_columns) * height, image_height - height)
+        else:
+            x = self._randint(image_width - width + 1)
+            y = self._randint(image_height - height + 1)
+
+        return x, y, width, height
+
+    def __call__(self, camera: Camera, image_info: Tuple) -> Tuple[Camera, Tuple, Optional[Tuple[int, int, int, int]]]:
+        """
+        :return: the cropped camera and image info, and the patch
+        """
+
+        patch = self.sample(int(camera.width), int(camera.height))
+        if patch is None:
+            return camera, image_info, None
+
+        x, y, width, height = patch
+        image_name, gt_image, mask = image_info
+        # slicing does not copy
+        gt_image = gt_image[..., y:y + height, x:x + width]
+        if mask is not None:
+            mask = mask[..., y:y + height, x:x + width]
+
+        return camera.crop(x, y, width, height), (image_name, gt_image, mask), patch
+
+    @staticmethod
+    def get_viewspace_points_grad_scale(
+            grad_scale: Optional[float],
+            image_width: int,
+            image_height: int,
+            patch: Tuple[int, int, int, int],
+    ) -> Union[float, torch.Tensor]:
+        """
+        Convert the gradients of the 2D means to their full image equivalents,
+        so the densification threshold has the same meaning as in full image training.
+
+        :param grad_scale: the `viewspace_points_grad_scale` returned by the renderer, None if the gradients are in the NDC space
+        """
+
+        _, _, width, height = patch
+        # the loss is averaged over the patch pixels, rather than the full image ones
+        pixel_ratio = (width * height) / (image_width * image_height)
+
+        if grad_scale is None:
+            # NDC of the patch to NDC of the full image, per axis
+            return torch.tensor([image_width / width, image_height / height]) * pixel_ratio
+
+        # the renderer scales the pixel space gradients by half of the longer side of the rendered image
+        return grad_scale * (max(image_width, image_height) / max(width, height)) * pixel_ratio
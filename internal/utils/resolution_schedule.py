@@ -0,0 +1,69 @@
+from typing import Tuple, Optional, List
+
+import torch
+import torch.nn.functional as F
+
+from internal.cameras.cameras import Camera
+
+
+def get_downsampled_size(width: int, height: int, factor: int) -> Tuple[int, int]:
+    return max(1, width // factor), max(1, height // factor)
+
+
+def downsample_image(image: torch.Tensor, mask: Optional[torch.Tensor], factor: int) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """
+    :param image: [C, H, W]
+    :param mask: [1, H, W], bool
+    """
+
+    width, height = get_downsampled_size(image.shape[-1], image.shape[-2], factor)
+    image = F.interpolate(image.unsqueeze(0), size=(height, width), mode="area").squeeze(0)
+    if mask is not None:
+        # keep the pixels that are mostly valid
+        mask = F.interpolate(mask.unsqueeze(0).to(torch.float), size=(height, width), mode="area").squeeze(0) > 0.5
+    return image, mask
+
+
+def build_image_pyramid(image: torch.Tensor, mask: Optional[torch.Tensor], factors: List[int]) -> dict:
+    """
+    :return: {factor: (image, mask)}
+    """
+
+    return {factor: downsample_image(image, mask, factor) for factor in factors if factor > 1}
+
+
+class ResolutionScheduler:
+    """
+    Train at the coarse resolutions first.
+    The ground truth images are taken from the pyramids built by the `Dataset`, or downsampled here if not available.
+    """
+
+    def __init__(self, factors: List[int], milestones: List[int]):
+        assert len(factors) == len(milestones), "the number of factors and milestones must be the same"
+        assert all(milestones[i] < milestones[i + 1] for i in range(len(milestones) - 1)), "milestones must be increasing"
+        self.factors = factors
+        self.milestones = milestones
+
+    def get_factor(self, step: int) -> int:
+        for factor, milestone in zip(self.factors, self.milestones):
+            if step < milestone:
+                return factor
+        return 1
+
+    def __call__(self, step: int, camera: Camera, image_info: Tuple) -> Tuple[Camera, Tuple, int]:
+        """
+        :return: the resized camera and the image info at the resolution of the step, and the downsample factor
+        """
+
+        image_name, gt_image, mask = image_info[:3]
+        factor = self.get_factor(step)
+        if factor == 1:
+            return camera, (image_name, gt_image, mask), factor
+
+        pyramid = image_info[3] if len(image_info) > 3 else None
+        if pyramid is not None and factor in pyramid:
+            gt_image, mask = pyramid[factor]
+        else:
+            gt_image, mask = downsample_image(gt_image, mask, factor)
+
+        return camera.resize(gt_image.shape[-1], gt_image.shape[-2]), (image_name, gt_image, mask), factor
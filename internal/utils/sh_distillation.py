@@ -0,0 +1,164 @@
+"""
+Fit lower degree SH to the colors of the higher degree ones, to reduce the SH evaluation cost and the memory of the deployed models.
+
+The colors are the clamped ones the renderers produce, sampled on a set of view directions,
+either shared by all the Gaussians or specific to every Gaussian, e.g. the directions from the training cameras.
+The fitting is a least squares solve, batched over the Gaussians.
+"""
+
+import math
+from typing import Tuple, List
+
+import torch
+
+from internal.utils.sh_utils import eval_sh
+
+
+def fibonacci_sphere(n: int, device=None) -> torch.Tensor:
+    """
+    :return: [n, 3], nearly uniformly distributed unit directions
+    """
+
+    i = torch.arange(n, dtype=torch.float, device=device) + 0.5
+    z = 1. - 2. * i / n
+    r = torch.sqrt(torch.clamp_min(1. - z * z, 0.))
+    theta = math.pi * (3. - math.sqrt(5.)) * i
+    return torch.stack([r * torch.cos(theta), r * torch.sin(theta), z], dim=-1)
+
+
+def get_camera_directions(xyz: torch.Tensor, camera_centers: torch.Tensor) -> torch.Tensor:
+    """
+    :return: [n, n_cameras, 3], the directions from the cameras to the Gaussians
+    """
+
+    return torch.nn.functional.normalize(xyz.unsqueeze(1) - camera_centers.unsqueeze(0), dim=-1)
+
+
+def get_sh_basis(sh_degree: int, directions: torch.Tensor) -> torch.Tensor:
+    """
+    :return: [..., (sh_degree + 1) ** 2], the SH bases evaluated at `directions`
+    """
+
+    n_coefficients = (sh_degree + 1) ** 2
+    basis = eval_sh(sh_degree, torch.eye(n_coefficients, dtype=directions.dtype, device=directions.device), directions)
+    # the degree 0 one is independent of the directions
+    return basis.expand(*directions.shape[:-1], n_coefficients)
+
+
+def get_colors(sh_degree: int, features: torch.Tensor, directions: torch.Tensor) -> torch.Tensor:
+    """
+    :param features: [n, (sh_degree + 1) ** 2, 3]
+    :param directions: [m, 3] or [n, m, 3]
+    :return: [n, m, 3], the clamped colors, the same as the renderers
+    """
+
+    if directions.dim() == 2:
+        directions = directions.unsqueeze(0)
+    colors = eval_sh(sh_degree, features.transpose(1, 2).unsqueeze(1), directions)
+    return torch.clamp_min(colors.expand(features.shape[0], directions.shape[1], colors.shape[-1]) + 0.5, 0.)
+
+
+@torch.no_grad()
+def distill_sh(
+        features: torch.Tensor,
+        sh_degree: int,
+        target_sh_degree: int,
+        directions: torch.Tensor,
+        ridge: float = 1e-4,
+        chunk_size: int = 16384,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    :param features: [n, (sh_degree + 1) ** 2, 3], including the DC one
+    :param directions: [m, 3] shared by all the Gaussians, or [n, m, 3] for every Gaussian, unit vectors
+    :param ridge: the weight of the L2 regularization, avoid the ill-conditioned solves with few directions
+    :return: [n, (target_sh_degree + 1) ** 2, 3] the fitted features, and [n] the RMS errors of their clamped colors
+    """
+
+    assert 0 <= target_sh_degree <= sh_degree
+    n_coefficients = (target_sh_degree + 1) ** 2
+    identity = ridge * torch.eye(n_coefficients, dtype=features.dtype, device=features.device)
+
+    # the same bases for all the Gaussians, only solve once
+    shared_solution = None
+    if directions.dim() == 2:
+        basis = get_sh_basis(target_sh_degree, directions)  # [m, n_coefficients]
+        shared_solution = torch.linalg.solve(basis.T @ basis + identity, basis.T)  # [n_coefficients, m]
+
+    fitted_list = []
+    error_list = []
+    for start in range(0, features.shape[0], chunk_size):
+        chunk_features = features[start:start + chunk_size]
+        chunk_directions = directions if shared_solution is not None else directions[start:start + chunk_size]
+        # fit the colors without the offset, it is linear to the coefficients
+        target = get_colors(sh_degree, chunk_features, chunk_directions) - 0.5  # [n, m, 3]
+
+        if shared_solution is not None:
+            fitted = torch.einsum("km,nmc->nkc", shared_solution, target)
+        else:
+            basis = get_sh_basis(target_sh_degree, chunk_directions)  # [n, m, n_coefficients]
+            basis_t = basis.transpose(1, 2)
+            fitted = torch.linalg.solve(basis_t @ basis + identity, basis_t @ target)
+
+        error = get_colors(target_sh_degree, fitted, chunk_directions) - 0.5 - target
+        fitted_list.append(fitted)
+        error_list.append(torch.sqrt(torch.mean(error * error, dim=(1, 2))))
+
+    return torch.concat(fitted_list, dim=0), torch.concat(error_list, dim=0)
+
+
+@torch.no_grad()
+def distill_sh_adaptive(
+        features: torch.Tensor,
+        sh_degree: int,
+        max_error: float,
+        directions: torch.Tensor,
+        min_sh_degree: int = 0,
+        ridge: float = 1e-4,
+        chunk_size: int = 16384,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Every Gaussian uses the lowest degree whose RMS color error is not larger than `max_error`,
+    the ones can not satisfy it keep their original features.
+
+    :return: [n, (sh_degree + 1) ** 2, 3] the features, the coefficients higher than their degrees are zeros, and [n] their SH degrees
+    """
+
+    sh_degrees = torch.full((features.shape[0],), sh_degree, dtype=torch.int, device=features.device)
+    distilled = features.clone()
+    remaining = torch.ones((features.shape[0],), dtype=torch.bool, device=features.device)
+
+    for target_sh_degree in range(min_sh_degree, sh_degree):
+        indices = torch.nonzero(remaining).squeeze(-1)
+        if indices.shape[0] == 0:
+            break
+        fitted, error = distill_sh(
+            features[indices],
+            sh_degree,
+            target_sh_degree,
+            directions if directions.dim() == 2 else directions[indices],
+            ridge=ridge,
+            chunk_size=chunk_size,
+        )
+        accepted = error <= max_error
+        accepted_indices = indices[accepted]
+        distilled[accepted_indices] = 0.
+        distilled[accepted_indices, :fitted.shape[1]] = fitted[accepted]
+        sh_degrees[accepted_indices] = target_sh_degree
+        remaining[accepted_indices] = False
+
+    return distilled, sh_degrees
+
+
+def get_sh_degree_groups(sh_degrees: torch.Tensor) -> List[Tuple[int, int, int]]:
+    """
+    :param sh_degrees: [n], sorted
+    :return: [(sh_degree, begin, end), ...], the ranges of the Gaussians sharing the same degree
+    """
+
+    values, counts = torch.unique_consecutive(sh_degrees, return_counts=True)
+    groups = []
+    begin = 0
+    for value, count in zip(values.tolist(), counts.tolist()):
+        groups.append((value, begin, begin + count))
+        begin += count
+    return groups
@@ -113,7 +113,8 @@ def eval_sh(deg, sh, dirs):
 
 
 def eval_gaussian_model_sh(viewpoint_camera, pc):
-    shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree + 1) ** 2)
+    features = pc.get_features
+    shs_view = features.transpose(1, 2).view(-1, 3, features.shape[1])  # the SH bands may be partially allocated
     # view directions
     xyz = pc.get_xyz
     dir_pp = (xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
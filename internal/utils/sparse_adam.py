@@ -0,0 +1,228 @@
+import math
+from typing import Optional
+
+import torch
+
+
+def stochastic_round(x: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    """
+    Round to one of the two nearest values representable by `dtype`, with the probabilities proportional to the closeness,
+    so the small updates are preserved in expectation instead of being always rounded away.
+    """
+
+    if x.dtype == dtype:
+        return x
+
+    if dtype == torch.bfloat16 and x.dtype == torch.float:
+        # bfloat16 is the upper half of float32, add a random lower half then truncate it
+        bits = x.view(torch.int32)
+        bits = (bits + torch.randint_like(bits, 0, 1 << 16)) & -(1 << 16)
+        return bits.view(torch.float).to(dtype)
+
+    rounded = x.to(dtype)
+    error = x - rounded.to(x.dtype)
+    # the neighbour on the other side of `x`
+    neighbour = torch.nextafter(rounded, torch.where(error > 0, torch.inf, -torch.inf).to(dtype))
+    gap = (neighbour.to(x.dtype) - rounded.to(x.dtype)).abs_()
+    use_neighbour = torch.rand_like(x) * gap < error.abs()
+    return torch.where(use_neighbour, neighbour, rounded)
+
+
+class SparseAdam(torch.optim.Optimizer):
+    """
+    Adam that only updates the parameters and the moments of the visible Gaussians.
+
+    The first dimension of every parameter must be the Gaussian dimension.
+    Every Gaussian has its own step counter for the bias correction,
+    so the same as `torch.optim.Adam` if all the Gaussians are always visible.
+    The state tensors whose first dimension is the number of Gaussians are `exp_avg`, `exp_avg_sq` and `step`,
+    they should be pruned and extended together with the parameters.
+
+    The parameters stored in bfloat16 or float16 are updated in float32 and stochastically rounded back,
+    their moments are stored in bfloat16, float16 does not have enough range for the second moments.
+    """
+
+    def __init__(self, params, lr: float = 1e-3, betas=(0.9, 0.999), eps: float = 1e-8):
+        if lr < 0.:
+            raise ValueError("Invalid learning rate: {}".format(lr))
+        if eps < 0.:
+            raise ValueError("Invalid epsilon value: {}".format(eps))
+        if not 0. <= betas[0] < 1. or not 0. <= betas[1] < 1.:
+            raise ValueError("Invalid beta parameters: {}".format(betas))
+        super().__init__(params, dict(lr=lr, betas=betas, eps=eps))
+
+    @staticmethod
+    def get_state_dtype(param: torch.Tensor) -> torch.dtype:
+        if param.dtype in (torch.bfloat16, torch.float16):
+            return torch.bfloat16
+        return param.dtype
+
+    def load_state_dict(self, state_dict) -> None:
+        super().load_state_dict(state_dict)
+        for group in self.param_groups:
+            for param in group["params"]:
+                state = self.state.get(param, None)
+                if state is None:
+                    continue
+                # the step counters are kept on the device they were saved from, move them to their parameters
+                if "step" in state:
+                    state["step"] = state["step"].to(device=param.device, dtype=torch.float)
+                # the moments are converted to the dtype of the parameters by `load_state_dict()`
+                for key in ["exp_avg", "exp_avg_sq"]:
+                    if key in state:
+                        state[key] = state[key].to(dtype=self.get_state_dtype(param))
+
+    @torch.no_grad()
+    def step(self, closure=None, visibility: Optional[torch.Tensor] = None):
+        """
+        :param visibility: [n], the mask of the visible Gaussians, all the Gaussians are updated if not provided
+        """
+
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        visible_indices = None
+        if visibility is not None:
+            visible_indices = torch.nonzero(visibility).squeeze(-1)
+            if visible_indices.shape[0] == 0:
+                return loss
+
+        def gather(t: torch.Tensor) -> torch.Tensor:
+            """
+            :return: a float32 copy of the visible rows, or `t` itself if it is a float32 one and all the rows are visible
+            """
+
+            if visible_indices is None:
+                return t.to(torch.float)
+            return t[visible_indices].to(torch.float)
+
+        def scatter(t: torch.Tensor, value: torch.Tensor):
+            value = stochastic_round(value, t.dtype)
+            if visible_indices is None:
+                if value is not t:
+                    t.copy_(value)
+                return
+            t.index_copy_(0, visible_indices, value)
+
+        for group in self.param_groups:
+            beta1, beta2 = group["betas"]
+            for param in group["params"]:
+                if param.grad is None or param.shape[0] == 0:
+                    continue
+
+                state = self.state[param]
+                if len(state) == 0:
+                    state["step"] = torch.zeros((param.shape[0],), dtype=torch.float, device=param.device)
+                    state["exp_avg"] = torch.zeros_like(param, dtype=self.get_state_dtype(param), memory_format=torch.preserve_format)
+                    state["exp_avg_sq"] = torch.zeros_like(param, dtype=self.get_state_dtype(param), memory_format=torch.preserve_format)
+                elif state["step"].dim() == 0:
+                    # restored from the state of `torch.optim.Adam`
+                    state["step"] = torch.full((param.shape[0],), state["step"].item(), dtype=torch.float, device=param.device)
+
+                # gather, update and scatter back the visible rows only
+                step = gather(state["step"]).add_(1)
+                grad = gather(param.grad)
+                exp_avg = gather(state["exp_avg"]).lerp_(grad, 1 - beta1)
+                exp_avg_sq = gather(state["exp_avg_sq"]).mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+
+                shape = (-1,) + (1,) * (param.dim() - 1)
+                bias_correction1 = (1 - torch.pow(beta1, step)).view(shape)
+                bias_correction2_sqrt = (1 - torch.pow(beta2, step)).sqrt_().view(shape)
+                denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt).add_(group["eps"])
+
+                scatter(param, gather(param).add_(exp_avg / denom / bias_correction1, alpha=-group["lr"]))
+                scatter(state["step"], step)
+                scatter(state["exp_avg"], exp_avg)
+                scatter(state["exp_avg_sq"], exp_avg_sq)
+
+        return loss
+
+
+class MixedPrecisionAdam(torch.optim.Adam):
+    """
+    `torch.optim.Adam` for the float32 parameters,
+    the ones stored in bfloat16 or float16 are updated like `SparseAdam` does when all the Gaussians are visible,
+    but in chunks of rows, so the float32 temporaries are bounded by `chunk_size` elements, instead of the size of the parameters.
+    Their moments are stored in bfloat16, and their step counters are shared by all the rows, the same as `torch.optim.Adam`.
+    """
+
+    def __init__(self, params, lr: float = 1e-3, betas=(0.9, 0.999), eps: float = 1e-8, chunk_size: int = 1 << 18):
+        """
+        :param chunk_size: the max number of elements updated at once of the low precision parameters
+        """
+
+        super().__init__(params, lr=lr, betas=betas, eps=eps)
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def is_low_precision(param: torch.Tensor) -> bool:
+        return param.dtype in (torch.bfloat16, torch.float16)
+
+    def load_state_dict(self, state_dict) -> None:
+        super().load_state_dict(state_dict)
+        for group in self.param_groups:
+            for param in group["params"]:
+                state = self.state.get(param, None)
+                if state is None or self.is_low_precision(param) is False:
+                    continue
+                # the moments are converted to the dtype of the parameters by `load_state_dict()`
+                for key in ["exp_avg", "exp_avg_sq"]:
+                    if key in state:
+                        state[key] = state[key].to(dtype=SparseAdam.get_state_dtype(param))
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        # hide the low precision parameters from `torch.optim.Adam`, which updates them in low precision
+        low_precision_grads = {}
+        for group in self.param_groups:
+            for param in group["params"]:
+                if param.grad is not None and self.is_low_precision(param) is True:
+                    low_precision_grads[param] = param.grad
+                    param.grad = None
+        try:
+            super().step()
+        finally:
+            for param, grad in low_precision_grads.items():
+                param.grad = grad
+
+        for group in self.param_groups:
+            for param in group["params"]:
+                if param in low_precision_grads:
+                    self._low_precision_step(param, group)
+
+        return loss
+
+    def _low_precision_step(self, param: torch.Tensor, group: dict):
+        beta1, beta2 = group["betas"]
+        state = self.state[param]
+        if len(state) == 0:
+            state["step"] = torch.tensor(0., dtype=torch.float)
+            state["exp_avg"] = torch.zeros_like(param, dtype=SparseAdam.get_state_dtype(param), memory_format=torch.preserve_format)
+            state["exp_avg_sq"] = torch.zeros_like(param, dtype=SparseAdam.get_state_dtype(param), memory_format=torch.preserve_format)
+        state["step"] += 1
+        step = state["step"].item()
+        step_size = group["lr"] / (1 - beta1 ** step)
+        bias_correction2_sqrt = math.sqrt(1 - beta2 ** step)
+
+        if param.shape[0] == 0:
+            return
+        n_rows = max(self.chunk_size // max(param[0].numel(), 1), 1)
+        for start in range(0, param.shape[0], n_rows):
+            rows = slice(start, start + n_rows)
+            grad = param.grad[rows].to(torch.float)
+            exp_avg = state["exp_avg"][rows].to(torch.float).lerp_(grad, 1 - beta1)
+            exp_avg_sq = state["exp_avg_sq"][rows].to(torch.float).mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+            # reuse the buffer of the gradient
+            denom = torch.sqrt(exp_avg_sq, out=grad).div_(bias_correction2_sqrt).add_(group["eps"])
+            value = param[rows].to(torch.float).addcdiv_(exp_avg, denom, value=-step_size)
+
+            param[rows] = stochastic_round(value, param.dtype)
+            state["exp_avg"][rows] = stochastic_round(exp_avg, state["exp_avg"].dtype)
+            state["exp_avg_sq"][rows] = stochastic_round(exp_avg_sq, state["exp_avg_sq"].dtype)
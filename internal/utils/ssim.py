@@ -12,6 +12,7 @@
 import torch
 import torch.nn.functional as F
 from torch.autograd import Variable
+from torch.autograd.function import once_differentiable
 from math import exp
 
 def l1_loss(network_output, gt):
@@ -20,6 +21,16 @@ def l1_loss(network_output, gt):
 def l2_loss(network_output, gt):
     return ((network_output - gt) ** 2).mean()
 
+def weighted_mean(x, weights, dim=None):
+    """
+    :param weights: broadcastable to `x`, e.g. a single channel mask [1, H, W]
+    """
+
+    if dim is None:
+        dim = tuple(range(x.dim()))
+    # `expand` does not allocate memory, the sum of the weights is counted per channel
+    return (x * weights).sum(dim=dim) / weights.expand_as(x).sum(dim=dim).clamp_min(1e-8)
+
 def gaussian(window_size, sigma):
     gauss = torch.Tensor([exp(-(x - window_size // 2) ** 2 / float(2 * sigma ** 2)) for x in range(window_size)])
     return gauss / gauss.sum()
@@ -62,3 +73,164 @@ def _ssim(img1, img2, window, window_size, channel, size_average=True):
     else:
         return ssim_map.mean(1).mean(1).mean(1)
 
+
+# the separable windows, keyed by (window_size, channel, dtype, device)
+_separable_window_cache = {}
+
+def create_separable_windows(window_size, channel, dtype, device):
+    key = (window_size, channel, dtype, device)
+    windows = _separable_window_cache.get(key, None)
+    if windows is None:
+        _1D_window = gaussian(window_size, 1.5).to(device=device, dtype=dtype)
+        windows = (
+            _1D_window.view(1, 1, 1, window_size).expand(channel, 1, 1, window_size).contiguous(),  # horizontal
+            _1D_window.view(1, 1, window_size, 1).expand(channel, 1, window_size, 1).contiguous(),  # vertical
+        )
+        _separable_window_cache[key] = windows
+    return windows
+
+def _separable_filter(x, window_size):
+    """
+    The same result as `F.conv2d(x, window, padding=window_size // 2, groups=channel)` with the 2D Gaussian window,
+    but two 1D convolutions instead
+    """
+
+    channel = x.shape[1]
+    horizontal, vertical = create_separable_windows(window_size, channel, x.dtype, x.device)
+    x = F.conv2d(x, horizontal, padding=(0, window_size // 2), groups=channel)
+    return F.conv2d(x, vertical, padding=(window_size // 2, 0), groups=channel)
+
+C1 = 0.01 ** 2
+C2 = 0.03 ** 2
+
+def _composite_img2(img1, img2, weights, out=None):
+    """
+    Replace the pixels of `img2` with zero weights by the ones of `img1`, as if the G.T. is composited with the prediction,
+    so the SSIM windows near the mask boundary do not see the content of `img2` in the masked region
+    """
+
+    return torch.lerp(img1.detach(), img2, weights.expand_as(img2), out=out)
+
+def _fused_ssim_map(img1, img2, window_size, weights=None):
+    """
+    :return: the SSIM map, and the intermediate terms required by the backward pass
+    """
+
+    channel = img1.shape[1]
+    # filter the five moments in a single call
+    if torch.is_grad_enabled():
+        if weights is not None:
+            img2 = _composite_img2(img1, img2, weights)
+        moments = torch.cat([img1, img2, img1 * img1, img2 * img2, img1 * img2], dim=1)
+    else:
+        # write the moments into a single buffer, without the temporaries of every term
+        moments = torch.empty((img1.shape[0], 5 * channel) + img1.shape[2:], dtype=img1.dtype, device=img1.device)
+        img1_slot, img2_slot, img1_sq, img2_sq, img1_img2 = torch.split(moments, channel, dim=1)
+        img1_slot.copy_(img1)
+        if weights is not None:
+            img2 = _composite_img2(img1, img2, weights, out=img2_slot)
+        else:
+            img2_slot.copy_(img2)
+        torch.mul(img1, img1, out=img1_sq)
+        torch.mul(img2, img2, out=img2_sq)
+        torch.mul(img1, img2, out=img1_img2)
+    moments = _separable_filter(moments, window_size)
+    mu1, mu2, img1_sq, img2_sq, img1_img2 = torch.split(moments, channel, dim=1)
+
+    mu1_sq = mu1.pow(2)
+    mu2_sq = mu2.pow(2)
+    mu1_mu2 = mu1 * mu2
+
+    A1 = 2 * mu1_mu2 + C1
+    A2 = 2 * (img1_img2 - mu1_mu2) + C2
+    B1 = mu1_sq + mu2_sq + C1
+    B2 = (img1_sq - mu1_sq) + (img2_sq - mu2_sq) + C2
+
+    ssim_map = (A1 * A2) / (B1 * B2)
+
+    return ssim_map, (mu1, mu2, A1, A2, B1, B2)
+
+def _reduce_ssim_map(ssim_map, size_average, weights):
+    if weights is None:
+        if size_average:
+            return ssim_map.mean()
+        return ssim_map.mean(dim=(1, 2, 3))
+    if size_average:
+        return weighted_mean(ssim_map, weights)
+    return weighted_mean(ssim_map, weights, dim=(1, 2, 3))
+
+class FusedSSIMFunction(torch.autograd.Function):
+    """
+    Only save the input images for the backward pass, the filtered moments are recomputed,
+    and the gradient w.r.t. `img1` is derived analytically.
+    `img2` is treated as a constant, e.g. the ground truth, including its pixels replaced by `img1` under zero weights.
+    """
+
+    @staticmethod
+    def forward(ctx, img1, img2, window_size, size_average, weights):
+        ssim_map, _ = _fused_ssim_map(img1, img2, window_size, weights)
+        ctx.save_for_backward(img1, img2, weights)
+        ctx.window_size = window_size
+        ctx.size_average = size_average
+        return _reduce_ssim_map(ssim_map, size_average, weights)
+
+    @staticmethod
+    @once_differentiable
+    def backward(ctx, grad_output):
+        img1, img2, weights = ctx.saved_tensors
+        channel = img1.shape[1]
+        ssim_map, (mu1, mu2, A1, A2, B1, B2) = _fused_ssim_map(img1, img2, ctx.window_size, weights)
+        if weights is not None:
+            img2 = _composite_img2(img1, img2, weights)
+
+        # the gradient w.r.t. every element of the SSIM map
+        if ctx.size_average:
+            grad_map = grad_output
+            normalizer = ssim_map.numel() if weights is None else weights.expand_as(ssim_map).sum().clamp_min(1e-8)
+        else:
+            grad_map = grad_output.view(-1, 1, 1, 1)
+            normalizer = ssim_map[0].numel() if weights is None else weights.expand_as(ssim_map).sum(dim=(1, 2, 3), keepdim=True).clamp_min(1e-8)
+        grad_map = grad_map / normalizer
+        if weights is not None:
+            grad_map = grad_map * weights
+
+        # the partial derivatives w.r.t. the filtered E[x], E[x^2] and E[xy]
+        B1_B2 = B1 * B2
+        grad_mu1 = grad_map * ((2 * mu2 * (A2 - A1)) / B1_B2 - 2 * mu1 * ssim_map * (1. / B1 - 1. / B2))
+        grad_img1_sq = grad_map * (-ssim_map / B2)
+        grad_img1_img2 = grad_map * (2 * A1 / B1_B2)
+
+        # the window is symmetric, so the transposed filter is the filter itself
+        grad_moments = _separable_filter(torch.cat([grad_mu1, grad_img1_sq, grad_img1_img2], dim=1), ctx.window_size)
+        grad_mu1, grad_img1_sq, grad_img1_img2 = torch.split(grad_moments, channel, dim=1)
+
+        return grad_mu1 + 2 * img1 * grad_img1_sq + img2 * grad_img1_img2, None, None, None, None
+
+def fused_ssim(img1, img2, window_size=11, size_average=True, weights=None):
+    """
+    Equivalent to `ssim()`, with cached separable windows, fused moment filtering,
+    and a memory saving backward pass when only `img1` requires gradients
+
+    :param weights: optional per-pixel weights broadcastable to the images, e.g. a single channel validity mask,
+        the SSIM map is averaged with them, and `img2` is interpolated towards `img1` by them before computing the SSIM,
+        so its masked pixels are ignored, the same as compositing the G.T. with the prediction
+    """
+
+    unbatched = img1.dim() == 3
+    if unbatched:
+        img1 = img1.unsqueeze(0)
+        img2 = img2.unsqueeze(0)
+        if weights is not None:
+            weights = weights.unsqueeze(0)
+    if weights is not None:
+        weights = weights.to(dtype=img1.dtype)
+
+    if img2.requires_grad or (weights is not None and weights.requires_grad):
+        ssim_map, _ = _fused_ssim_map(img1, img2, window_size, weights)
+        output = _reduce_ssim_map(ssim_map, size_average, weights)
+    else:
+        output = FusedSSIMFunction.apply(img1, img2, window_size, size_average, weights)
+
+    if unbatched and not size_average:
+        output = output.squeeze(0)
+    return output
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import torch
+
+
+class RegionStats:
+    def __init__(self):
+        self.time = 0.  # seconds
+        self.calls = 0
+        self.peak_memory = 0  # bytes
+        self.gaussians_delta = 0
+        self.pending_events = []  # the CUDA events not yet accumulated to `time`
+
+    def accumulate_events(self):
+        if len(self.pending_events) == 0:
+            return
+        self.pending_events[-1][1].synchronize()
+        for start, end in self.pending_events:
+            self.time += start.elapsed_time(end) / 1000.
+        self.pending_events = []
+
+
+class StepProfiler:
+    """
+    Time the named regions of the training step, aggregated every N steps.
+
+        with profiler.region("forward"):
+            ...
+
+    The regions should not be nested.
+    Only the regions inside `profiler.step()` or `profiler.hooks()` are recorded, the others are ignored, e.g. the validation ones.
+    """
+
+    def __init__(
+            self,
+            enabled: bool = False,
+            log_every_n_steps: int = 100,
+            cuda_event: bool = True,
+            memory: bool = True,
+            trace_path: Optional[str] = None,
+            gaussian_count_fn: Callable[[], int] = None,
+    ):
+        self.enabled = enabled
+        self.log_every_n_steps = log_every_n_steps
+        self.cuda_event = cuda_event and torch.cuda.is_available()
+        self.memory = memory and torch.cuda.is_available()
+        self.trace_path = trace_path
+        self.gaussian_count_fn = gaussian_count_fn
+
+        self.recording = False
+        self.regions: dict[str, RegionStats] = {}
+        self.n_steps = 0
+        self.step_time = 0.
+        self.last_step_end = None
+        self.hooks_time = 0.  # since the last step, excluded from `between_steps`
+
+    def _get_gaussian_count(self) -> int:
+        if self.gaussian_count_fn is None:
+            return 0
+        return self.gaussian_count_fn()
+
+    @contextmanager
+    def region(self, name: str):
+        if self.recording is False:
+            yield
+            return
+
+        stats = self.regions.get(name, None)
+        if stats is None:
+            stats = RegionStats()
+            self.regions[name] = stats
+
+        n_gaussians = self._get_gaussian_count()
+        if self.memory is True:
+            torch.cuda.reset_peak_memory_stats()
+        if self.cuda_event is True:
+            start = torch.cuda.Event(enable_timing=True)
+            start.record()
+        else:
+            started_at = time.perf_counter()
+
+        yield
+
+        if self.cuda_event is True:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record()
+            stats.pending_events.append((start, end))
+        else:
+            stats.time += time.perf_counter() - started_at
+        if self.memory is True:
+            stats.peak_memory = max(stats.peak_memory, torch.cuda.max_memory_allocated())
+        stats.gaussians_delta += self._get_gaussian_count() - n_gaussians
+        stats.calls += 1
+
+    @contextmanager
+    def step(self):
+        if self.enabled is False:
+            yield
+            return
+
+        started_at = time.perf_counter()
+        # the time between two steps, spent on data loading, transferring and the other hooks
+        if self.last_step_end is not None:
+            stats = self.regions.setdefault("between_steps", RegionStats())
+            stats.time += started_at - self.last_step_end - self.hooks_time
+            stats.calls += 1
+        self.hooks_time = 0.
+
+        self.recording = True
+        try:
+            yield
+        finally:
+            self.recording = False
+        if self.cuda_event is True:
+            torch.cuda.current_stream().synchronize()
+        self.last_step_end = time.perf_counter()
+        self.step_time += self.last_step_end - started_at
+        self.n_steps += 1
+
+    @contextmanager
+    def hooks(self):
+        """
+        Record the regions of the hooks running after `step()`, e.g. `on_train_batch_end`.
+        They are not counted in the step time, and their time is excluded from `between_steps`.
+        """
+
+        if self.enabled is False or self.last_step_end is None:
+            yield
+            return
+
+        started_at = time.perf_counter()
+        self.recording = True
+        try:
+            yield
+        finally:
+            self.recording = False
+        if self.cuda_event is True:
+            torch.cuda.current_stream().synchronize()
+        self.hooks_time += time.perf_counter() - started_at
+
+    def should_log(self) -> bool:
+        return self.enabled is True and self.n_steps >= self.log_every_n_steps
+
+    def aggregate(self, step: int) -> dict:
+        """
+        Average the recorded regions per step, then reset
+        """
+
+        regions = {}
+        for name, stats in self.regions.items():
+            stats.accumulate_events()
+            regions[name] = {
+                "time_ms": stats.time * 1000. / self.n_steps,
+                "calls": stats.calls,
+                "peak_memory_mb": stats.peak_memory / 1024 ** 2,
+                "gaussians_delta": stats.gaussians_delta,
+            }
+        results = {
+            "step": step,
+            "n_steps": self.n_steps,
+            "step_time_ms": self.step_time * 1000. / self.n_steps,
+            "n_gaussians": self._get_gaussian_count(),
+            "regions": regions,
+        }
+
+        self.regions = {}
+        self.n_steps = 0
+        self.step_time = 0.
+
+        return results
+
+    def log(self, step: int, logger=None) -> dict:
+        results = self.aggregate(step)
+
+        if logger is not None:
+            metrics = {
+                "profile/step_time_ms": results["step_time_ms"],
+                "profile/n_gaussians": results["n_gaussians"],
+            }
+            for name, region in results["regions"].items():
+                metrics["profile/{}_ms".format(name)] = region["time_ms"]
+                if self.memory is True:
+                    metrics["profile/{}_peak_memory_mb".format(name)] = region["peak_memory_mb"]
+            logger.log_metrics(metrics, step=step)
+
+        if self.trace_path is not None:
+            os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+            with open(self.trace_path, "a") as f:
+                f.write(json.dumps(results))
+                f.write("\n")
+
+        return results
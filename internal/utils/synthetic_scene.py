@@ -0,0 +1,197 @@
+"""
+Procedurally generated scenes and datasets, for benchmarks and tests
+"""
+
+import os
+import json
+import math
+import numpy as np
+import torch
+from PIL import Image
+
+import internal.utils.colmap as colmap_utils
+from internal.cameras.cameras import Cameras
+from internal.utils.gaussian_utils import Gaussian
+from internal.utils.graphics_utils import fov2focal
+
+
+def random_gaussians(
+        n: int,
+        sh_degree: int = 3,
+        extra_feature_dims: int = 0,
+        radius: float = 1.,
+        seed: int = 42,
+) -> Gaussian:
+    """
+    :return: the Gaussians in parameter structure, i.e. scales and opacities are not activated
+    """
+
+    generator = torch.Generator().manual_seed(seed)
+
+    def rand(*shape):
+        return torch.rand(shape, generator=generator)
+
+    def randn(*shape):
+        return torch.randn(shape, generator=generator)
+
+    return Gaussian(
+        sh_degrees=sh_degree,
+        xyz=(rand(n, 3) * 2 - 1) * radius,
+        opacities=randn(n, 1),
+        features_dc=randn(n, 1, 3) * 0.5,
+        features_rest=randn(n, (sh_degree + 1) ** 2 - 1, 3) * 0.1,
+        scales=math.log(radius / max(n, 1) ** (1 / 3)) + randn(n, 3) * 0.5,
+        rotations=torch.nn.functional.normalize(randn(n, 4), dim=-1),
+        real_features_extra=randn(n, extra_feature_dims),
+    )
+
+
+def sphere_camera_to_world(n: int, radius: float = 4., max_elevation: float = math.pi / 4) -> torch.Tensor:
+    """
+    Cameras on a sphere around the origin, looking at the origin, Z up in the world space
+
+    :return: [n, 4, 4], in COLMAP convention (Y down, Z forward)
+    """
+
+    azimuth = torch.arange(n, dtype=torch.float64) * (2 * math.pi / max(n, 1))
+    elevation = max_elevation * torch.sin(torch.arange(n, dtype=torch.float64) * 2.4)  # spread over the elevation range
+    centers = radius * torch.stack([
+        torch.cos(elevation) * torch.cos(azimuth),
+        torch.cos(elevation) * torch.sin(azimuth),
+        torch.sin(elevation),
+    ], dim=-1)
+
+    forward = torch.nn.functional.normalize(-centers, dim=-1)
+    up = torch.tensor([0., 0., 1.], dtype=torch.float64).expand_as(forward)
+    right = torch.nn.functional.normalize(torch.linalg.cross(forward, up), dim=-1)
+    down = torch.linalg.cross(forward, right)
+
+    c2w = torch.eye(4, dtype=torch.float64).repeat(n, 1, 1)
+    c2w[:, :3, 0] = right
+    c2w[:, :3, 1] = down
+    c2w[:, :3, 2] = forward
+    c2w[:, :3, 3] = centers
+    return c2w
+
+
+def sphere_cameras(
+        n: int,
+        width: int = 800,
+        height: int = 600,
+        fov_x: float = math.pi / 3,
+        radius: float = 4.,
+) -> Cameras:
+    w2c = torch.linalg.inv(sphere_camera_to_world(n, radius=radius)).to(torch.float)
+    fx = torch.full((n,), fov2focal(fov_x, width), dtype=torch.float)
+    return Cameras(
+        R=w2c[:, :3, :3],
+        T=w2c[:, :3, 3],
+        fx=fx,
+        fy=fx.clone(),
+        cx=torch.full((n,), width / 2, dtype=torch.float),
+        cy=torch.full((n,), height / 2, dtype=torch.float),
+        width=torch.full((n,), width, dtype=torch.int),
+        height=torch.full((n,), height, dtype=torch.int),
+        appearance_id=torch.zeros((n,), dtype=torch.int),
+        normalized_appearance_id=torch.zeros((n,), dtype=torch.float),
+        distortion_params=None,
+        camera_type=torch.zeros((n,), dtype=torch.int),
+    )
+
+
+def random_image(width: int, height: int, channels: int, generator: np.random.Generator) -> np.ndarray:
+    # smooth gradients plus noise, compresses like a real image rather than pure noise
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    phase = generator.random((1, 1, channels), dtype=np.float32) * 2 * np.pi
+    image = 0.5 + 0.4 * np.sin(6 * x + 4 * y + phase) + generator.normal(0., 0.05, (height, width, channels)).astype(np.float32)
+    image = np.clip(image * 255, 0, 255).astype(np.uint8)
+    if channels == 4:
+        image[..., 3] = 255
+    return image
+
+
+def write_colmap_dataset(
+        path: str,
+        n_images: int,
+        n_points: int,
+        width: int = 800,
+        height: int = 600,
+        fov_x: float = math.pi / 3,
+        seed: int = 42,
+):
+    """
+    Write `images/*.png` and `sparse/0/{cameras,images,points3D}.bin`
+    """
+
+    generator = np.random.default_rng(seed)
+    image_dir = os.path.join(path, "images")
+    sparse_dir = os.path.join(path, "sparse", "0")
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(sparse_dir, exist_ok=True)
+
+    focal = fov2focal(fov_x, width)
+    cameras = {1: colmap_utils.Camera(id=1, model="PINHOLE", width=width, height=height, params=np.asarray([focal, focal, width / 2, height / 2]))}
+
+    w2c = torch.linalg.inv(sphere_camera_to_world(n_images)).numpy()
+    images = {}
+    for i in range(n_images):
+        name = "{:06d}.png".format(i)
+        images[i + 1] = colmap_utils.Image(
+            id=i + 1,
+            qvec=colmap_utils.rotmat2qvec(w2c[i, :3, :3]),
+            tvec=w2c[i, :3, 3],
+            camera_id=1,
+            name=name,
+            xys=np.empty((0, 2)),
+            point3D_ids=np.empty((0,), dtype=np.int64),
+        )
+        Image.fromarray(random_image(width, height, 3, generator)).save(os.path.join(image_dir, name))
+
+    xyz = generator.uniform(-1., 1., (n_points, 3))
+    rgb = generator.integers(0, 256, (n_points, 3), dtype=np.uint8)
+    points3D = {}
+    for i in range(n_points):
+        points3D[i + 1] = colmap_utils.Point3D(
+            id=i + 1,
+            xyz=xyz[i],
+            rgb=rgb[i],
+            error=0.,
+            image_ids=np.asarray([1 + i % max(n_images, 1)], dtype=np.int32),
+            point2D_idxs=np.asarray([0], dtype=np.int32),
+        )
+
+    colmap_utils.write_cameras_binary(cameras, os.path.join(sparse_dir, "cameras.bin"))
+    colmap_utils.write_images_binary(images, os.path.join(sparse_dir, "images.bin"))
+    colmap_utils.write_points3D_binary(points3D, os.path.join(sparse_dir, "points3D.bin"))
+
+
+def write_blender_dataset(
+        path: str,
+        n_images: int,
+        image_size: int = 800,
+        fov_x: float = math.pi / 3,
+        seed: int = 42,
+):
+    """
+    Write `transforms_{train,val,test}.json` and the RGBA images, every split has `n_images` images
+    """
+
+    generator = np.random.default_rng(seed)
+
+    c2w = sphere_camera_to_world(3 * n_images)
+    # change from COLMAP (Y down, Z forward) to OpenGL/Blender camera axes (Y up, Z back)
+    c2w[:, :3, 1:3] *= -1
+
+    for split_idx, split in enumerate(["train", "val", "test"]):
+        os.makedirs(os.path.join(path, split), exist_ok=True)
+        frames = []
+        for i in range(n_images):
+            file_path = os.path.join(split, "r_{}".format(i))
+            frames.append({
+                "file_path": file_path,
+                "transform_matrix": c2w[split_idx * n_images + i].tolist(),
+            })
+            Image.fromarray(random_image(image_size, image_size, 4, generator)).save(os.path.join(path, "{}.png".format(file_path)))
+        with open(os.path.join(path, "transforms_{}.json".format(split)), "w") as f:
+            json.dump({"camera_angle_x": fov_x, "frames": frames}, f, indent=4)
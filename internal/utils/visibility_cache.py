@@ -0,0 +1,50 @@
+from typing import Dict, Tuple, Optional
+
+import torch
+
+
+class VisibilityCache:
+    """
+    The indices of the Gaussians visible to every training camera,
+    so that the invisible ones can be skipped when rendering the same camera again.
+
+    The frustum culling of the renderer becomes inaccurate as the Gaussians move,
+    so a cached set expires after `refresh_interval` steps, and the whole cache is invalidated once the Gaussians are densified or pruned.
+    """
+
+    def __init__(self, refresh_interval: int = 500, offload: bool = False):
+        self.refresh_interval = refresh_interval
+        self.offload = offload
+        self.cache: Dict[str, Tuple[int, int, torch.Tensor]] = {}  # image name -> (step, n_gaussians, indices)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_name: str, step: int, n_gaussians: int, device=None) -> Optional[torch.Tensor]:
+        """
+        :return: the indices of the visible Gaussians, None if not cached or expired
+        """
+
+        cached = self.cache.get(image_name, None)
+        if cached is None or step - cached[0] >= self.refresh_interval or cached[1] != n_gaussians:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        indices = cached[2]
+        if device is not None:
+            indices = indices.to(device=device, non_blocking=True)
+        return indices.to(torch.long)
+
+    def update(self, image_name: str, step: int, visibility_filter: torch.Tensor):
+        indices = torch.nonzero(visibility_filter).squeeze(-1).to(torch.int)
+        if self.offload is True:
+            indices = indices.cpu()
+        self.cache[image_name] = (step, visibility_filter.shape[0], indices)
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def get_hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.
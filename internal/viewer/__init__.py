@@ -1,2 +1,4 @@
 from .client import ClientThread
 from .renderer import ViewerRenderer
+from .render_scheduler import RenderScheduler
+from .process_renderer import MultiProcessViewerRenderer
@@ -0,0 +1,75 @@
+class AdaptiveQualityController:
+    """
+    Tune the resolution and JPEG quality of a client's interactive frames to hit a target frame time.
+
+    The measured render and encode latencies are smoothed by moving averages.
+    When the frame time exceeds the target, the stage taking more time is degraded:
+    the resolution for the render stage, the JPEG quality for the encode stage.
+    Both of them are restored gradually once there is enough headroom.
+    """
+
+    def __init__(
+            self,
+            min_res_scale: float = 0.25,
+            min_jpeg_quality: int = 30,
+            res_step: int = 32,
+            smoothing: float = 0.8,
+    ):
+        self.min_res_scale = min_res_scale
+        self.min_jpeg_quality = min_jpeg_quality
+        self.res_step = res_step  # quantize the resolution, avoid re-allocating buffers on every frame
+        self.smoothing = smoothing
+
+        self.res_scale = 1.
+        self.jpeg_quality_offset = 0
+        self.render_time = None
+        self.encode_time = None
+
+    def reset(self):
+        self.res_scale = 1.
+        self.jpeg_quality_offset = 0
+        self.render_time = None
+        self.encode_time = None
+
+    def _smooth(self, previous, value):
+        if previous is None:
+            return value
+        return self.smoothing * previous + (1 - self.smoothing) * value
+
+    def update(self, render_time: float, encode_time: float, target_frame_time: float):
+        """
+        :param render_time: seconds, from rendering started to the frame copied to the host memory
+        :param encode_time: seconds
+        :param target_frame_time: seconds
+        """
+
+        self.render_time = self._smooth(self.render_time, render_time)
+        self.encode_time = self._smooth(self.encode_time, encode_time)
+        frame_time = self.render_time + self.encode_time
+
+        # the latency measured before an adjustment is outdated, so the corresponding moving average is restarted
+        if frame_time > 1.1 * target_frame_time:
+            if self.render_time >= self.encode_time or self.jpeg_quality_offset <= self.min_jpeg_quality - 100:
+                # the rendering time is roughly proportional to the number of pixels
+                self.res_scale = max(self.min_res_scale, self.res_scale * max((target_frame_time / frame_time) ** 0.5, 0.75))
+                self.render_time = None
+            else:
+                self.jpeg_quality_offset -= 5
+                self.encode_time = None
+        elif frame_time < 0.7 * target_frame_time:
+            # restore the JPEG quality first, it is cheaper
+            if self.jpeg_quality_offset < 0:
+                self.jpeg_quality_offset += 5
+                self.encode_time = None
+            elif self.res_scale < 1.:
+                self.res_scale = min(1., self.res_scale * 1.1)
+                self.render_time = None
+
+    def get_max_res(self, max_res: int) -> int:
+        scaled = int(max_res * self.res_scale) // self.res_step * self.res_step
+        return max(self.res_step, min(max_res, scaled))
+
+    def get_jpeg_quality(self, jpeg_quality: int) -> int:
+        if self.jpeg_quality_offset == 0:
+            return jpeg_quality
+        return max(min(jpeg_quality, self.min_jpeg_quality), jpeg_quality + self.jpeg_quality_offset)
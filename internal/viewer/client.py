@@ -5,18 +5,51 @@ import numpy as np
 import torch
 import viser
 import viser.transforms as vtf
+from dataclasses import dataclass
+from typing import Optional
 from internal.cameras.cameras import Cameras
 from internal.utils.graphics_utils import fov2focal
+from .adaptive_quality import AdaptiveQualityController
+
+
+@dataclass
+class RenderedFrame:
+    image: torch.Tensor  # uint8, [H, W, 3], in host memory, may still being copied
+    jpeg_quality: int
+    state: str
+    render_time: Optional[float] = None  # seconds, available after the copy finished
+    render_started: Optional[torch.cuda.Event] = None
+    copy_finished: Optional[torch.cuda.Event] = None
+
+    def wait(self):
+        if self.copy_finished is None:
+            return
+        self.copy_finished.synchronize()
+        self.render_time = self.render_started.elapsed_time(self.copy_finished) / 1000.
 
 
 class ClientThread(threading.Thread):
+    """
+    Rendering is done by the viewer's shared `RenderScheduler`, this thread only sends the rendered frames to the client.
+
+    The frames are pipelined: render (scheduler thread) -> device-to-host copy into a pinned buffer -> encode and send (this thread),
+    so the scheduler can start rendering the next frame while this one is being copied and encoded.
+    """
+
     def __init__(self, viewer, renderer, client: viser.ClientHandle):
         super().__init__()
         self.viewer = viewer
         self.renderer = renderer
         self.client = client
+        self.client_id = client.client_id
+        self.render_scheduler = viewer.render_scheduler
 
-        self.render_trigger = threading.Event()
+        self.frame_ready = threading.Event()
+        self.frame: Optional[RenderedFrame] = None  # the latest rendered frame
+        self.frame_lock = threading.Lock()
+        self.host_buffers: dict[tuple, list] = {}  # shape -> the free host buffers
+
+        self.quality_controller = AdaptiveQualityController()
 
         self.last_move_time = 0
 
@@ -24,8 +57,10 @@ class ClientThread(threading.Thread):
 
         self.state = "low"  # low or high render resolution
 
-        self.stop_client = False  # whether stop this thread
+        # increased on every new render request, used to cancel the outdated rendering
+        self.request_version = 0
 
+        self.stop_client = False  # whether stop this thread
 
         if viewer.default_camera_position is not None:
             client.camera.position = np.asarray(viewer.default_camera_position)
@@ -34,19 +69,57 @@ class ClientThread(threading.Thread):
 
         client.camera.up_direction = viewer.up_direction
 
+        self.render_scheduler.register(self)
+
         @client.camera.on_update
         def _(cam: viser.CameraHandle) -> None:
             with self.client.atomic():
                 self.last_camera = cam
-                self.state = "low"  # switch to low resolution mode when a new camera received
-                self.render_trigger.set()
+            self.request_render()  # switch to low resolution mode when a new camera received
 
-    def render_and_send(self):
+    def request_render(self, state: str = "low"):
+        if self.last_camera is None:
+            return
+        self.request_version += 1
+        self.render_scheduler.submit(self.client_id, state=state)
+
+    def is_cancelled(self, request_version: int) -> bool:
+        return self.stop_client is True or request_version != self.request_version
+
+    def get_refinement_levels(self) -> list[int]:
+        """
+        The max resolution of each progressive refinement level,
+        start from twice of the moving one, double on every level, until reaching the static one
+        """
+
+        max_res = self.viewer.max_res_when_static.value
+        if self.viewer.progressive_refinement.value is False:
+            return [max_res]
+        levels = []
+        res = self.viewer.max_res_when_moving.value * 2
+        while res < max_res:
+            levels.append(res)
+            res *= 2
+        levels.append(max_res)
+        return levels
+
+    def get_n_refinement_levels(self) -> int:
+        return len(self.get_refinement_levels())
+
+    def get_render_resolution(self, state: str, level: int = 0):
+        max_res, _ = self.get_render_options(state, level)
+        aspect_ratio = self.last_camera.aspect
+        image_height = max_res
+        image_width = int(image_height * aspect_ratio)
+        if image_width > max_res:
+            image_width = max_res
+            image_height = int(image_width / aspect_ratio)
+        return image_width, image_height
+
+    def get_camera(self, state: str, level: int = 0):
         with self.client.atomic():
             cam = self.last_camera
 
-            self.last_move_time = time.time()
-
             # get camera pose
             R = vtf.SO3(wxyz=self.client.camera.wxyz)
             R = R @ vtf.SO3.from_x_radians(np.pi)
@@ -67,13 +140,8 @@ class ClientThread(threading.Thread):
             T = w2c[:3, 3]
 
             # calculate resolution
-            aspect_ratio = cam.aspect
-            max_res, jpeg_quality = self.get_render_options()
-            image_height = max_res
-            image_width = int(image_height * aspect_ratio)
-            if image_width > max_res:
-                image_width = max_res
-                image_height = int(image_width / aspect_ratio)
+            max_res, jpeg_quality = self.get_render_options(state, level)
+            image_width, image_height = self.get_render_resolution(state, level)
 
             # construct camera
             appearance_id = self.viewer.get_appearance_id_value()
@@ -94,56 +162,149 @@ class ClientThread(threading.Thread):
                 camera_type=torch.tensor([0], dtype=torch.int),
             )[0].to_device(self.viewer.device)
 
-            with torch.no_grad():
-                image = self.renderer.get_outputs(camera, scaling_modifier=self.viewer.scaling_modifier.value)
-                image = torch.clamp(image, max=1.)
-                image = torch.permute(image, (1, 2, 0))
-                self.client.set_background_image(
-                    image.cpu().numpy(),
-                    format=self.viewer.image_format,
-                    jpeg_quality=jpeg_quality,
-                )
+        return camera, jpeg_quality
+
+    def render(self, state: str, level: int = 0) -> bool:
+        """
+        Called by the render scheduler
+
+        :return: False if cancelled by a newer request, before rendering, or after rendering a refinement level
+        """
+
+        request_version = self.request_version
+
+        self.state = state
+        self.last_move_time = time.time()
+
+        camera, jpeg_quality = self.get_camera(state, level)
+        if self.is_cancelled(request_version):
+            return False
+
+        frame = RenderedFrame(image=None, jpeg_quality=jpeg_quality, state=state)
+        is_cuda = camera.R.is_cuda
+        if is_cuda is True:
+            frame.render_started = torch.cuda.Event(enable_timing=True)
+            frame.render_started.record()
+        render_started_at = time.time()
+
+        image = self.renderer.get_outputs(camera, scaling_modifier=self.viewer.scaling_modifier.value)
+        # only the outdated refinement levels are dropped,
+        # the camera updates may arrive faster than rendering while moving, the newest completed interactive frame is always delivered
+        if self.stop_client is True or (state != "low" and self.is_cancelled(request_version)):
+            return False
+        # convert to uint8 on the device, transfer 4 times less data
+        image = (torch.clamp(image, min=0., max=1.) * 255.).to(torch.uint8)
+        image = torch.permute(image, (1, 2, 0)).contiguous()
+
+        # asynchronous device-to-host copy, waited in this thread
+        frame.image = self.acquire_host_buffer(image.shape, pin_memory=is_cuda)
+        frame.image.copy_(image, non_blocking=is_cuda)
+        if is_cuda is True:
+            frame.copy_finished = torch.cuda.Event(enable_timing=True)
+            frame.copy_finished.record()
+        else:
+            frame.render_time = time.time() - render_started_at
+
+        # hand over to this thread, an unsent frame will be replaced
+        with self.frame_lock:
+            if self.frame is not None:
+                self._release_host_buffer(self.frame.image)
+            self.frame = frame
+        self.frame_ready.set()
+
+        return True
+
+    def acquire_host_buffer(self, shape, pin_memory: bool):
+        shape = tuple(shape)
+        with self.frame_lock:
+            # the resolution changed, free the buffers of other shapes
+            for i in list(self.host_buffers.keys()):
+                if i != shape:
+                    del self.host_buffers[i]
+            free_buffers = self.host_buffers.get(shape, None)
+            if free_buffers is not None and len(free_buffers) > 0:
+                return free_buffers.pop()
+        return torch.empty(shape, dtype=torch.uint8, pin_memory=pin_memory)
+
+    def _release_host_buffer(self, buffer):
+        """
+        Must be called with `self.frame_lock` held
+        """
+
+        self.host_buffers.setdefault(tuple(buffer.shape), []).append(buffer)
+
+    def send(self, frame: RenderedFrame):
+        frame.wait()
+
+        # the image is encoded inside `set_background_image`,
+        # do not hold the `client.atomic()` lock here, which blocks the camera updates
+        encode_started_at = time.time()
+        self.client.set_background_image(
+            frame.image.numpy(),
+            format=self.viewer.image_format,
+            jpeg_quality=frame.jpeg_quality,
+        )
+        encode_time = time.time() - encode_started_at
+
+        # only the interactive frames are tuned
+        if frame.state == "low" and self.viewer.adaptive_quality.value is True:
+            self.quality_controller.update(
+                render_time=frame.render_time,
+                encode_time=encode_time,
+                target_frame_time=self.viewer.target_frame_time.value / 1000.,
+            )
 
     def run(self):
         while True:
-            trigger_wait_return = self.render_trigger.wait(0.2)  # TODO: avoid wasting CPU
+            self.frame_ready.wait()
             # stop client thread?
             if self.stop_client is True:
                 break
-            if not trigger_wait_return:
-                # skip if camera is none
-                if self.last_camera is None:
-                    continue
-
-                # if we haven't received a trigger in a while, switch to high resolution
-                if self.state == "low":
-                    self.state = "high"  # switch to high resolution mode
-                else:
-                    continue  # skip if already in high resolution mode
 
-            self.render_trigger.clear()
+            with self.frame_lock:
+                self.frame_ready.clear()
+                frame = self.frame
+                self.frame = None
+            if frame is None:
+                continue
 
             try:
-                self.render_and_send()
+                self.send(frame)
             except Exception as err:
-                print("error occurred when rendering for client")
+                print("error occurred when sending frame to client")
                 traceback.print_exc()
                 break
+            finally:
+                with self.frame_lock:
+                    self._release_host_buffer(frame.image)
 
         self._destroy()
 
-    def get_render_options(self):
-        if self.state == "low":
-            return self.viewer.max_res_when_moving.value, int(self.viewer.jpeg_quality_when_moving.value)
-        return self.viewer.max_res_when_static.value, int(self.viewer.jpeg_quality_when_static.value)
+    def get_render_options(self, state: str = None, level: int = 0):
+        if state is None:
+            state = self.state
+        if state == "low":
+            max_res, jpeg_quality = self.viewer.max_res_when_moving.value, int(self.viewer.jpeg_quality_when_moving.value)
+            if self.viewer.adaptive_quality.value is True:
+                return self.quality_controller.get_max_res(max_res), self.quality_controller.get_jpeg_quality(jpeg_quality)
+            return max_res, jpeg_quality
+        levels = self.get_refinement_levels()
+        level = min(level, len(levels) - 1)
+        if level < len(levels) - 1:
+            # intermediate refinement levels are only shown for a short time
+            return levels[level], int(self.viewer.jpeg_quality_when_moving.value)
+        return levels[level], int(self.viewer.jpeg_quality_when_static.value)
 
     def stop(self):
         self.stop_client = True
-        # self.render_trigger.set()  # TODO: potential thread leakage?
+        self.render_scheduler.unregister(self.client_id)
+        self.frame_ready.set()  # wake up the blocking thread
 
     def _destroy(self):
-        print("client thread #{} destroyed".format(self.client.client_id))
+        print("client thread #{} destroyed".format(self.client_id))
         self.viewer = None
         self.renderer = None
         self.client = None
         self.last_camera = None
+        self.frame = None
+        self.host_buffers = {}
@@ -0,0 +1,217 @@
+import queue
+import threading
+import dataclasses
+import traceback
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from internal.cameras.cameras import Camera
+
+# the activated tensors of `GaussianModelSimplified` and `SimplifiedGaussianModelManager`
+SHARED_TENSOR_NAMES = ["xyz", "scaling", "rotation", "opacity", "features", "features_extra"]
+
+
+class SharedGaussianModel:
+    """
+    The read-only Gaussians of a render worker, compatible with `GaussianModelSimplified`
+    """
+
+    def __init__(self, tensors: dict, max_sh_degree: int, device):
+        for name in SHARED_TENSOR_NAMES:
+            setattr(self, "_{}".format(name), tensors[name].to(device))
+        self.max_sh_degree = max_sh_degree
+        self.active_sh_degree = max_sh_degree
+
+    @property
+    def get_scaling(self):
+        return self._scaling
+
+    @property
+    def get_rotation(self):
+        return self._rotation
+
+    @property
+    def get_xyz(self):
+        return self._xyz
+
+    @property
+    def get_features(self):
+        return self._features
+
+    @property
+    def get_opacity(self):
+        return self._opacity
+
+    @property
+    def get_features_extra(self):
+        return self._features_extra
+
+
+def camera_to_numpy(camera: Camera) -> dict:
+    # numpy arrays are pickled by value, tensors would be moved to a new shared memory segment one by one
+    return {i.name: None if getattr(camera, i.name) is None else getattr(camera, i.name).cpu().numpy() for i in dataclasses.fields(Camera)}
+
+
+def camera_from_numpy(camera: dict, device) -> Camera:
+    return Camera(**{i: None if camera[i] is None else torch.from_numpy(camera[i]) for i in camera}).to_device(device)
+
+
+def render_worker(connection, tensors: dict, max_sh_degree: int, renderer, background_color: torch.Tensor, device: str):
+    device = torch.device(device)
+    if device.type == "cuda":
+        torch.cuda.set_device(device)
+    torch.set_grad_enabled(False)
+
+    gaussian_model = SharedGaussianModel(tensors, max_sh_degree, device)
+    del tensors
+    renderer = renderer.to(device)
+    background_color = background_color.to(device)
+
+    output_buffer = None
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+
+        camera, scaling_modifier, active_sh_degree = request
+        try:
+            gaussian_model.active_sh_degree = active_sh_degree
+            image = renderer(
+                camera_from_numpy(camera, device),
+                gaussian_model,
+                background_color,
+                scaling_modifier=scaling_modifier,
+            )["render"]
+
+            # the frame is returned through a shared memory buffer, which is only sent when re-allocated
+            new_output_buffer = None
+            if output_buffer is None or output_buffer.shape[0] < image.numel():
+                output_buffer = torch.empty((image.numel(),), dtype=torch.float).share_memory_()
+                new_output_buffer = output_buffer
+            output_buffer[:image.numel()].copy_(image.reshape(-1))
+            connection.send((tuple(image.shape), new_output_buffer, None))
+        except:
+            connection.send((None, None, traceback.format_exc()))
+
+
+class MultiProcessViewerRenderer:
+    """
+    Render in the worker processes, so rendering does not contend on the GIL with the viser event handling.
+
+    The Gaussians are loaded once into the shared memory, every worker copies them to its own device.
+    Only `GaussianModelSimplified` and `SimplifiedGaussianModelManager` are supported,
+    and modifications of the Gaussians in this process are not visible to the workers.
+    """
+
+    def __init__(
+            self,
+            gaussian_model,
+            renderer,
+            background_color: torch.Tensor,
+            n_workers: int,
+            devices: list[str],
+    ):
+        assert len(devices) > 0, "no device is available for the render workers, specify them by `--render_devices`, e.g. `--render_devices cpu`"
+
+        self.gaussian_model = gaussian_model
+        self.renderer = renderer
+        self.background_color = background_color
+
+        tensors = {}
+        for name in SHARED_TENSOR_NAMES:
+            tensors[name] = getattr(gaussian_model, "_{}".format(name)).detach().cpu().share_memory_()
+
+        context = mp.get_context("spawn")
+        self.connections = []
+        self.processes = []
+        self.output_buffers = []
+        self.idle_workers = queue.Queue()
+        self.lock = threading.Lock()
+        self.n_alive_workers = n_workers
+        for i in range(n_workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=render_worker,
+                args=(
+                    worker_connection,
+                    tensors,
+                    gaussian_model.max_sh_degree,
+                    renderer,
+                    background_color.cpu(),
+                    devices[i % len(devices)],
+                ),
+                daemon=True,
+            )
+            process.start()
+            # only the worker holds its end, so that `recv()` raises EOFError once it exits
+            worker_connection.close()
+            print("render worker #{} started on {}".format(i, devices[i % len(devices)]))
+            self.connections.append(connection)
+            self.processes.append(process)
+            self.output_buffers.append(None)
+            self.idle_workers.put(i)
+
+    def _recv(self, worker_id: int, poll_interval: float = 1.):
+        """
+        :return: the response of the worker, or raise EOFError if it exited
+        """
+
+        connection = self.connections[worker_id]
+        process = self.processes[worker_id]
+        while connection.poll(poll_interval) is False:
+            if process.is_alive() is False:
+                raise EOFError()
+        return connection.recv()
+
+    def _acquire_worker(self, poll_interval: float = 1.) -> int:
+        while True:
+            with self.lock:
+                if self.n_alive_workers == 0:
+                    raise RuntimeError("all the render workers exited")
+            try:
+                return self.idle_workers.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+
+    def get_outputs(self, camera, scaling_modifier: float = 1.):
+        # can be called by multiple threads, each one takes an idle worker
+        worker_id = self._acquire_worker()
+        connection = self.connections[worker_id]
+        try:
+            connection.send((camera_to_numpy(camera), scaling_modifier, self.gaussian_model.active_sh_degree))
+            shape, new_output_buffer, error = self._recv(worker_id)
+        except (OSError, EOFError):
+            # the worker exited, do not return it to the pool
+            process = self.processes[worker_id]
+            process.join(1.)
+            with self.lock:
+                self.n_alive_workers -= 1
+                n_alive_workers = self.n_alive_workers
+            raise RuntimeError("render worker #{} exited unexpectedly, exit code: {}, {} workers left".format(
+                worker_id,
+                process.exitcode,
+                n_alive_workers,
+            ))
+
+        # the worker is still alive even if it reported an error
+        try:
+            if error is not None:
+                raise RuntimeError("error occurred in render worker #{}:\n{}".format(worker_id, error))
+            if new_output_buffer is not None:
+                self.output_buffers[worker_id] = new_output_buffer
+            # copy out, the buffer will be overwritten by the next frame
+            return self.output_buffers[worker_id][:int(np.prod(shape))].view(shape).clone()
+        finally:
+            self.idle_workers.put(worker_id)
+
+    def stop(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except BrokenPipeError:
+                # the worker has exited
+                pass
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,262 @@
+import time
+import heapq
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import torch
+
+
+@dataclass
+class RenderRequest:
+    client_id: int
+    state: str  # "low" or "high"
+    level: int  # progressive refinement level of the "high" state
+    version: int
+    submit_time: float
+    due_time: float
+
+
+@dataclass
+class ClientRenderStats:
+    n_submitted: int = 0
+    n_rendered: int = 0
+    n_coalesced: int = 0  # requests replaced by a newer one before being rendered
+    n_cancelled: int = 0  # frames discarded because a newer camera pose arrived during rendering
+    latency: float = 0.  # moving average of submit-to-render-finished time, in seconds
+    fps: float = 0.  # moving average of rendered frames per second
+    last_frame_time: float = field(default=0., repr=False)
+
+    def update(self, submit_time: float, finish_time: float, smoothing: float = 0.9):
+        latency = finish_time - submit_time
+        if self.n_rendered == 0:
+            self.latency = latency
+        else:
+            self.latency = smoothing * self.latency + (1 - smoothing) * latency
+            interval = finish_time - self.last_frame_time
+            if interval > 0:
+                self.fps = smoothing * self.fps + (1 - smoothing) * (1. / interval)
+        self.last_frame_time = finish_time
+        self.n_rendered += 1
+
+    def to_dict(self):
+        return {
+            "submitted": self.n_submitted,
+            "rendered": self.n_rendered,
+            "coalesced": self.n_coalesced,
+            "cancelled": self.n_cancelled,
+            "latency_ms": self.latency * 1000.,
+            "fps": self.fps,
+        }
+
+
+class RenderScheduler(threading.Thread):
+    """
+    A single thread that owns all the viewer render calls.
+
+    * every client has at most one pending request, a newer one replaces the older one (latest pose wins)
+    * requests are kept in a priority queue ordered by their due time,
+      interactive low resolution requests are served before the high resolution ones
+    * clients are served in round-robin order, the one that has been waiting longest goes first
+    * requests with the same resolution are dispatched together
+    * the high resolution state may be split into several progressive refinement levels,
+      each level is a separate request, so a new camera pose cancels the remaining levels
+    """
+
+    STATE_PRIORITY = {
+        "low": 0,
+        "high": 1,
+    }
+
+    def __init__(
+            self,
+            renderer,
+            static_delay: float = 0.2,
+            max_batch_size: int = 4,
+            stream=None,
+            max_concurrency: int = 1,
+    ):
+        super().__init__(daemon=True)
+
+        self.renderer = renderer
+        self.stream = stream  # the CUDA stream all the render calls are issued on, the current one if None
+        self.max_concurrency = max_concurrency  # the number of the requests of a batch rendered at the same time
+        self.static_delay = static_delay  # switch to high resolution after the camera stopped for this long
+        self.max_batch_size = max_batch_size
+
+        self.condition = threading.Condition()
+        self.queue = []  # heap of (due_time, priority, sequence, client_id, version)
+        self.pending: dict[int, RenderRequest] = {}
+        self.clients = {}
+        self.last_served: dict[int, int] = {}  # client_id -> round-robin counter when last served
+        self.stats: dict[int, ClientRenderStats] = {}
+
+        self.sequence = 0
+        self.served_counter = 0
+        self.stop_scheduler = False
+
+    def register(self, client_thread):
+        with self.condition:
+            client_id = client_thread.client_id
+            self.clients[client_id] = client_thread
+            self.last_served[client_id] = -1
+            self.stats[client_id] = ClientRenderStats()
+
+    def unregister(self, client_id: int):
+        with self.condition:
+            self.clients.pop(client_id, None)
+            self.pending.pop(client_id, None)
+            self.last_served.pop(client_id, None)
+            self.stats.pop(client_id, None)
+
+    def submit(self, client_id: int, state: str = "low", delay: float = 0., level: int = 0):
+        with self.condition:
+            if client_id not in self.clients:
+                return
+
+            stats = self.stats[client_id]
+            previous = self.pending.get(client_id, None)
+            if previous is not None:
+                stats.n_coalesced += 1
+            stats.n_submitted += 1
+
+            now = time.time()
+            self.sequence += 1
+            request = RenderRequest(
+                client_id=client_id,
+                state=state,
+                level=level,
+                version=self.sequence,
+                # keep the submit time of the replaced request, the latency is counted from the first unserved pose
+                submit_time=now if previous is None else previous.submit_time,
+                due_time=now + delay,
+            )
+            self.pending[client_id] = request
+            heapq.heappush(self.queue, (request.due_time, self.STATE_PRIORITY[state], self.sequence, client_id, request.version))
+            self.condition.notify()
+
+    def has_pending(self, client_id: int) -> bool:
+        with self.condition:
+            return client_id in self.pending
+
+    def get_client_stats(self, client_id: int = None):
+        with self.condition:
+            if client_id is not None:
+                return self.stats[client_id].to_dict()
+            return {i: self.stats[i].to_dict() for i in self.stats}
+
+    def stop(self):
+        with self.condition:
+            self.stop_scheduler = True
+            self.condition.notify()
+
+    def _is_valid(self, item) -> bool:
+        _, _, _, client_id, version = item
+        request = self.pending.get(client_id, None)
+        return request is not None and request.version == version
+
+    def _next_batch(self) -> list:
+        """
+        Block until some requests are due, then pick a batch of them.
+        Must be called with `self.condition` held.
+        """
+
+        while True:
+            if self.stop_scheduler is True:
+                return []
+
+            # drop stale entries
+            while len(self.queue) > 0 and self._is_valid(self.queue[0]) is False:
+                heapq.heappop(self.queue)
+
+            if len(self.queue) == 0:
+                self.condition.wait()
+                continue
+
+            now = time.time()
+            due_time = self.queue[0][0]
+            if due_time > now:
+                # sleep until the earliest request is due, or a new one arrives
+                self.condition.wait(due_time - now)
+                continue
+
+            # collect all the due requests
+            ready = []
+            while len(self.queue) > 0 and self.queue[0][0] <= now:
+                item = heapq.heappop(self.queue)
+                if self._is_valid(item) is True:
+                    ready.append(self.pending[item[3]])
+
+            # interactive requests first, then round-robin between clients
+            ready.sort(key=lambda i: (self.STATE_PRIORITY[i.state], i.level, self.last_served[i.client_id], i.version))
+
+            # group the ones having the same resolution as the first one
+            batch = []
+            batch_resolution = None
+            for request in ready:
+                resolution = self.clients[request.client_id].get_render_resolution(request.state, request.level)
+                if len(batch) < self.max_batch_size and (batch_resolution is None or resolution == batch_resolution):
+                    batch_resolution = resolution
+                    batch.append(request)
+                    del self.pending[request.client_id]
+                    self.served_counter += 1
+                    self.last_served[request.client_id] = self.served_counter
+                else:
+                    # put back
+                    heapq.heappush(self.queue, (request.due_time, self.STATE_PRIORITY[request.state], request.version, request.client_id, request.version))
+
+            return batch
+
+    def _render(self, request: RenderRequest, client_thread):
+        if client_thread.stop_client is True:
+            return
+        with torch.no_grad(), torch.cuda.stream(self.stream):
+            try:
+                is_sent = client_thread.render(request.state, request.level)
+            except:
+                print("error occurred when rendering for client #{}".format(request.client_id))
+                traceback.print_exc()
+                return
+
+        with self.condition:
+            if request.client_id not in self.stats:
+                return
+            if is_sent is False:
+                # cancelled by a newer camera pose
+                self.stats[request.client_id].n_cancelled += 1
+                return
+            self.stats[request.client_id].update(request.submit_time, time.time())
+
+            # skip if a newer request received
+            if request.client_id in self.pending:
+                return
+            if request.state == "low":
+                # switch to high resolution
+                self.submit(request.client_id, state="high", delay=self.static_delay)
+            elif request.level + 1 < client_thread.get_n_refinement_levels():
+                # refine further
+                self.submit(request.client_id, state="high", level=request.level + 1)
+
+    def run(self):
+        executor = None
+        if self.max_concurrency > 1:
+            executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+        while True:
+            with self.condition:
+                batch = self._next_batch()
+                if self.stop_scheduler is True:
+                    break
+                # take a snapshot of the client threads, they may be unregistered during rendering
+                client_threads = [self.clients[i.client_id] for i in batch]
+
+            if executor is None:
+                for request, client_thread in zip(batch, client_threads):
+                    self._render(request, client_thread)
+            else:
+                # a batch contains at most one request per client, render them concurrently
+                list(executor.map(self._render, batch, client_threads))
+
+        if executor is not None:
+            executor.shutdown(wait=False)
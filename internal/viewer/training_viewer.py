@@ -1,4 +1,6 @@
+import time
 import queue
+import threading
 import traceback
 
 import numpy as np
@@ -10,6 +12,8 @@ import viser.transforms as vtf
 from queue import Queue
 
 from internal.cameras.cameras import Cameras
+from internal.models.gaussian_model_simplified import GaussianModelSimplified
+from internal.viewer.render_scheduler import RenderScheduler
 
 
 class MockGaussianModel:
@@ -24,13 +28,125 @@ class TrainingViewerRenderer:
         self.gaussian_model = MockGaussianModel
 
     def get_outputs(self, camera, scaling_modifier: float = 1.):
-        # TODO: support multiple client
-        # if multiple clients connected, they may get images mismatch to their camera poses,
-        # but I think fix it is unnecessary
+        # all the clients share a single render scheduler thread,
+        # so there is at most one camera waiting for the training thread
         self.camera_queue.put((camera, scaling_modifier))
         return self.renderer_output_queue.get()
 
 
+class SnapshotTrainingViewerRenderer:
+    """
+    Render from a read-only snapshot of the Gaussians instead of the training thread.
+
+    The training thread refreshes the snapshot every K steps.
+    Two snapshots are kept: the back one is replaced while the viewer is rendering the front one, then they are swapped.
+    On CUDA, the viewer renders on its own stream, ordered with the training stream by events.
+
+    Only the Gaussians are snapshotted, the parameters of the renderer itself (e.g. appearance models) are read directly.
+    """
+
+    def __init__(self, renderer, background_color: torch.Tensor, device):
+        self.renderer = renderer
+        self.background_color = background_color.to(device)
+        self.device = torch.device(device)
+        self.gaussian_model = MockGaussianModel()
+
+        self.stream = None
+        if self.device.type == "cuda":
+            self.stream = torch.cuda.Stream(self.device)
+
+        self.lock = threading.Lock()
+        self.front = 0
+        self.snapshots = [None, None]
+        self.snapshot_ready = [None, None]  # the events recorded after the snapshots created
+        self.render_finished = [None, None]  # the events recorded after the latest renderings of the snapshots
+        self.n_readers = [0, 0]  # the number of the renderings reading the snapshots
+
+    def update(self, gaussian_model) -> bool:
+        """
+        Called by the training thread
+
+        :return: False if the back snapshot is still being rendered
+        """
+
+        with self.lock:
+            back = 1 - self.front
+            if self.n_readers[back] > 0:
+                return False
+            render_finished = self.render_finished[back]
+
+        if render_finished is not None:
+            # the old snapshot may still be read by the viewer stream, wait before releasing its memory
+            torch.cuda.current_stream().wait_event(render_finished)
+
+        with torch.no_grad():
+            snapshot = GaussianModelSimplified(
+                xyz=gaussian_model.get_xyz.detach().clone(),
+                features_dc=gaussian_model._features_dc.detach(),
+                features_rest=gaussian_model._features_rest.detach(),
+                scaling=gaussian_model._scaling.detach(),
+                rotation=gaussian_model._rotation.detach(),
+                opacity=gaussian_model._opacity.detach(),
+                features_extra=gaussian_model.get_features_extra.detach().clone(),
+                sh_degree=gaussian_model.max_sh_degree,
+                device=self.device,
+            )
+        snapshot.active_sh_degree = gaussian_model.active_sh_degree
+
+        snapshot_ready = None
+        if self.stream is not None:
+            snapshot_ready = torch.cuda.Event()
+            snapshot_ready.record()
+
+        with self.lock:
+            self.snapshots[back] = snapshot
+            self.snapshot_ready[back] = snapshot_ready
+            self.render_finished[back] = None
+            self.front = back
+
+        return True
+
+    def get_outputs(self, camera, scaling_modifier: float = 1.):
+        """
+        Called by the render scheduler, on the stream `self.stream`
+        """
+
+        with self.lock:
+            index = self.front
+            snapshot = self.snapshots[index]
+            if snapshot is None:
+                return torch.zeros((3, int(camera.height), int(camera.width)), device=self.device)
+            self.n_readers[index] += 1
+            snapshot_ready = self.snapshot_ready[index]
+
+        render_finished = None
+        try:
+            if snapshot_ready is not None:
+                torch.cuda.current_stream().wait_event(snapshot_ready)
+            # the degree set by the viewer, but not higher than the trained one
+            active_sh_degree = snapshot.active_sh_degree
+            snapshot.active_sh_degree = min(active_sh_degree, self.gaussian_model.active_sh_degree)
+            try:
+                image = self.renderer(
+                    camera.to_device(self.device),
+                    snapshot,
+                    self.background_color,
+                    scaling_modifier=scaling_modifier,
+                )["render"]
+            finally:
+                snapshot.active_sh_degree = active_sh_degree
+            if self.stream is not None:
+                render_finished = torch.cuda.Event()
+                render_finished.record()
+        finally:
+            with self.lock:
+                self.n_readers[index] -= 1
+                if render_finished is not None:
+                    self.render_finished[index] = render_finished
+
+        return image
+
+
 # TODO: refactoring the the viewer
 class TrainingViewer(viewer.Viewer):
     def __init__(
@@ -42,7 +158,17 @@ class TrainingViewer(viewer.Viewer):
             available_appearance_options=None,
             host: str = "0.0.0.0",
             port: int = 8080,
+            snapshot_interval: int = 0,
+            renderer=None,
+            background_color: torch.Tensor = None,
+            device=None,
     ):
+        """
+        :param snapshot_interval: render from a snapshot of the Gaussians refreshed every `snapshot_interval` steps,
+            instead of rendering synchronously in the training thread, disabled if <= 0.
+            `renderer`, `background_color` and `device` are required when enabled.
+        """
+
         self.host = host
         self.port = port
         self.image_format = "jpeg"
@@ -67,12 +193,21 @@ class TrainingViewer(viewer.Viewer):
 
         self.camera_queue = Queue()
         self.renderer_output_queue = Queue()
-        self.viewer_renderer = TrainingViewerRenderer(self.camera_queue, self.renderer_output_queue)
+        self.snapshot_interval = snapshot_interval
+        if snapshot_interval > 0:
+            self.viewer_renderer = SnapshotTrainingViewerRenderer(renderer, background_color, device)
+        else:
+            self.viewer_renderer = TrainingViewerRenderer(self.camera_queue, self.renderer_output_queue)
 
         self.clients = {}
 
         self.is_training_paused = False
 
+        # the time spent by the training thread, used to report the viewer overhead
+        self.last_training_step_time = None
+        self.training_step_time = None  # moving average, in seconds
+        self.viewer_overhead = None  # moving average, in seconds
+
     def add_cameras_to_scene(self, viser_server):
         self.camera_handles = []
 
@@ -146,7 +281,19 @@ class TrainingViewer(viewer.Viewer):
     def start(self):
         super().start(False, server_config_fun=self.setup_training_panel)
 
+    def create_render_scheduler(self) -> RenderScheduler:
+        return RenderScheduler(self.viewer_renderer, stream=getattr(self.viewer_renderer, "stream", None))
+
     def process_all_render_requests(self, gaussian_model, renderer, background_color):
+        if self.snapshot_interval > 0:
+            # rendered by the scheduler, simply show the latest Gaussians
+            self.viewer_renderer.update(gaussian_model)
+            self.rerender_for_all_client()
+            if self.is_training_paused is True:
+                # block until resumed
+                self.camera_queue.get()
+            return
+
         device = gaussian_model.get_xyz.device
         while True:
             try:
@@ -171,7 +318,40 @@ class TrainingViewer(viewer.Viewer):
                 traceback.print_exc()
 
     def training_step(self, gaussian_model, renderer, background_color, step: int):
-        self.global_step_label.content = f"Step: {step}"
+        is_training_paused = self.is_training_paused
+        started_at = time.time()
+        self._training_step(gaussian_model, renderer, background_color, step)
+        if is_training_paused is True:
+            # the time spent on pausing is not an overhead
+            self.last_training_step_time = None
+        else:
+            self.update_overhead(started_at, time.time())
+        if self.training_step_time is None:
+            self.global_step_label.content = f"Step: {step}"
+            return
+        self.global_step_label.content = "Step: {}  \nStep Time: {:.2f}ms, Viewer Overhead: {:.2f}ms ({:.1f}%)".format(
+            step,
+            self.training_step_time * 1000.,
+            self.viewer_overhead * 1000.,
+            100. * self.viewer_overhead / self.training_step_time,
+        )
+
+    def update_overhead(self, started_at: float, finished_at: float, smoothing: float = 0.99):
+        def smooth(previous, value):
+            if previous is None:
+                return value
+            return smoothing * previous + (1 - smoothing) * value
+
+        self.viewer_overhead = smooth(self.viewer_overhead, finished_at - started_at)
+        if self.last_training_step_time is not None:
+            self.training_step_time = smooth(self.training_step_time, started_at - self.last_training_step_time)
+        self.last_training_step_time = started_at
+
+    def _training_step(self, gaussian_model, renderer, background_color, step: int):
+        if self.snapshot_interval > 0:
+            if self.is_training_paused is True or step % self.snapshot_interval == 0:
+                self.process_all_render_requests(gaussian_model, renderer, background_color)
+            return
 
         if self.is_training_paused is False:
             if self.camera_queue.empty() is True:
@@ -183,6 +363,6 @@ class TrainingViewer(viewer.Viewer):
         self.process_all_render_requests(gaussian_model, renderer, background_color)
 
     def validation_step(self, gaussian_model, renderer, background_color, step: int):
-        if self.camera_queue.empty() is True:
+        if self.snapshot_interval > 0 or self.camera_queue.empty() is True:
             return
         self.process_all_render_requests(gaussian_model, renderer, background_color)
@@ -61,6 +61,41 @@ class DeformableModelTestCase(unittest.TestCase):
         self.assertEqual(dn.skip_layers[0][0].in_features, 84)
         print(dn)
 
+    def test_chunk(self):
+        network_factory = NetworkFactory(tcnn=False)
+        torch.manual_seed(42)
+        dn = DeformModel(network_factory, D=4, W=64, t_D=2, t_W=64, t_multires=6)
+        x = torch.randn((3000, 3))
+        t = torch.rand((1, 1)).expand(3000, -1)
+
+        def forward_and_backward(chunk: int, memory_budget: float = -1, gradient_checkpointing: bool = True):
+            dn.chunk = chunk
+            dn.memory_budget = memory_budget
+            dn.gradient_checkpointing = gradient_checkpointing
+            dn.zero_grad()
+            outputs = dn(x, t)
+            sum([i.sum() for i in outputs]).backward()
+            return outputs, [i.grad.clone() for i in dn.parameters()]
+
+        expected_outputs, expected_grads = forward_and_backward(-1)
+        for chunk, memory_budget, gradient_checkpointing in [
+            (1024, -1, True),
+            (1024, -1, False),
+            # 1024 Gaussians at least
+            (0, 1e-3, True),
+            (0, -1, True),
+        ]:
+            outputs, grads = forward_and_backward(chunk, memory_budget, gradient_checkpointing)
+            for i, j in zip(outputs, expected_outputs):
+                self.assertTrue(torch.allclose(i, j, atol=1e-6))
+            for i, j in zip(grads, expected_grads):
+                self.assertTrue(torch.allclose(i, j, rtol=1e-4, atol=1e-5))
+
+        # not chunked on CPU without a budget
+        self.assertEqual(dn.get_chunk_size(3000, "cpu"), 3000)
+        dn.memory_budget = 8.
+        self.assertEqual(dn.get_chunk_size(3000, "cpu"), 8 * 1024 * 1024 // dn.get_bytes_per_gaussian())
+
     def test_synthetic_scene_output(self):
         vanilla_model = VanillaDeformNetwork(is_blender=True)
         vanilla_model.load_state_dict(torch.load("../../../src/Deformable-3D-Gaussians/output/lego/deform/iteration_40000/deform.pth"))
@@ -0,0 +1,110 @@
+import os
+import unittest
+import tempfile
+from types import SimpleNamespace
+
+import torch
+
+from internal.models.deform_model import DeformModel
+from internal.utils.deformation_baking import BakedDeformation, get_baking_errors
+from internal.utils.network_factory import NetworkFactory
+
+
+class DeformationBakingTestCase(unittest.TestCase):
+    def _get_deform_fn(self, n: int = 256):
+        torch.manual_seed(42)
+        deform_model = DeformModel(NetworkFactory(tcnn=False), D=4, W=32)
+        xyz = torch.randn((n, 3))
+        static = torch.randn((n, 2))
+
+        @torch.no_grad()
+        def deform_fn(t: float):
+            d_xyz, d_rotation, d_scaling = deform_model(xyz, torch.full((n, 1), t))
+            return d_xyz, d_rotation, d_scaling, static
+
+        return deform_fn
+
+    def test_float16(self):
+        deform_fn = self._get_deform_fn()
+        baked = BakedDeformation.bake(deform_fn, 11)
+        self.assertEqual(baked.n_gaussians, 256)
+        # the static one only stores its mean
+        self.assertIsNone(baked.residuals[3])
+        self.assertEqual(baked.residuals[0].dtype, torch.float16)
+        self.assertEqual(baked.residuals[0].shape, (11, 256, 3))
+
+        # the keyframes
+        for rms, max_error in get_baking_errors(baked, deform_fn, [0., 0.3, 1.]):
+            self.assertLess(max_error, 1e-3)
+        # the interpolated ones, more accurate with more keyframes
+        times = [0.05, 0.55, 0.95]
+        denser_errors = get_baking_errors(BakedDeformation.bake(deform_fn, 41), deform_fn, times)
+        for i, j in zip(get_baking_errors(baked, deform_fn, times)[:3], denser_errors[:3]):
+            self.assertLess(j[0], i[0])
+        self.assertEqual(denser_errors[3], (0., 0.))
+
+        # clamped to the baked range
+        for i, j in zip(baked(-1.), baked(0.)):
+            self.assertTrue(torch.equal(i, j))
+        self.assertEqual(baked.get_interpolation(1.), (9, 10, 1.))
+        left, right, weight = baked.get_interpolation(0.25)
+        self.assertEqual((left, right), (2, 3))
+        self.assertAlmostEqual(weight, 0.5, places=5)
+
+    def test_low_rank(self):
+        deform_fn = self._get_deform_fn()
+        times = [0.05, 0.3, 0.55, 0.95]
+
+        # full rank reproduces the keyframes
+        full_rank = BakedDeformation.bake(deform_fn, 8, mode="low_rank", rank=8)
+        self.assertEqual(full_rank.temporal_bases[0].shape, (8, 8))
+        self.assertEqual(full_rank.residuals[0].shape, (8, 256, 3))
+        keyframe_times = torch.linspace(0., 1., 8).tolist()
+        for rms, max_error in get_baking_errors(full_rank, deform_fn, keyframe_times):
+            self.assertLess(max_error, 1e-3)
+
+        errors = get_baking_errors(BakedDeformation.bake(deform_fn, 8, mode="low_rank", rank=2), deform_fn, times)
+        full_rank_errors = get_baking_errors(full_rank, deform_fn, times)
+        self.assertLess(full_rank.get_n_bytes(), BakedDeformation.bake(deform_fn, 9).get_n_bytes())
+        for i, j in zip(errors[:3], full_rank_errors[:3]):
+            self.assertLessEqual(j[0], i[0] + 1e-6)
+
+    def test_save_and_load(self):
+        deform_fn = self._get_deform_fn()
+        for mode in ["float16", "low_rank"]:
+            baked = BakedDeformation.bake(deform_fn, 5, t_min=0.2, t_max=0.8, mode=mode, rank=3)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, "baked.pt")
+                baked.save(path)
+                loaded = BakedDeformation.load(path, device="cpu")
+            self.assertEqual(loaded.mode, mode)
+            self.assertEqual((loaded.t_min, loaded.t_max, loaded.n_keyframes), (0.2, 0.8, 5))
+            for i, j in zip(loaded(torch.tensor([0.5])), baked(0.5)):
+                self.assertTrue(torch.equal(i, j))
+
+    def test_renderer(self):
+        from internal.renderers.baked_deformation_renderer import BakedDeformationRenderer
+        from internal.renderers.renderer import Renderer
+
+        class DeformableRenderer(Renderer):
+            def get_deformation(self, pc, time):
+                return pc.get_xyz * time, pc.get_xyz
+
+            def _render(self, d_xyz, d_rotation, viewpoint_camera, pc, bg_color, scaling_modifier=1.0):
+                return {"render": pc.get_xyz + d_xyz + d_rotation}
+
+        pc = SimpleNamespace(get_xyz=torch.randn((16, 3)))
+        live_renderer = DeformableRenderer()
+        baked = BakedDeformation.bake(lambda t: live_renderer.get_deformation(pc, torch.tensor([t])), 3)
+        renderer = BakedDeformationRenderer(live_renderer, baked)
+
+        camera = SimpleNamespace(time=torch.tensor([0.25]))
+        expected = live_renderer._render(*live_renderer.get_deformation(pc, camera.time), camera, pc, None)
+        self.assertTrue(torch.allclose(renderer(camera, pc, None)["render"], expected["render"], atol=1e-3))
+
+        with self.assertRaises(AssertionError):
+            renderer(camera, SimpleNamespace(get_xyz=torch.randn((8, 3))), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import pickle
+import unittest
+
+import torch
+
+from internal.models.deform_model import DeformModel
+from internal.utils.deformation_cache import DeformationCache
+from internal.utils.network_factory import NetworkFactory
+
+
+class DeformationCacheTestCase(unittest.TestCase):
+    def _new_deform_model(self):
+        torch.manual_seed(42)
+        return DeformModel(NetworkFactory(tcnn=False), D=4, W=32)
+
+    def test_cache(self):
+        deform_model = self._new_deform_model()
+        xyz = torch.randn((100, 3))
+        cache = DeformationCache(max_entries=2)
+        n_calls = [0]
+
+        def query(time: float):
+            time = torch.tensor([time])
+
+            def fn():
+                n_calls[0] += 1
+                return deform_model(xyz, time.unsqueeze(0).expand(xyz.shape[0], -1))
+
+            return cache(time, [xyz], deform_model, fn)
+
+        with torch.no_grad():
+            expected = query(0.)
+            self.assertEqual(n_calls[0], 1)
+            outputs = query(0.)
+            self.assertEqual(n_calls[0], 1)
+            for i, j in zip(outputs, expected):
+                self.assertTrue(torch.equal(i, j))
+
+            # the least recently used one is evicted
+            query(0.5)
+            query(0.)
+            query(1.)
+            self.assertEqual(n_calls[0], 3)
+            query(0.)
+            self.assertEqual(n_calls[0], 3)
+            query(0.5)
+            self.assertEqual(n_calls[0], 4)
+
+            # the positions changed
+            xyz += 1.
+            query(0.5)
+            self.assertEqual(n_calls[0], 5)
+            # the network changed
+            deform_model.gaussian_warp[0].bias += 1.
+            query(0.5)
+            self.assertEqual(n_calls[0], 6)
+            self.assertEqual(cache.hits, 3)
+
+        # not cached when gradients are required
+        query(0.5)
+        self.assertEqual(n_calls[0], 7)
+
+    def test_memory_limit(self):
+        outputs = (torch.zeros((1024, 256)),)  # 1MB
+        cache = DeformationCache(max_entries=8, max_memory=2.5)
+        for i in range(4):
+            cache.put((i,), outputs)
+        self.assertEqual(list(cache.cache.keys()), [(2,), (3,)])
+        self.assertEqual(cache.n_bytes, 2 * 1024 * 1024)
+
+        # larger than the limit
+        cache.put((4,), (torch.zeros((1024, 1024)),))
+        self.assertIsNone(cache.get((4,)))
+        self.assertEqual(len(cache.cache), 2)
+
+        # the outputs are not pickled
+        restored = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(restored.cache), 0)
+        self.assertEqual(restored.max_memory, 2.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -243,6 +243,82 @@ class GaussianModelTestCase(unittest.TestCase):
         self.assertTrue(torch.all(opacities_value[gaussian_to_split] == model._opacity[-2 * num_split_gaussians:-num_split_gaussians]))
         self.assertTrue(torch.all(features_extra_value[gaussian_to_split] == model._features_extra[-2 * num_split_gaussians:-num_split_gaussians]))
 
+    def test_densification_budget(self):
+        device = torch.device("cuda")
+        num_points = 256
+        pcd = self._generate_point_cloud(num_points)
+
+        model = GaussianModel(sh_degree=3)
+        model.create_from_pcd(pcd, device)
+        with torch.no_grad():
+            # half of them are cloned, the others are split
+            model._scaling.copy_(torch.log(torch.linspace(0.01, 1., num_points, device=device)).unsqueeze(-1).repeat(1, 3))
+            model._opacity.fill_(1.)
+        model.training_setup(OptimizationParams(max_gaussians=num_points + 32), 1.)
+        model.percent_dense = 0.5
+
+        model.xyz_gradient_accum = torch.rand((num_points, 1), device=device)
+        model.denom = torch.ones((num_points, 1), device=device)
+        model.max_radii2D = torch.zeros((num_points,), device=device)
+        priority = model.xyz_gradient_accum.squeeze(-1).clone()
+        features_dc = model._features_dc.detach().clone()
+
+        stats = model.densify_and_prune(0.5, 0.005, extent=1., prune_extent=1., max_screen_size=None)
+        self.assertEqual(stats["candidates"], (priority >= 0.5).sum().item())
+        self.assertEqual(stats["accepted"], 32)
+        self.assertEqual(stats["rejected"], stats["candidates"] - 32)
+        self.assertEqual(model.get_xyz.shape[0], num_points + 32)
+        # only the ones with the largest gradients are cloned or split, both result in two Gaussians
+        expected_counts = torch.ones((num_points,), dtype=torch.long, device=device)
+        expected_counts[torch.topk(priority, 32).indices] = 2
+        counts = torch.all((features_dc[:, None] == model._features_dc.detach()[None]).flatten(2), dim=-1).sum(dim=-1)
+        self.assertTrue(torch.equal(counts, expected_counts))
+
+    def test_lazy_sh_bands(self):
+        device = torch.device("cuda")
+        num_points = 128
+        pcd = self._generate_point_cloud(num_points)
+
+        model = GaussianModel(sh_degree=3, lazy_sh_bands=True)
+        model.create_from_pcd(pcd, device)
+        self.assertEqual(model._features_rest.shape, (num_points, 0, 3))
+        model.training_setup(OptimizationParams(), 1.)
+
+        def step():
+            loss = (model.get_xyz.sum(-1) + model.get_features.sum((1, 2)) + model.get_opacity.squeeze(-1)).sum()
+            loss.backward()
+            model.optimizer.step()
+            model.optimizer.zero_grad(set_to_none=True)
+
+        step()
+        for sh_degree in range(1, 4):
+            features_rest = model._features_rest.detach().clone()
+            exp_avg = model.optimizer.state[model._features_rest]["exp_avg"].clone()
+            model.oneupSHdegree()
+            n_coefficients = (sh_degree + 1) ** 2 - 1
+            self.assertEqual(model._features_rest.shape, (num_points, n_coefficients, 3))
+            self.assertEqual(model.get_features.shape, (num_points, n_coefficients + 1, 3))
+            # the allocated ones are preserved, the new ones are zeros
+            state = model.optimizer.state[model._features_rest]
+            self.assertTrue(torch.equal(model._features_rest[:, :features_rest.shape[1]], features_rest))
+            self.assertTrue(torch.all(model._features_rest[:, features_rest.shape[1]:] == 0))
+            self.assertTrue(torch.equal(state["exp_avg"][:, :exp_avg.shape[1]], exp_avg))
+            self.assertEqual(state["exp_avg_sq"].shape, model._features_rest.shape)
+            step()
+        self.assertEqual(model.get_features.shape[1], (model.max_sh_degree + 1) ** 2)
+
+        # the saved ones always contain all the SH bands
+        model = GaussianModel(sh_degree=3, lazy_sh_bands=True)
+        model.create_from_pcd(pcd, device)
+        model.oneupSHdegree()
+        self.assertEqual(model._features_rest.shape, (num_points, 3, 3))
+        output_path = os.path.join(os.path.dirname(__file__), "test_model_lazy_sh_bands.ply")
+        model.save_ply(output_path)
+        model_from_ply = GaussianModel(3, 0)
+        model_from_ply.load_ply(output_path, device)
+        self.assertEqual(model_from_ply._features_rest.shape, (num_points, 15, 3))
+        self.assertTrue(torch.equal(model_from_ply.get_features[:, :4], model.get_features))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import torch
+
+from internal.model_components.gs4d_hexplane import HexPlaneField, interpolate_ms_features, interpolate_ms_features_fused, group_planes_by_shape
+
+
+class GS4DHexPlaneTestCase(unittest.TestCase):
+    def _new_field(self, resolution):
+        torch.manual_seed(42)
+        field = HexPlaneField(1.6, {
+            "grid_dimensions": 2,
+            "input_coordinate_dim": 4,
+            "output_coordinate_dim": 8,
+            "resolution": resolution,
+        }, [1, 2])
+        # the time planes are initialized to ones
+        with torch.no_grad():
+            for grid in field.grids:
+                for plane in grid:
+                    plane.uniform_(0.1, 1.)
+        return field
+
+    def _interpolate(self, fn, field, pts, concat_features: bool = True):
+        return fn(pts, ms_grids=field.grids, grid_dimensions=2, concat_features=concat_features, num_levels=None)
+
+    def test_group_planes_by_shape(self):
+        # the spatial planes, then the time planes
+        self.assertEqual(group_planes_by_shape(self._new_field([16, 16, 16, 5]).grids[0]), [[0, 1, 3], [2, 4, 5]])
+        self.assertEqual(group_planes_by_shape(self._new_field([8, 8, 8, 8]).grids[0]), [[0, 1, 2, 3, 4, 5]])
+        self.assertEqual(len(group_planes_by_shape(self._new_field([8, 12, 16, 5]).grids[0])), 6)
+
+    def test_fused(self):
+        pts = torch.rand((1000, 4)) * 2.2 - 1.1  # some are out of the bounds
+        for resolution in [[16, 16, 16, 5], [8, 8, 8, 8], [8, 12, 16, 5]]:
+            field = self._new_field(resolution)
+            for concat_features in [True, False]:
+                with torch.no_grad():
+                    expected = self._interpolate(interpolate_ms_features, field, pts, concat_features)
+                    fused = self._interpolate(interpolate_ms_features_fused, field, pts, concat_features)
+                self.assertEqual(fused.shape, expected.shape)
+                self.assertTrue(torch.allclose(fused, expected, atol=1e-6), msg="{}".format(resolution))
+
+            # gradients
+            grad_pts = pts.clone().requires_grad_(True)
+            expected_features = self._interpolate(interpolate_ms_features, field, grad_pts)
+            expected_features.square().sum().backward()
+            expected_grads = [i.grad.clone() for i in field.parameters() if i.requires_grad is True] + [grad_pts.grad.clone()]
+            field.zero_grad()
+            grad_pts.grad = None
+            fused_features = self._interpolate(interpolate_ms_features_fused, field, grad_pts)
+            fused_features.square().sum().backward()
+            fused_grads = [i.grad for i in field.parameters() if i.requires_grad is True] + [grad_pts.grad]
+            self.assertTrue(torch.allclose(fused_features, expected_features, atol=1e-6))
+            for i, j in zip(fused_grads, expected_grads):
+                self.assertTrue(torch.allclose(i, j, rtol=1e-4, atol=1e-5))
+
+    def test_field(self):
+        field = self._new_field([16, 16, 16, 5])
+        pts = torch.rand((100, 3)) * 3. - 1.5
+        timestamps = torch.rand((100, 1))
+        with torch.no_grad():
+            field.fused = True
+            fused = field(pts, timestamps)
+            field.fused = False
+            self.assertTrue(torch.allclose(fused, field(pts, timestamps), atol=1e-6))
+        self.assertEqual(fused.shape, (100, field.feat_dim))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import torch
+
+from internal.dataset import ImportanceSampler
+
+
+class ImportanceSamplerTestCase(unittest.TestCase):
+    def run_epochs(self, seed: int, n_epochs: int) -> list:
+        image_names = ["{}.png".format(i) for i in range(16)]
+        sampler = ImportanceSampler(image_names, temperature=0.5, uniform_ratio=0.1)
+        generator = torch.Generator().manual_seed(seed)
+
+        sampled = []
+        for _ in range(n_epochs):
+            positions = sampler.sample(generator)
+            sampled.append(positions)
+            for i in positions:
+                # the images with larger ids are harder
+                sampler.update(image_names[i], torch.tensor(0.01 * (i + 1)))
+        return sampled
+
+    def test_deterministic(self):
+        self.assertEqual(self.run_epochs(42, 8), self.run_epochs(42, 8))
+        self.assertNotEqual(self.run_epochs(42, 8), self.run_epochs(43, 8))
+
+    def test_sample_hard_images(self):
+        sampled = torch.tensor(self.run_epochs(42, 64)[1:])
+        counts = torch.bincount(sampled.flatten(), minlength=16)
+        self.assertGreater(counts[12:].sum(), 4 * counts[:4].sum())
+        # every image is still visited
+        self.assertTrue(torch.all(counts > 0))
+
+    def test_invalid_refresh_interval(self):
+        with self.assertRaises(AssertionError):
+            ImportanceSampler(["a", "b"], refresh_every_n_epochs=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
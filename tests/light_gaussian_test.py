@@ -0,0 +1,125 @@
+import unittest
+from types import SimpleNamespace
+
+import torch
+
+from internal.utils.light_gaussian import get_count_and_score, hit_pixel_count_torch, calculate_v_imp_score, get_prune_mask
+from internal.utils.gaussian_projection import project_gaussians
+from internal.utils.synthetic_scene import random_gaussians, sphere_cameras
+
+
+class LightGaussianTestCase(unittest.TestCase):
+    def _new_gaussian_model(self, n: int = 256):
+        gaussian = random_gaussians(n, sh_degree=0, seed=42)
+        return SimpleNamespace(
+            get_xyz=gaussian.xyz,
+            get_opacity=torch.sigmoid(gaussian.opacities),
+            get_scaling=torch.exp(gaussian.scales) * 4.,
+            get_rotation=torch.nn.functional.normalize(gaussian.rotations, dim=-1),
+        )
+
+    def _hit_pixel_count_dense(self, model, camera, block_size: int = 16):
+        """
+        Composite every pixel with all the Gaussians touching its tile, one pixel at a time
+        """
+
+        xys, depths, radii, conics, comp, num_tiles_hit, _, mask, rect_min, rect_max = project_gaussians(
+            means_3d=model.get_xyz,
+            scales=model.get_scaling,
+            scale_modifier=1.,
+            quaternions=model.get_rotation,
+            world_to_camera=camera.world_to_camera,
+            fx=camera.fx,
+            fy=camera.fy,
+            cx=camera.cx,
+            cy=camera.cy,
+            img_height=camera.height,
+            img_width=camera.width,
+            block_width=block_size,
+        )
+        opacities = model.get_opacity.squeeze(-1) * comp
+        n = xys.shape[0]
+        results = [torch.zeros((n,)) for _ in range(4)]
+        order = torch.argsort(depths, stable=True)
+
+        for y in range(int(camera.height.item())):
+            for x in range(int(camera.width.item())):
+                tile = torch.tensor([x // block_size, y // block_size])
+                touched = mask & torch.all(rect_min <= tile, dim=-1) & torch.all(rect_max > tile, dim=-1)
+                transmittance = 1.
+                for i in order[touched[order]].tolist():
+                    d = xys[i] - torch.tensor([x + 0.5, y + 0.5])
+                    sigma = 0.5 * (conics[i, 0] * d[0] * d[0] + conics[i, 2] * d[1] * d[1]) + conics[i, 1] * d[0] * d[1]
+                    if sigma < 0.:
+                        continue
+                    alpha = min(0.99, (opacities[i] * torch.exp(-sigma)).item())
+                    if alpha < 1. / 255.:
+                        continue
+                    if transmittance * (1. - alpha) < 1e-4:
+                        break
+                    results[0][i] += 1
+                    results[1][i] += opacities[i]
+                    results[2][i] += alpha
+                    results[3][i] += alpha * transmittance
+                    transmittance *= 1. - alpha
+
+        return results
+
+    def test_hit_pixel_count_torch(self):
+        model = self._new_gaussian_model(64)
+        camera = sphere_cameras(1, width=40, height=24)[0]
+
+        with torch.no_grad():
+            results = hit_pixel_count_torch(
+                means3D=model.get_xyz,
+                opacities=model.get_opacity,
+                scales=model.get_scaling,
+                rotations=model.get_rotation,
+                viewpoint_camera=camera,
+                anti_aliased=True,
+                # evaluated in multiple pixel chunks
+                max_tile_pairs=512,
+            )
+            expected = self._hit_pixel_count_dense(model, camera)
+
+        self.assertGreater(results[0].sum().item(), 0)
+        self.assertTrue(torch.equal(results[0], expected[0].int()))
+        for i in range(1, 4):
+            self.assertTrue(torch.allclose(results[i], expected[i], rtol=1e-4, atol=1e-4))
+
+    def test_get_count_and_score(self):
+        model = self._new_gaussian_model()
+        cameras = sphere_cameras(6, width=32, height=32)
+
+        with torch.no_grad():
+            expected = get_count_and_score(model, [cameras[i] for i in range(len(cameras))], True, camera_chunk_size=1, hit_pixel_count_fn=hit_pixel_count_torch)
+            for camera_chunk_size in [1, 4, 64]:
+                results = get_count_and_score(model, cameras, True, camera_chunk_size=camera_chunk_size, hit_pixel_count_fn=hit_pixel_count_torch)
+                for i, j in zip(results, expected):
+                    self.assertTrue(torch.allclose(i, j))
+
+            # the sums over the selected cameras only
+            subsampled = get_count_and_score(model, cameras, True, subsample_ratio=0.5, hit_pixel_count_fn=hit_pixel_count_torch)
+            self.assertTrue(torch.all(subsampled[0] <= expected[0]))
+            self.assertLess(subsampled[0].sum().item(), expected[0].sum().item())
+            self.assertGreater(subsampled[0].sum().item(), 0)
+
+    def test_prune_mask(self):
+        generator = torch.Generator().manual_seed(42)
+        for n in [1, 2, 10, 1001]:
+            scales = torch.rand((n, 3), generator=generator)
+            scores = torch.rand((n,), generator=generator)
+
+            # the full sort ones
+            volume = torch.prod(scales, dim=1)
+            expected_v_list = torch.pow(volume / torch.sort(volume, descending=True)[0][int(n * 0.9)], 0.1) * scores
+            v_list = calculate_v_imp_score(scales, scores, 0.1)
+            self.assertTrue(torch.allclose(v_list, expected_v_list))
+
+            for percent in [0., 0.33, 0.66, 1.]:
+                threshold = torch.sort(v_list, dim=0)[0][int(percent * (n - 1))]
+                self.assertTrue(torch.equal(get_prune_mask(percent, v_list), (v_list <= threshold).squeeze()))
+
+
+if __name__ == '__main__':
+    unittest.main()
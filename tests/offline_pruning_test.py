@@ -0,0 +1,124 @@
+import os
+import json
+import unittest
+import tempfile
+
+import torch
+
+from internal.utils.gaussian_utils import Gaussian
+from internal.utils.offline_pruning import load_cameras_json, to_gaussian_model, get_importance_score, get_n_keep, get_keep_mask, \
+    select_gaussians, reduce_sh_degree, update_checkpoint
+from internal.utils.sh_distillation import fibonacci_sphere, get_colors
+from internal.utils.synthetic_scene import random_gaussians, sphere_cameras
+
+
+class OfflinePruningTestCase(unittest.TestCase):
+    def _write_cameras_json(self, cameras, path: str):
+        """
+        The same as the one written by the training
+        """
+
+        camera_to_world = torch.linalg.inv(torch.transpose(cameras.world_to_camera, 1, 2)).numpy()
+        with open(path, "w") as f:
+            json.dump([{
+                "id": idx,
+                "img_name": "{:03d}".format(idx),
+                "width": int(cameras.width[idx]),
+                "height": int(cameras.height[idx]),
+                "position": camera_to_world[idx, :3, 3].tolist(),
+                "rotation": [x.tolist() for x in camera_to_world[idx, :3, :3]],
+                "fy": float(cameras.fy[idx]),
+                "fx": float(cameras.fx[idx]),
+            } for idx in range(len(cameras))], f)
+
+    def test_load_cameras_json(self):
+        cameras = sphere_cameras(4, width=64, height=48)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cameras.json")
+            self._write_cameras_json(cameras, path)
+            loaded = load_cameras_json(path)
+
+        self.assertEqual(len(loaded), len(cameras))
+        self.assertTrue(torch.allclose(loaded.world_to_camera, cameras.world_to_camera, atol=1e-5))
+        for i in ["fx", "fy", "cx", "cy", "width", "height"]:
+            self.assertTrue(torch.allclose(getattr(loaded, i).float(), getattr(cameras, i).float()))
+
+    def test_prune(self):
+        gaussian = random_gaussians(256, sh_degree=3, extra_feature_dims=4, seed=42)
+        model = to_gaussian_model(gaussian, "cpu")
+        cameras = sphere_cameras(4, width=32, height=32)
+
+        for score_type in ["opacity", "volume", "visibility"]:
+            score = get_importance_score(model, cameras, score_type)
+            self.assertEqual(score.shape, (256,))
+            mask = get_keep_mask(score, get_n_keep(256, prune_percent=0.25))
+            self.assertEqual(mask.sum().item(), 192)
+            # the kept ones are the most important
+            self.assertGreaterEqual(score[mask].min().item(), score[~mask].max().item())
+
+        self.assertEqual(get_n_keep(256, target_count=100), 100)
+        self.assertEqual(get_n_keep(256, target_count=1000), 256)
+
+        pruned = reduce_sh_degree(select_gaussians(gaussian, mask), 1)
+        self.assertEqual(pruned.sh_degrees, 1)
+        self.assertEqual(pruned.xyz.shape[0], 192)
+        self.assertEqual(pruned.features_rest.shape, (192, 3, 3))
+        # fitted to the colors, better than the truncated ones
+        directions = fibonacci_sphere(256)
+        errors = []
+        colors = get_colors(3, torch.concat([gaussian.features_dc, gaussian.features_rest], dim=1)[mask], directions)
+        for features in [
+            torch.concat([pruned.features_dc, pruned.features_rest], dim=1),
+            torch.concat([gaussian.features_dc, gaussian.features_rest[:, :3]], dim=1)[mask],
+        ]:
+            errors.append(torch.mean((get_colors(1, features, directions) - colors) ** 2).item())
+        self.assertLess(errors[0], errors[1])
+        self.assertTrue(torch.equal(pruned.real_features_extra, gaussian.real_features_extra[mask]))
+
+        # the pruned checkpoint can be loaded in the same way
+        checkpoint = {
+            "state_dict": {
+                "gaussian_model._xyz": gaussian.xyz,
+                "gaussian_model._features_dc": gaussian.features_dc,
+                "gaussian_model._features_rest": gaussian.features_rest,
+                "gaussian_model._scaling": gaussian.scales,
+                "gaussian_model._rotation": gaussian.rotations,
+                "gaussian_model._opacity": gaussian.opacities,
+                "gaussian_model._features_extra": gaussian.real_features_extra,
+            },
+            "gaussian_model_extra_state_dict": {
+                "max_radii2D": torch.arange(256),
+                "active_sh_degree": 3,
+            },
+            "optimizer_states": [{
+                "state": {
+                    0: {"step": torch.arange(256), "exp_avg": gaussian.xyz, "exp_avg_sq": gaussian.xyz},
+                    1: {"step": torch.tensor(10.), "exp_avg": gaussian.features_rest, "exp_avg_sq": gaussian.features_rest},
+                    2: {"step": torch.tensor(10.), "exp_avg": torch.ones((256, 4))},
+                },
+                "param_groups": [
+                    {"name": "xyz", "params": [0]},
+                    {"name": "f_rest", "params": [1]},
+                    {"name": "appearance", "params": [2]},
+                ],
+            }],
+        }
+        updated = update_checkpoint(checkpoint, pruned, mask)
+        # the optimizer states are pruned and resized, the original ones are not modified
+        updated_state = updated["optimizer_states"][0]["state"]
+        self.assertTrue(torch.equal(updated_state[0]["step"], torch.nonzero(mask).squeeze(-1)))
+        self.assertTrue(torch.equal(updated_state[0]["exp_avg"], gaussian.xyz[mask]))
+        self.assertTrue(torch.equal(updated_state[1]["exp_avg_sq"], gaussian.features_rest[mask][:, :3]))
+        self.assertTrue(torch.equal(updated_state[1]["step"], torch.tensor(10.)))
+        self.assertEqual(updated_state[2]["exp_avg"].shape, (256, 4))
+        self.assertEqual(checkpoint["optimizer_states"][0]["state"][0]["exp_avg"].shape[0], 256)
+        self.assertEqual(checkpoint["state_dict"]["gaussian_model._xyz"].shape[0], 256)
+        self.assertTrue(torch.equal(updated["gaussian_model_extra_state_dict"]["max_radii2D"], torch.nonzero(mask).squeeze(-1)))
+        self.assertEqual(updated["gaussian_model_extra_state_dict"]["active_sh_degree"], 1)
+        loaded = Gaussian.load_from_state_dict(1, updated["state_dict"])
+        for i in ["xyz", "features_rest", "scales", "opacities"]:
+            self.assertTrue(torch.equal(getattr(loaded, i), getattr(pruned, i)))
+
+
+if __name__ == '__main__':
+    unittest.main()
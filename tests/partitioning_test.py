@@ -0,0 +1,109 @@
+import os
+import unittest
+import tempfile
+
+import numpy as np
+import torch
+
+import internal.utils.colmap as colmap_utils
+from internal.cameras.cameras import Cameras
+from internal.configs.dataset import ColmapParams
+from internal.dataparsers.colmap_dataparser import ColmapDataParser
+from internal.utils.partitioning import plan_partitions, merge_partitions, cameras_from_colmap, write_colmap_partition, is_in_bounds
+from internal.utils.synthetic_scene import random_gaussians, write_colmap_dataset
+
+
+def aerial_cameras(n_rows: int, n_columns: int, height: float = 2., spacing: float = 1.) -> Cameras:
+    """
+    Looking down to the Z=0 plane
+    """
+
+    centers = torch.stack(torch.meshgrid(
+        torch.arange(n_rows, dtype=torch.float) * spacing,
+        torch.arange(n_columns, dtype=torch.float) * spacing,
+        indexing="ij",
+    ), dim=-1).reshape(-1, 2)
+    n = centers.shape[0]
+    centers = torch.concat([centers, torch.full((n, 1), height)], dim=-1)
+    # right: +X, down: -Y, forward: -Z
+    R = torch.tensor([[1., 0., 0.], [0., -1., 0.], [0., 0., -1.]]).T.expand(n, 3, 3)
+    T = -(R @ centers.unsqueeze(-1)).squeeze(-1)
+    return Cameras(
+        R=R,
+        T=T,
+        fx=torch.full((n,), 200.),
+        fy=torch.full((n,), 200.),
+        cx=torch.full((n,), 200.),
+        cy=torch.full((n,), 150.),
+        width=torch.full((n,), 400, dtype=torch.int),
+        height=torch.full((n,), 300, dtype=torch.int),
+        appearance_id=torch.zeros((n,), dtype=torch.int),
+        normalized_appearance_id=torch.zeros((n,)),
+        distortion_params=None,
+        camera_type=torch.zeros((n,), dtype=torch.int),
+    )
+
+
+class PartitioningTestCase(unittest.TestCase):
+    def test_plan_and_merge(self):
+        cameras = aerial_cameras(8, 6)
+        generator = torch.Generator().manual_seed(42)
+        points = torch.rand((20_000, 3), generator=generator) * torch.tensor([9., 7., 0.2]) - torch.tensor([1., 1., 0.1])
+
+        axes, partitions = plan_partitions(cameras, points, grid=(2, 3), margin=0.2)
+        self.assertEqual(axes, (0, 1))
+        self.assertEqual(len(partitions), 6)
+
+        # every point is in exactly one core region, and in the expanded region of its partition
+        n_cores = torch.zeros((points.shape[0],), dtype=torch.int)
+        for partition in partitions:
+            in_core = is_in_bounds(points, axes, partition.core_bounds)
+            n_cores += in_core
+            self.assertTrue(torch.all(torch.isin(torch.nonzero(in_core).squeeze(-1), partition.point_indices)))
+            self.assertGreater(partition.image_indices.shape[0], 0)
+        self.assertTrue(torch.all(n_cores == 1))
+
+        # every camera is assigned to at least one partition
+        assigned = torch.zeros((len(cameras),), dtype=torch.bool)
+        for partition in partitions:
+            assigned[partition.image_indices] = True
+        self.assertTrue(torch.all(assigned))
+
+        # the overlapping Gaussians are trimmed
+        trained = []
+        for partition in partitions:
+            gaussian = random_gaussians(partition.point_indices.shape[0], sh_degree=1)
+            gaussian.xyz = points[partition.point_indices]
+            trained.append(gaussian)
+        merged = merge_partitions(trained, axes, [i.core_bounds for i in partitions])
+        self.assertEqual(merged.xyz.shape[0], points.shape[0])
+        self.assertTrue(torch.equal(torch.unique(merged.xyz, dim=0), torch.unique(points, dim=0)))
+        # the ply structure is supported too
+        self.assertEqual(merge_partitions([i.to_ply_format() for i in trained], axes, [i.core_bounds for i in partitions]).xyz.shape[0], points.shape[0])
+
+    def test_colmap_partition(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_colmap_dataset(tmpdir, n_images=12, n_points=2000, width=80, height=60)
+            sparse_dir = os.path.join(tmpdir, "sparse", "0")
+            colmap_cameras = colmap_utils.read_cameras_binary(os.path.join(sparse_dir, "cameras.bin"))
+            colmap_images = dict(sorted(colmap_utils.read_images_binary(os.path.join(sparse_dir, "images.bin")).items()))
+            colmap_points = colmap_utils.read_points3D_binary(os.path.join(sparse_dir, "points3D.bin"))
+
+            points = torch.tensor(np.stack([i.xyz for i in colmap_points.values()]), dtype=torch.float)
+            axes, partitions = plan_partitions(cameras_from_colmap(colmap_cameras, colmap_images), points, grid=(2, 1))
+
+            for partition in partitions:
+                partition_path = os.path.join(tmpdir, "partitions", partition.name)
+                write_colmap_partition(partition_path, partition, colmap_cameras, colmap_images, colmap_points)
+                outputs = ColmapDataParser(
+                    partition_path,
+                    os.path.join(tmpdir, "output"),
+                    0,
+                    ColmapParams(image_dir=os.path.join(tmpdir, "images"), split_mode="reconstruction"),
+                ).get_outputs()
+                self.assertEqual(len(outputs.train_set), partition.image_indices.shape[0])
+                self.assertEqual(outputs.point_cloud.xyz.shape[0], partition.point_indices.shape[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import unittest
+import tempfile
+
+import torch
+
+from internal.models.gaussian_model_simplified import GaussianModelSimplified
+from internal.utils.offline_pruning import reduce_sh_degree
+from internal.utils.sh_distillation import fibonacci_sphere, get_camera_directions, get_colors, distill_sh, distill_sh_adaptive, \
+    get_sh_degree_groups
+from internal.utils.synthetic_scene import random_gaussians
+
+
+class SHDistillationTestCase(unittest.TestCase):
+    def _random_features(self, n: int, sh_degree: int, std: float = 0.1, seed: int = 42):
+        generator = torch.Generator().manual_seed(seed)
+        features = torch.randn((n, (sh_degree + 1) ** 2, 3), generator=generator) * std
+        # keep the colors away from the clamping
+        features[:, 0] = 1.
+        return features
+
+    def test_fibonacci_sphere(self):
+        directions = fibonacci_sphere(256)
+        self.assertEqual(directions.shape, (256, 3))
+        self.assertTrue(torch.allclose(torch.norm(directions, dim=-1), torch.ones((256,))))
+        self.assertLess(torch.norm(directions.mean(dim=0)).item(), 1e-2)
+
+    def test_distill_sh(self):
+        features = self._random_features(64, 3)
+        directions = fibonacci_sphere(256)
+
+        # the same degree
+        fitted, error = distill_sh(features, 3, 3, directions, ridge=0.)
+        self.assertTrue(torch.allclose(fitted, features, atol=1e-4))
+        self.assertLess(error.max().item(), 1e-4)
+
+        # the least squares fitting is better than the truncation
+        for target_sh_degree in [0, 1, 2]:
+            n_coefficients = (target_sh_degree + 1) ** 2
+            fitted, error = distill_sh(features, 3, target_sh_degree, directions, chunk_size=16)
+            self.assertEqual(fitted.shape, (64, n_coefficients, 3))
+            truncated_error = get_colors(target_sh_degree, features[:, :n_coefficients], directions) - get_colors(3, features, directions)
+            truncated_error = torch.sqrt(torch.mean(truncated_error * truncated_error, dim=(1, 2)))
+            self.assertTrue(torch.all(error <= truncated_error + 1e-6))
+            # the SH bases are orthogonal on the sphere, so the fitted ones are close to the truncated ones
+            self.assertTrue(torch.allclose(fitted, features[:, :n_coefficients], atol=1e-2))
+
+    def test_distill_sh_with_per_gaussian_directions(self):
+        features = self._random_features(32, 3)
+        directions = fibonacci_sphere(64)
+
+        expected, expected_error = distill_sh(features, 3, 1, directions)
+        fitted, error = distill_sh(features, 3, 1, directions.unsqueeze(0).repeat(32, 1, 1), chunk_size=10)
+        self.assertTrue(torch.allclose(fitted, expected, atol=1e-5))
+        self.assertTrue(torch.allclose(error, expected_error, atol=1e-5))
+
+        xyz = torch.randn((32, 3), generator=torch.Generator().manual_seed(42))
+        camera_directions = get_camera_directions(xyz, torch.tensor([[4., 0., 0.], [0., 4., 0.]]))
+        self.assertEqual(camera_directions.shape, (32, 2, 3))
+        fitted, error = distill_sh(features, 3, 0, camera_directions)
+        self.assertEqual(fitted.shape, (32, 1, 3))
+        self.assertEqual(error.shape, (32,))
+
+    def test_distill_sh_adaptive(self):
+        # the first half are view independent
+        features = self._random_features(64, 3)
+        features[:32, 1:] = 0.
+        directions = fibonacci_sphere(256)
+
+        distilled, sh_degrees = distill_sh_adaptive(features, 3, 1e-3, directions)
+        self.assertEqual(distilled.shape, features.shape)
+        self.assertTrue(torch.all(sh_degrees[:32] == 0))
+        self.assertTrue(torch.all(sh_degrees[32:] == 3))
+        self.assertTrue(torch.equal(distilled[32:], features[32:]))
+        self.assertTrue(torch.all(distilled[:32, 1:] == 0.))
+
+        # the coefficients higher than the degrees are zeros
+        distilled, sh_degrees = distill_sh_adaptive(features, 3, 0.05, directions, min_sh_degree=1)
+        self.assertTrue(torch.all(sh_degrees >= 1))
+        for i in range(64):
+            self.assertTrue(torch.all(distilled[i, (sh_degrees[i] + 1) ** 2:] == 0.))
+        errors = get_colors(3, distilled, directions) - get_colors(3, features, directions)
+        self.assertLessEqual(torch.sqrt(torch.mean(errors * errors, dim=(1, 2))).max().item(), 0.05 + 1e-6)
+
+    def test_adaptive_sh_degrees_ply(self):
+        gaussian = random_gaussians(64, sh_degree=3, extra_feature_dims=2, seed=42)
+        gaussian.features_rest[:32] = 0.
+        distilled = reduce_sh_degree(gaussian, 0, max_error=1e-3)
+        self.assertEqual(distilled.sh_degrees, 3)
+        self.assertTrue(torch.all(distilled.adaptive_sh_degrees[:32] == 0))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "point_cloud.ply")
+            distilled.to_ply_format().save_to_ply(path)
+            model = GaussianModelSimplified.construct_from_ply(path, 3, "cpu")
+
+        # reordered by the degrees
+        order = torch.argsort(distilled.adaptive_sh_degrees, stable=True)
+        self.assertTrue(torch.equal(model._adaptive_sh_degrees, distilled.adaptive_sh_degrees[order]))
+        self.assertTrue(torch.allclose(model.get_xyz, distilled.xyz[order]))
+        self.assertEqual(model.sh_degree_groups, get_sh_degree_groups(model._adaptive_sh_degrees))
+        self.assertEqual(model.sh_degree_groups[0], (0, 0, (distilled.adaptive_sh_degrees == 0).sum().item()))
+        self.assertEqual(model.sh_degree_groups[-1][2], 64)
+
+        model.delete_gaussians(torch.arange(64) < 8)
+        self.assertEqual(model._adaptive_sh_degrees.shape[0], 56)
+        self.assertEqual(model.sh_degree_groups[-1][2], 56)
+        self.assertTrue(torch.equal(model.to_parameter_structure().adaptive_sh_degrees, model._adaptive_sh_degrees))
+
+        # the ones without the degrees
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "point_cloud.ply")
+            gaussian.to_ply_format().save_to_ply(path)
+            model = GaussianModelSimplified.construct_from_ply(path, 3, "cpu")
+        self.assertIsNone(model.sh_degree_groups)
+
+
+if __name__ == '__main__':
+    unittest.main()
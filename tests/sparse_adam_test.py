@@ -0,0 +1,119 @@
+import unittest
+
+import torch
+
+from internal.utils.sparse_adam import SparseAdam, MixedPrecisionAdam
+
+
+class SparseAdamTestCase(unittest.TestCase):
+    def new_params(self, n: int = 128):
+        generator = torch.Generator().manual_seed(42)
+        return [
+            torch.nn.Parameter(torch.randn((n, 3), generator=generator)),
+            torch.nn.Parameter(torch.randn((n, 15, 3), generator=generator)),
+        ]
+
+    def new_grads(self, step: int, params):
+        generator = torch.Generator().manual_seed(step)
+        return [torch.randn(p.shape, generator=generator) for p in params]
+
+    def test_same_as_dense_adam_if_fully_visible(self):
+        dense_params = self.new_params()
+        sparse_params = self.new_params()
+        dense = torch.optim.Adam([{"params": [p], "lr": 0.01 * (i + 1)} for i, p in enumerate(dense_params)], eps=1e-15)
+        sparse = SparseAdam([{"params": [p], "lr": 0.01 * (i + 1)} for i, p in enumerate(sparse_params)], eps=1e-15)
+
+        for step in range(16):
+            for params in [dense_params, sparse_params]:
+                for p, g in zip(params, self.new_grads(step, params)):
+                    p.grad = g
+            dense.step()
+            if step % 2 == 0:
+                sparse.step(visibility=torch.ones((128,), dtype=torch.bool))
+            else:
+                # all the Gaussians are updated
+                sparse.step()
+
+        for p, q in zip(dense_params, sparse_params):
+            self.assertTrue(torch.allclose(p, q, atol=1e-5))
+            self.assertTrue(torch.allclose(dense.state[p]["exp_avg_sq"], sparse.state[q]["exp_avg_sq"]))
+            self.assertTrue(torch.all(sparse.state[q]["step"] == 16))
+
+    def test_only_update_visible(self):
+        params = self.new_params()
+        initial_values = [p.detach().clone() for p in params]
+        optimizer = SparseAdam([{"params": [p], "lr": 0.01} for p in params])
+        visibility = torch.arange(128) % 4 == 0
+
+        for step in range(4):
+            for p, g in zip(params, self.new_grads(step, params)):
+                p.grad = g
+            optimizer.step(visibility=visibility)
+
+        for p, initial in zip(params, initial_values):
+            self.assertTrue(torch.equal(p[~visibility], initial[~visibility]))
+            self.assertFalse(torch.any(p[visibility] == initial[visibility]))
+            self.assertTrue(torch.equal(optimizer.state[p]["step"], visibility.to(torch.float) * 4))
+            self.assertTrue(torch.all(optimizer.state[p]["exp_avg"][~visibility] == 0))
+
+        # a Gaussian visible for the first time gets the same update as the first step of the dense Adam
+        dense_param = torch.nn.Parameter(params[0].detach().clone())
+        dense = torch.optim.Adam([dense_param], lr=0.01)
+        grad = self.new_grads(4, params)
+        dense_param.grad = grad[0]
+        dense.step()
+        params[0].grad = grad[0]
+        params[1].grad = grad[1]
+        optimizer.step(visibility=~visibility)
+        self.assertTrue(torch.allclose(params[0][~visibility], dense_param[~visibility], atol=1e-6))
+
+    def test_low_precision(self):
+        def fit(dtype):
+            # every update is smaller than the resolution of bfloat16 around 1
+            param = torch.nn.Parameter(torch.ones((4096, 15, 3), dtype=dtype))
+            optimizer = SparseAdam([{"params": [param], "lr": 1e-4}], eps=1e-15)
+            for _ in range(64):
+                param.float().square().sum().backward()
+                optimizer.step()
+                optimizer.zero_grad()
+            return param, optimizer
+
+        float32_param, _ = fit(torch.float)
+        self.assertTrue(torch.allclose(float32_param, torch.full_like(float32_param, 1. - 64 * 1e-4)))
+        for dtype in [torch.bfloat16, torch.float16]:
+            param, optimizer = fit(dtype)
+            self.assertEqual(param.dtype, dtype)
+            self.assertEqual(optimizer.state[param]["exp_avg"].dtype, torch.bfloat16)
+            self.assertEqual(optimizer.state[param]["exp_avg_sq"].dtype, torch.bfloat16)
+            # the small updates are preserved in expectation by the stochastic rounding
+            self.assertLess(abs(param.float().mean().item() - float32_param.mean().item()), 1e-4)
+
+    def test_mixed_precision_adam(self):
+        dense_params = self.new_params()
+        mixed_params = self.new_params()
+        mixed_params[1] = torch.nn.Parameter(mixed_params[1].detach().to(torch.bfloat16))
+        dense = torch.optim.Adam([{"params": [p], "lr": 0.01} for p in dense_params], eps=1e-15)
+        # several chunks
+        mixed = MixedPrecisionAdam([{"params": [p], "lr": 0.01} for p in mixed_params], eps=1e-15, chunk_size=1000)
+
+        for step in range(16):
+            for params in [dense_params, mixed_params]:
+                for p, g in zip(params, self.new_grads(step, params)):
+                    p.grad = g.to(p.dtype)
+            dense.step()
+            mixed.step()
+
+        # the float32 ones are updated by `torch.optim.Adam`
+        self.assertTrue(torch.equal(dense_params[0], mixed_params[0]))
+        self.assertEqual(mixed_params[1].dtype, torch.bfloat16)
+        self.assertEqual(mixed.state[mixed_params[1]]["exp_avg_sq"].dtype, torch.bfloat16)
+        self.assertEqual(mixed.state[mixed_params[1]]["step"].item(), 16)
+        # the stochastic rounding errors are unbiased, but about one ulp per step
+        self.assertLess((mixed_params[1].float() - dense_params[1]).abs().mean().item(), 0.02)
+        self.assertTrue(torch.allclose(mixed.state[mixed_params[1]]["exp_avg"].float(), dense.state[dense_params[1]]["exp_avg"], atol=0.02))
+        # the gradients are kept
+        self.assertEqual(mixed_params[1].grad.dtype, torch.bfloat16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+import torch
+
+from internal.utils.ssim import ssim, fused_ssim
+
+
+class SSIMTestCase(unittest.TestCase):
+    def test_fused_ssim(self):
+        torch.manual_seed(42)
+        for shape in [(3, 64, 48), (2, 3, 37, 53)]:
+            for size_average in [True, False]:
+                if len(shape) == 3 and size_average is False:
+                    continue
+                img1 = torch.rand(shape, dtype=torch.float64, requires_grad=True)
+                img2 = torch.clamp(img1.detach() + 0.1 * torch.randn(shape, dtype=torch.float64), 0., 1.)
+
+                expected = ssim(img1, img2, size_average=size_average)
+                expected_grad, = torch.autograd.grad(expected.sum(), img1)
+                output = fused_ssim(img1, img2, size_average=size_average)
+                output_grad, = torch.autograd.grad(output.sum(), img1)
+
+                self.assertTrue(torch.allclose(output, expected, atol=1e-10))
+                self.assertTrue(torch.allclose(output_grad, expected_grad, atol=1e-10))
+
+        img1 = torch.rand((1, 3, 16, 16), dtype=torch.float64, requires_grad=True)
+        img2 = torch.rand((1, 3, 16, 16), dtype=torch.float64)
+        self.assertTrue(torch.autograd.gradcheck(lambda x: fused_ssim(x, img2), (img1,)))
+
+    def test_fused_ssim_both_require_grad(self):
+        img1 = torch.rand((3, 32, 32), dtype=torch.float64, requires_grad=True)
+        img2 = torch.rand((3, 32, 32), dtype=torch.float64, requires_grad=True)
+        expected_grads = torch.autograd.grad(ssim(img1, img2), (img1, img2))
+        output_grads = torch.autograd.grad(fused_ssim(img1, img2), (img1, img2))
+        for output_grad, expected_grad in zip(output_grads, expected_grads):
+            self.assertTrue(torch.allclose(output_grad, expected_grad, atol=1e-10))
+
+    def test_weighted_fused_ssim(self):
+        img1 = torch.rand((2, 3, 24, 32), dtype=torch.float64, requires_grad=True)
+        img2 = torch.rand((2, 3, 24, 32), dtype=torch.float64)
+        weights = torch.rand((2, 1, 24, 32)) > 0.3
+
+        for size_average in [True, False]:
+            # the autograd one is validated by the test cases above
+            expected = fused_ssim(img1, img2.requires_grad_(True), size_average=size_average, weights=weights)
+            expected_grad, = torch.autograd.grad(expected.sum(), img1)
+            output = fused_ssim(img1, img2.detach(), size_average=size_average, weights=weights)
+            output_grad, = torch.autograd.grad(output.sum(), img1)
+            self.assertTrue(torch.allclose(output, expected, atol=1e-10))
+            self.assertTrue(torch.allclose(output_grad, expected_grad, atol=1e-10))
+            img2 = img2.detach()
+
+        self.assertTrue(torch.allclose(
+            fused_ssim(img1, img2, weights=torch.ones((1, 24, 32), dtype=torch.bool)),
+            fused_ssim(img1, img2),
+        ))
+
+        # the masked pixels of `img2` are replaced by `img1`, their content does not matter
+        masked_changed = torch.where(weights, img2, torch.rand_like(img2))
+        self.assertTrue(torch.allclose(fused_ssim(img1, img2, weights=weights), fused_ssim(img1, masked_changed, weights=weights), atol=1e-12))
+        composited = torch.where(weights, img2, img1.detach())
+        self.assertTrue(torch.allclose(
+            fused_ssim(img1, img2, size_average=False, weights=weights),
+            fused_ssim(img1, composited, size_average=False, weights=weights),
+        ))
+        # the composited pixels are constants, the same as the G.T. composited outside
+        output_grad, = torch.autograd.grad(fused_ssim(img1, img2, weights=weights), img1)
+        expected_grad, = torch.autograd.grad(fused_ssim(img1, composited, weights=weights), img1)
+        self.assertTrue(torch.allclose(output_grad, expected_grad, atol=1e-10))
+
+
+if __name__ == '__main__':
+    unittest.main()
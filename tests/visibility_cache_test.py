@@ -0,0 +1,77 @@
+import unittest
+from types import SimpleNamespace
+
+import torch
+
+from internal.utils.visibility_cache import VisibilityCache
+from internal.models.gaussian_model_subset import GaussianModelSubset
+
+
+class VisibilityCacheTestCase(unittest.TestCase):
+    def test_expire(self):
+        cache = VisibilityCache(refresh_interval=10)
+        visibility_filter = torch.arange(100) % 3 == 0
+
+        self.assertIsNone(cache.get("a", 1, 100))
+        cache.update("a", 1, visibility_filter)
+        self.assertTrue(torch.equal(cache.get("a", 10, 100), torch.nonzero(visibility_filter).squeeze(-1)))
+        self.assertIsNone(cache.get("a", 11, 100))
+        # the number of Gaussians changed
+        self.assertIsNone(cache.get("a", 5, 99))
+        cache.invalidate()
+        self.assertIsNone(cache.get("a", 5, 100))
+        self.assertIsNone(cache.get("b", 5, 100))
+
+    def test_subset_gradients(self):
+        n = 256
+        generator = torch.Generator().manual_seed(42)
+        parameters = {
+            "_xyz": torch.randn((n, 3), generator=generator),
+            "_features_dc": torch.randn((n, 1, 3), generator=generator),
+            "_features_rest": torch.randn((n, 15, 3), generator=generator),
+            "_scaling": torch.randn((n, 3), generator=generator),
+            "_rotation": torch.randn((n, 4), generator=generator),
+            "_opacity": torch.randn((n, 1), generator=generator),
+            "_features_extra": torch.randn((n, 0), generator=generator),
+        }
+        model = SimpleNamespace(
+            max_sh_degree=3,
+            active_sh_degree=3,
+            scaling_activation=torch.exp,
+            rotation_activation=torch.nn.functional.normalize,
+            opacity_activation=torch.sigmoid,
+            covariance_activation=None,
+            **{k: torch.nn.Parameter(v) for k, v in parameters.items()},
+        )
+        visibility_filter = model._xyz[:, 2] > 0
+
+        def render(pc):
+            return pc.get_opacity[:, 0] * pc.get_scaling.sum(-1) * pc.get_rotation[:, 0] * pc.get_features.sum((1, 2)) + pc.get_xyz.sum(-1) + pc.get_features_extra.sum(-1)
+
+        # all the Gaussians are rendered, but only the visible ones contribute
+        render(GaussianModelSubset(model, torch.arange(n)))[visibility_filter].sum().backward()
+        expected = {k: getattr(model, k).grad.clone() for k in parameters}
+        for k in parameters:
+            getattr(model, k).grad = None
+
+        subset = GaussianModelSubset(model, torch.nonzero(visibility_filter).squeeze(-1))
+        render(subset).sum().backward()
+        for k in parameters:
+            self.assertTrue(torch.allclose(getattr(model, k).grad, expected[k]), k)
+
+        # scatter the renderer outputs back
+        n_visible = subset.indices.shape[0]
+        viewspace_points = torch.zeros((n_visible, 2), requires_grad=True)
+        viewspace_points.grad = torch.ones((n_visible, 2))
+        full_viewspace_points, full_visibility_filter, full_radii = subset.scatter_outputs(
+            viewspace_points,
+            torch.ones((n_visible,), dtype=torch.bool),
+            torch.full((n_visible,), 3, dtype=torch.int),
+        )
+        self.assertTrue(torch.equal(full_visibility_filter, visibility_filter))
+        self.assertTrue(torch.equal(full_viewspace_points.grad[:, 0], visibility_filter.to(torch.float)))
+        self.assertTrue(torch.equal(full_radii, visibility_filter.to(torch.int) * 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
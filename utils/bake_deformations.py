@@ -0,0 +1,99 @@
+import add_pypath
+import os
+import time
+import argparse
+import torch
+from internal.utils.gaussian_model_loader import GaussianModelLoader
+from internal.utils.deformation_baking import BakedDeformation, get_baking_errors
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_path", type=str,
+                        help="the training output directory, a checkpoint, or the ply of the vanilla implementations")
+    parser.add_argument("--output", "-o", type=str, required=True)
+    parser.add_argument("--n_keyframes", "-k", type=int, default=60)
+    parser.add_argument("--t_min", type=float, default=0.)
+    parser.add_argument("--t_max", type=float, default=1.)
+    parser.add_argument("--mode", type=str, default="float16", choices=["float16", "low_rank"])
+    parser.add_argument("--rank", type=int, default=16,
+                        help="the number of the temporal bases of the low_rank mode")
+    parser.add_argument("--n_eval_times", type=int, default=-1,
+                        help="the number of the random time values the errors are evaluated at, default: the midpoints between the keyframes")
+    parser.add_argument("--vanilla_deformable", action="store_true", default=False)
+    parser.add_argument("--vanilla_gs4d", action="store_true", default=False)
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--device", type=str, default="cuda")
+    return parser.parse_args()
+
+
+def load_model_and_renderer(args, device):
+    """
+    The same as the viewer, so that the Gaussians are in the same order
+    """
+
+    load_from = GaussianModelLoader.search_load_file(args.model_path)
+    if load_from.endswith(".ckpt"):
+        model, renderer, _ = GaussianModelLoader.initialize_simplified_model_from_checkpoint(load_from, device=device)
+        return model, renderer
+
+    model_dir = os.path.dirname(os.path.dirname(os.path.dirname(load_from)))
+    load_iteration = int(os.path.basename(os.path.dirname(load_from)).replace("iteration_", ""))
+    if args.vanilla_deformable is True:
+        from internal.renderers.vanilla_deformable_renderer import VanillaDeformableRenderer
+        model, _ = GaussianModelLoader.initialize_simplified_model_from_point_cloud(load_from, args.sh_degree, device)
+        return model, VanillaDeformableRenderer(model_dir, load_iteration, device=device)
+    if args.vanilla_gs4d is True:
+        from internal.models.gaussian_model import GaussianModel
+        from internal.renderers.vanilla_gs4d_renderer import VanillaGS4DRenderer
+        model = GaussianModel(sh_degree=args.sh_degree)
+        model.load_ply(load_from, device=device)
+        return model, VanillaGS4DRenderer(model_dir, load_iteration, device=device)
+    raise ValueError("specify `--vanilla_deformable` or `--vanilla_gs4d` for the ply file")
+
+
+def main():
+    args = parse_args()
+    assert os.path.exists(args.output) is False, "File exists at output path"
+    device = torch.device(args.device)
+
+    model, renderer = load_model_and_renderer(args, device)
+    assert hasattr(renderer, "get_deformation") is True, "{} is not a deformable renderer".format(renderer.__class__.__name__)
+    print("{} Gaussians loaded, renderer: {}".format(model.get_xyz.shape[0], renderer.__class__.__name__))
+
+    @torch.no_grad()
+    def deform_fn(t: float):
+        return renderer.get_deformation(model, torch.tensor([t], dtype=torch.float, device=device))
+
+    started_at = time.time()
+    baked = BakedDeformation.bake(deform_fn, args.n_keyframes, t_min=args.t_min, t_max=args.t_max, mode=args.mode, rank=args.rank)
+    baked.to(device)
+    print("{} keyframes baked in {:.2f}s, {:.2f}MB".format(args.n_keyframes, time.time() - started_at, baked.get_n_bytes() / 1024 / 1024))
+
+    # evaluate
+    if args.n_eval_times > 0:
+        eval_times = (torch.rand((args.n_eval_times,), generator=torch.Generator().manual_seed(42)) * (args.t_max - args.t_min) + args.t_min).tolist()
+    else:
+        # the farthest ones from the keyframes
+        eval_times = ((torch.arange(args.n_keyframes - 1) + 0.5) / (args.n_keyframes - 1) * (args.t_max - args.t_min) + args.t_min).tolist()
+    for idx, (rms, max_error) in enumerate(get_baking_errors(baked, deform_fn, eval_times)):
+        print("output #{}: RMS error {:.6f}, max error {:.6f}".format(idx, rms, max_error))
+
+    # compare the time of querying the network and interpolating
+    for name, fn in [("network", deform_fn), ("baked", baked)]:
+        fn(eval_times[0])
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        started_at = time.time()
+        for t in eval_times:
+            fn(t)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        print("{}: {:.3f}ms/frame".format(name, 1000 * (time.time() - started_at) / len(eval_times)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    baked.save(args.output)
+    print("saved to {}".format(args.output))
+
+
+main()
@@ -0,0 +1,43 @@
+import add_pypath
+import os
+import argparse
+import torch
+from internal.utils.gaussian_utils import Gaussian
+from internal.utils.partitioning import load_partitions, merge_partitions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("partitions", type=str, help="the `partitions.json` created by `partition_colmap.py`")
+    parser.add_argument("--models", "-m", type=str, nargs="+", required=True,
+                        help="the checkpoint or ply files of the partitions, in the same order as the `partitions.json`")
+    parser.add_argument("--output", "-o", type=str, required=True)
+    return parser.parse_args()
+
+
+def load_gaussian(path: str) -> Gaussian:
+    if path.endswith(".ply"):
+        return Gaussian.load_from_ply(path)
+    ckpt = torch.load(path, map_location="cpu")
+    return Gaussian.load_from_state_dict(ckpt["hyper_parameters"]["gaussian"].sh_degree, ckpt["state_dict"]).to_ply_format()
+
+
+def main():
+    args = parse_args()
+    assert os.path.exists(args.output) is False, "File exists at output path"
+
+    axes, partitions = load_partitions(args.partitions)
+    assert len(args.models) == len(partitions), "{} models provided, but there are {} partitions".format(len(args.models), len(partitions))
+
+    gaussians = []
+    for path, partition in zip(args.models, partitions):
+        gaussian = load_gaussian(path)
+        gaussians.append(gaussian)
+        print("{}: {} Gaussians loaded from {}".format(partition["name"], gaussian.xyz.shape[0], path))
+
+    merged = merge_partitions(gaussians, axes, [i["core_bounds"] for i in partitions])
+    merged.save_to_ply(args.output)
+    print("{} Gaussians saved to {}".format(merged.xyz.shape[0], args.output))
+
+
+main()
@@ -0,0 +1,82 @@
+"""
+Split a COLMAP scene into spatial partitions, every one of them can be trained as an independent job:
+
+    python utils/partition_colmap.py data/city --grid 2 2 -o data/city/partitions
+    # train every partition, on any machine
+    python main.py fit --config ... --data.path data/city/partitions/partition_0_0 --data.params.colmap.image_dir /ABS/PATH/TO/data/city/images ...
+    # merge the trained partitions
+    python utils/merge_partitions.py data/city/partitions/partitions.json --models outputs/city_0_0/checkpoints/....ckpt ... -o city.ply
+
+The partitions must be trained with `reorient` disabled and `scene_scale=1`, so they share the same coordinate system.
+"""
+
+import add_pypath
+import os
+import argparse
+import numpy as np
+import torch
+import internal.utils.colmap as colmap_utils
+from internal.utils.partitioning import plan_partitions, save_partitions, cameras_from_colmap, write_colmap_partition
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=str, help="the COLMAP dataset, contains `sparse`")
+    parser.add_argument("--output", "-o", type=str, required=True)
+    parser.add_argument("--grid", type=int, nargs=2, default=[2, 2],
+                        help="the number of the rows and the columns")
+    parser.add_argument("--margin", type=float, default=0.2,
+                        help="expand the partitions by this ratio of their size")
+    parser.add_argument("--visibility-threshold", type=float, default=0.25,
+                        help="the cameras seeing at least this ratio of the partition are assigned to it")
+    parser.add_argument("--axes", type=int, nargs=2, default=None,
+                        help="the two horizontal axes, default: the two axes the cameras spread most along")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    sparse_dir = os.path.join(args.path, "sparse", "0")
+    if os.path.isdir(sparse_dir) is False:
+        sparse_dir = os.path.join(args.path, "sparse")
+    colmap_cameras = colmap_utils.read_cameras_binary(os.path.join(sparse_dir, "cameras.bin"))
+    colmap_images = colmap_utils.read_images_binary(os.path.join(sparse_dir, "images.bin"))
+    colmap_images = dict(sorted(colmap_images.items(), key=lambda item: item[0]))
+    colmap_points = colmap_utils.read_points3D_binary(os.path.join(sparse_dir, "points3D.bin"))
+
+    cameras = cameras_from_colmap(colmap_cameras, colmap_images)
+    points = torch.tensor(np.stack([i.xyz for i in colmap_points.values()]), dtype=torch.float)
+
+    axes, partitions = plan_partitions(
+        cameras,
+        points,
+        grid=tuple(args.grid),
+        margin=args.margin,
+        visibility_threshold=args.visibility_threshold,
+        axes=None if args.axes is None else tuple(args.axes),
+    )
+
+    os.makedirs(args.output, exist_ok=True)
+    for partition in partitions:
+        write_colmap_partition(os.path.join(args.output, partition.name), partition, colmap_cameras, colmap_images, colmap_points)
+        print("{}: {} images, {} points, core bounds {}".format(
+            partition.name,
+            partition.image_indices.shape[0],
+            partition.point_indices.shape[0],
+            partition.core_bounds.tolist(),
+        ))
+    save_partitions(
+        os.path.join(args.output, "partitions.json"),
+        axes,
+        partitions,
+        image_names=[i.name for i in colmap_images.values()],
+    )
+    print("partitioned on axes {}, saved to {}".format(axes, args.output))
+    print("train with: --data.path {} --data.params.colmap.image_dir {}".format(
+        os.path.join(args.output, "PARTITION_NAME"),
+        os.path.abspath(os.path.join(args.path, "images")),
+    ))
+
+
+main()
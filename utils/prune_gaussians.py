@@ -0,0 +1,134 @@
+import add_pypath
+import os
+import time
+import argparse
+import torch
+from internal.utils.gaussian_utils import Gaussian
+from internal.utils.offline_pruning import load_cameras_json, to_gaussian_model, get_importance_score, get_n_keep, get_keep_mask, \
+    select_gaussians, reduce_sh_degree, get_n_bytes, update_checkpoint
+from internal.utils.sh_distillation import fibonacci_sphere, get_camera_directions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", type=str, help="a checkpoint or ply file")
+    parser.add_argument("--output", "-o", type=str, required=True,
+                        help="the output path, ending with '.ply' or '.ckpt', the latter only available for the checkpoint input")
+    parser.add_argument("--cameras", type=str, default=None,
+                        help="the `cameras.json` of the training output, default: the one in the ancestor directories of the input")
+    parser.add_argument("--score", type=str, default="volume", choices=["opacity", "volume", "visibility"])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--n", type=int, default=-1,
+                       help="the number of the Gaussians to keep")
+    group.add_argument("--percent", type=float, default=-1,
+                       help="the percent of the Gaussians to prune, in [0, 1]")
+    parser.add_argument("--sh_degree", type=int, default=-1,
+                        help="distill the SH to this degree, or the minimum degree with `--sh_max_error`")
+    parser.add_argument("--sh_max_error", type=float, default=-1,
+                        help="every Gaussian keeps the lowest degree whose RMS color error is not larger than this, e.g. 0.01")
+    parser.add_argument("--sh_directions", type=str, default="sphere", choices=["sphere", "cameras"],
+                        help="fit the colors on the directions uniformly distributed on the sphere, or the ones from the cameras")
+    parser.add_argument("--n_sh_directions", type=int, default=256)
+    parser.add_argument("--v_pow", type=float, default=0.1)
+    parser.add_argument("--anti_aliased", action="store_true", default=False,
+                        help="the model is trained with the anti aliased renderer, detected automatically for the checkpoint input")
+    parser.add_argument("--camera_subsample_ratio", type=float, default=1.)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu",
+                        help="the pure PyTorch hit counting is used on CPU, much slower than the gsplat one")
+    return parser.parse_args()
+
+
+def find_cameras_json(path: str, max_depth: int = 4):
+    directory = os.path.dirname(os.path.abspath(path))
+    for _ in range(max_depth):
+        cameras_json_path = os.path.join(directory, "cameras.json")
+        if os.path.exists(cameras_json_path):
+            return cameras_json_path
+        directory = os.path.dirname(directory)
+    return None
+
+
+def main():
+    args = parse_args()
+    assert os.path.exists(args.output) is False, "File exists at output path"
+    assert os.path.splitext(args.output)[1] in [".ply", ".ckpt"], "the output should be a '.ply' or '.ckpt' file"
+
+    started_at = time.time()
+
+    # load
+    checkpoint = None
+    if args.input.endswith(".ply"):
+        assert args.output.endswith(".ply") is True, "a ply can only be saved as a ply"
+        gaussian = Gaussian.load_from_ply(args.input).to_parameter_structure()
+    else:
+        checkpoint = torch.load(args.input, map_location="cpu")
+        gaussian = Gaussian.load_from_state_dict(checkpoint["hyper_parameters"]["gaussian"].sh_degree, checkpoint["state_dict"])
+        args.anti_aliased = args.anti_aliased or getattr(checkpoint["hyper_parameters"].get("renderer", None), "anti_aliased", False) is True
+    n_input = gaussian.xyz.shape[0]
+    n_bytes_input = get_n_bytes(gaussian)
+    print("{} Gaussians loaded from {}".format(n_input, args.input))
+
+    cameras = None
+    if args.score != "opacity" or (args.sh_degree >= 0 and args.sh_directions == "cameras"):
+        if args.cameras is None:
+            args.cameras = find_cameras_json(args.input)
+            assert args.cameras is not None, "`cameras.json` not found, specify it via `--cameras`"
+        cameras = load_cameras_json(args.cameras)
+        print("{} cameras loaded from {}".format(len(cameras), args.cameras))
+
+    # score and prune
+    pruning_started_at = time.time()
+    score = get_importance_score(
+        to_gaussian_model(gaussian, args.device),
+        cameras,
+        args.score,
+        anti_aliased=args.anti_aliased,
+        v_pow=args.v_pow,
+        subsample_ratio=args.camera_subsample_ratio,
+    )
+    mask = get_keep_mask(score, get_n_keep(n_input, target_count=args.n, prune_percent=args.percent)).cpu()
+    gaussian = select_gaussians(gaussian, mask)
+    pruning_time = time.time() - pruning_started_at
+
+    # distill SH
+    distillation_time = 0.
+    if args.sh_degree >= 0:
+        distillation_started_at = time.time()
+        if args.sh_directions == "cameras":
+            camera_centers = cameras.camera_center
+            if camera_centers.shape[0] > args.n_sh_directions:
+                camera_centers = camera_centers[torch.randperm(camera_centers.shape[0], generator=torch.Generator().manual_seed(42))[:args.n_sh_directions]]
+            directions = get_camera_directions(gaussian.xyz, camera_centers)
+        else:
+            directions = fibonacci_sphere(args.n_sh_directions)
+        gaussian = reduce_sh_degree(gaussian, args.sh_degree, directions=directions, max_error=args.sh_max_error)
+        if gaussian.adaptive_sh_degrees is not None:
+            print("SH degrees: {}".format(", ".join([
+                "{}={}".format(i, (gaussian.adaptive_sh_degrees == i).sum().item()) for i in range(gaussian.sh_degrees + 1)
+            ])))
+        distillation_time = time.time() - distillation_started_at
+
+    # save
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    if args.output.endswith(".ply"):
+        gaussian.to_ply_format().save_to_ply(args.output)
+    else:
+        torch.save(update_checkpoint(checkpoint, gaussian, mask), args.output)
+
+    n_output = gaussian.xyz.shape[0]
+    n_bytes_output = get_n_bytes(gaussian)
+    print("{} Gaussians saved to {}".format(n_output, args.output))
+    print("Gaussians: {} -> {} ({:.1f}%), parameters: {:.2f}MB -> {:.2f}MB ({:.1f}%), file: {:.2f}MB -> {:.2f}MB".format(
+        n_input,
+        n_output,
+        100. * n_output / max(n_input, 1),
+        n_bytes_input / 1024 / 1024,
+        n_bytes_output / 1024 / 1024,
+        100. * n_bytes_output / max(n_bytes_input, 1),
+        os.path.getsize(args.input) / 1024 / 1024,
+        os.path.getsize(args.output) / 1024 / 1024,
+    ))
+    print("scoring and pruning: {:.2f}s, SH distillation: {:.2f}s, total: {:.2f}s".format(pruning_time, distillation_time, time.time() - started_at))
+
+
+main()
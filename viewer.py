@@ -14,7 +14,7 @@ import torch
 from internal.renderers import VanillaRenderer
 from internal.utils.gaussian_model_loader import GaussianModelLoader
 from internal.models.simplified_gaussian_model_manager import SimplifiedGaussianModelManager
-from internal.viewer import ClientThread, ViewerRenderer
+from internal.viewer import ClientThread, ViewerRenderer, RenderScheduler, MultiProcessViewerRenderer
 from internal.viewer.ui import populate_render_tab, TransformPanel, EditPanel
 from internal.viewer.ui.up_direction_folder import UpDirectionFolder
 
@@ -36,15 +36,34 @@ class Viewer:
             cameras_json: str = None,
             vanilla_deformable: bool = False,
             vanilla_gs4d: bool = False,
+            baked_deformation: str = None,
             up: list[float] = None,
             default_camera_position: List[float] = None,
             default_camera_look_at: List[float] = None,
             no_edit_panel: bool = False,
             no_render_panel: bool = False,
             gsplat: bool = False,
+            render_workers: int = 0,
+            render_devices: List[str] = None,
     ):
         self.device = torch.device("cuda")
 
+        self.render_workers = render_workers
+        if render_workers > 0:
+            # the models are loaded into the shared memory, rendered by the worker processes
+            self.device = torch.device("cpu")
+            if render_devices is None:
+                render_devices = ["cuda:{}".format(i) for i in range(torch.cuda.device_count())]
+                if len(render_devices) == 0:
+                    print("[WARNING] CUDA is not available, the render workers run on CPU")
+                    render_devices = ["cpu"]
+            self.render_devices = render_devices
+            if enable_transform is True:
+                print("[WARNING] model transform is not supported by the render workers, disabled")
+                enable_transform = False
+            if vanilla_deformable is True or vanilla_gs4d is True:
+                raise ValueError("render workers only support the models of this implementation")
+
         self.model_paths = model_paths
         self.host = host
         self.port = port
@@ -65,7 +84,7 @@ class Viewer:
 
         self.simplified_model = True
         self.show_edit_panel = True
-        if no_edit_panel is True:
+        if no_edit_panel is True or render_workers > 0:
             self.show_edit_panel = False
         self.show_render_panel = True
         if no_render_panel is True:
@@ -101,6 +120,15 @@ class Viewer:
             self.show_edit_panel = False
             self.show_render_panel = False
 
+        # play back the baked deformations instead of querying the deformation network
+        if baked_deformation is not None:
+            assert len(model_paths) == 1, "the baked deformations only support a single model"
+            from internal.renderers.baked_deformation_renderer import BakedDeformationRenderer
+            from internal.utils.deformation_baking import BakedDeformation
+            renderer = BakedDeformationRenderer(renderer, BakedDeformation.load(baked_deformation, device=self.device))
+            # the deformations are baked for every Gaussian, can not be edited
+            self.show_edit_panel = False
+
         # reorient the scene
         cameras_json_path = cameras_json
         if cameras_json_path is None:
@@ -154,11 +182,20 @@ class Viewer:
 
         self.gaussian_model = model
         # create renderer
-        self.viewer_renderer = ViewerRenderer(
-            model,
-            renderer,
-            torch.tensor(background_color, dtype=torch.float, device=self.device),
-        )
+        if render_workers > 0:
+            self.viewer_renderer = MultiProcessViewerRenderer(
+                model,
+                renderer,
+                torch.tensor(background_color, dtype=torch.float),
+                n_workers=render_workers,
+                devices=self.render_devices,
+            )
+        else:
+            self.viewer_renderer = ViewerRenderer(
+                model,
+                renderer,
+                torch.tensor(background_color, dtype=torch.float, device=self.device),
+            )
 
         self.clients = {}
 
@@ -366,6 +403,24 @@ class Viewer:
                     step=1,
                     initial_value=60,
                 )
+                self.progressive_refinement = server.add_gui_checkbox(
+                    "Progressive Refinement",
+                    initial_value=True,
+                    hint="Refine from 'Max Res when Moving' to 'Max Res' gradually when the camera stops",
+                )
+                self.adaptive_quality = server.add_gui_checkbox(
+                    "Adaptive Quality",
+                    initial_value=True,
+                    hint="Lower the resolution and JPEG quality when moving to meet the target frame time",
+                )
+                self.adaptive_quality.on_update(self._handle_adaptive_quality_updated)
+                self.target_frame_time = server.add_gui_slider(
+                    "Target Frame Time (ms)",
+                    min=10,
+                    max=500,
+                    step=5,
+                    initial_value=50,
+                )
 
             with server.add_gui_folder("Model"):
                 self.scaling_modifier = server.add_gui_slider(
@@ -476,6 +531,10 @@ class Viewer:
                     sh_degree=self.sh_degree,
                 )
 
+        # all the clients share a single render scheduler
+        self.render_scheduler = self.create_render_scheduler()
+        self.render_scheduler.start()
+
         # register hooks
         server.on_client_connect(self._handle_new_client)
         server.on_client_disconnect(self._handle_client_disconnect)
@@ -484,6 +543,16 @@ class Viewer:
             while True:
                 time.sleep(999)
 
+    def create_render_scheduler(self) -> RenderScheduler:
+        if self.render_workers > 0:
+            # dispatch the requests of a batch to the render workers concurrently
+            return RenderScheduler(
+                self.viewer_renderer,
+                max_batch_size=max(4, self.render_workers),
+                max_concurrency=self.render_workers,
+            )
+        return RenderScheduler(self.viewer_renderer)
+
     def _handle_appearance_embedding_slider_updated(self, event: viser.GuiEvent):
         """
         Change appearance group dropdown to "@Direct" on slider updated
@@ -535,6 +604,11 @@ class Viewer:
         """
         return self.rerender_for_all_client()
 
+    def _handle_adaptive_quality_updated(self, _):
+        for i in list(self.clients.values()):
+            i.quality_controller.reset()
+        return self.rerender_for_all_client()
+
     def handle_option_updated(self, _):
         return self._handle_option_updated(_)
 
@@ -543,9 +617,8 @@ class Viewer:
         Render for specific client
         """
         try:
-            # switch to low resolution mode first, then notify the client to render
-            self.clients[client_id].state = "low"
-            self.clients[client_id].render_trigger.set()
+            # render in low resolution mode first, the scheduler will switch to high resolution later
+            self.clients[client_id].request_render()
         except:
             # ignore errors
             pass
@@ -599,6 +672,8 @@ if __name__ == "__main__":
     parser.add_argument("--cameras-json", "--cameras_json", type=str, default=None)
     parser.add_argument("--vanilla_deformable", action="store_true", default=False)
     parser.add_argument("--vanilla_gs4d", action="store_true", default=False)
+    parser.add_argument("--baked_deformation", type=str, default=None,
+                        help="Play back the deformations baked by `utils/bake_deformations.py`")
     parser.add_argument("--up", nargs=3, required=False, type=float, default=None)
     parser.add_argument("--default_camera_position", "--dcp", nargs=3, required=False, type=float, default=None)
     parser.add_argument("--default_camera_look_at", "--dcla", nargs=3, required=False, type=float, default=None)
@@ -606,6 +681,10 @@ if __name__ == "__main__":
     parser.add_argument("--no_render_panel", action="store_true", default=False)
     parser.add_argument("--gsplat", action="store_true", default=False,
                         help="Use GSPlat renderer for ply file")
+    parser.add_argument("--render_workers", "--render-workers", type=int, default=0,
+                        help="Render in this number of worker processes, the edit panel and model transform are not available")
+    parser.add_argument("--render_devices", "--render-devices", type=str, nargs="+", default=None,
+                        help="The devices of the render workers, assigned in round-robin order, default: all the CUDA devices, or CPU if there is none")
     parser.add_argument("--float32_matmul_precision", "--fp", type=str, default=None)
     args = parser.parse_args()
 